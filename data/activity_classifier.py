@@ -1,8 +1,7 @@
 """
 活动分类器 - 用于对应用程序活动进行分类和统计
 """
-import sqlite3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from datetime import datetime
 
 import pickle
@@ -12,14 +11,34 @@ import sys
 
 import fasttext
 
+from .connection_manager import ConnectionManager, get_connection_manager
+from .database_utils import day_bounds
+from .query_cache import QUERY_CACHE_SIZE, QueryCache, cached_query
+from .keyword_matcher import KeywordMatcher
+from .classification_cache import CLASSIFICATION_CACHE_SIZE, ClassificationCache, classifier_version
+from .session_categories import CategoryWorker, category_usage, top_apps_by_category
+
 class ActivityClassifier:
     """
     活动分类器
     将用户活动按类别进行分类（工作、学习、娱乐等）并统计时间占比
     """
     
-    def __init__(self, db_path: str = "activity.db"):
+    def __init__(self, db_path: str = "activity.db",
+                 connections: Optional[ConnectionManager] = None,
+                 cache_size: int = QUERY_CACHE_SIZE,
+                 label_cache_size: int = CLASSIFICATION_CACHE_SIZE):
         self.db_path = db_path
+        # 每个线程复用自己的读连接
+        self.connections = connections or get_connection_manager(db_path)
+        # 统计结果缓存（分类需要逐条匹配关键词/调用模型，重复计算代价高）
+        self.cache = QueryCache(self.connections, cache_size) if cache_size else None
+        # 单条 (应用, 标题) 的分类结果缓存，在 compile_keywords 中按分类器版本创建
+        self.label_cache_size = label_cache_size
+        self.label_cache: Optional[ClassificationCache] = None
+        # 给 (应用, 标题) 分类的后台线程，由 start 启动
+        self.category_worker = CategoryWorker(self.connections, lambda pairs: self.classify_pairs(pairs, store=True),
+                                              lambda: self.version)
         
         # 定义分类关键词
         self.categories = {
@@ -152,6 +171,43 @@ class ActivityClassifier:
                 'color': '#95E1D3'
             },
         }
+        self.compile_keywords()
+
+    def compile_keywords(self) -> None:
+        """
+        把 self.categories 中的关键词编译为一个自动机，分类时对文本只扫描一遍
+        修改 self.categories 之后需要重新调用
+        """
+        groups = [(category, config['keywords']) for category, config in self.categories.items()]
+        self._keyword_matcher = KeywordMatcher(groups)
+
+        # 关键词或模型变化后分类器版本不同，之前缓存的分类结果和统计结果都不再使用
+        version = classifier_version(groups, _default_model_path())
+        if self.label_cache is None:
+            self.label_cache = ClassificationCache(self.connections, version, self.label_cache_size)
+        else:
+            self.label_cache.set_version(version)
+        if self.cache is not None:
+            self.cache.clear()
+
+    @property
+    def version(self) -> str:
+        """当前分类器版本（关键词表和模型文件内容的哈希）"""
+        return self.label_cache.version
+
+    def start(self) -> CategoryWorker:
+        """
+        启动后台分类：预热分类结果缓存（并清理其他版本的结果），启动分类线程补齐历史数据、跟进新会话
+        构造函数不写数据库，需要后台分类时（例如界面启动后）调用一次
+        """
+        self.label_cache.warm()
+        if not self.category_worker.is_alive():
+            self.category_worker.start()
+        return self.category_worker
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止后台分类线程"""
+        self.category_worker.stop(timeout)
     
     def classify_activity(self, app_name: str, window_title: str) -> str:
         """
@@ -164,40 +220,55 @@ class ActivityClassifier:
         Returns:
             str: 分类标签（'work', 'learning', 'communication', 'entertainment', 'system', 'other'）
         """
-        # 对英文部分转小写，中文保持不变
-        app_name_lower = app_name.lower()
-        window_title_lower = window_title.lower()
-        combined = f"{app_name_lower} {window_title_lower}"
-        
-        # 同时保留原始字符串用于中文匹配
-        combined_original = f"{app_name} {window_title}"
-        
-        print(combined_original)
-        
-        for category, config in self.categories.items():
-            for keyword in config['keywords']:
-                keyword_lower = keyword.lower()
-                
-                # 检查小写匹配（主要用于英文关键词）
-                if keyword_lower in combined:
-                    return category
-                
-                # 检查原始大小写匹配（用于中文关键词）
-                if keyword in combined_original:
-                    return category
-        
-        ml_classify = ml_classify_activity(app_name,window_title)
+        return self.classify_pairs([(app_name, window_title)])[0]
 
-        # TODO: this is a simpler classifier, need improve; for example, the browser and youtube/bilibili
-        if ml_classify == None:
-            return 'other'
-        
-        print (ml_classify)
+    def classify_pairs(self, pairs: Sequence[Tuple[str, str]], store: bool = False) -> List[str]:
+        """
+        批量分类：先查缓存，再匹配关键词，关键词都未命中的组合一次性交给 fastText 模型
         
-        return ml_classify
-    
+        Args:
+            pairs: [(应用名, 窗口标题)]
+            store: 为 True 时（后台分类线程）缓存命中的组合也交给写线程保存——
+                结果按进程/标题 ID 保存，之前分类时这些 ID 可能还不存在
+            
+        Returns:
+            List[str]: 与 pairs 一一对应的分类标签
+        """
+        labels: Dict[Tuple[str, str], str] = {}
+        matched: List[Tuple[str, str, str]] = []
+        misses: List[Tuple[str, str]] = []
+        hits: List[Tuple[str, str]] = []
+        for pair in dict.fromkeys(pairs):
+            category = self.label_cache.get(*pair)
+            if category is None:
+                # 不区分大小写，按分类顺序取第一个有关键词出现的分类
+                category = self._keyword_matcher.match(f"{pair[0]} {pair[1]}")
+                if category is None:
+                    misses.append(pair)
+                    continue
+                matched.append((*pair, category))
+            else:
+                hits.append(pair)
+            labels[pair] = category
+        self.label_cache.put_many(matched)
+        if store:
+            self.label_cache.store(hits)
 
-    
+        if misses:
+            # TODO: this is a simpler classifier, need improve; for example, the browser and youtube/bilibili
+            predicted, fallback = [], []
+            for pair, ml_classify in zip(misses, ml_classify_activities(misses)):
+                # 模型缺失或预测失败时的 'other' 带兜底标记保存，同一版本内不再重复分类；
+                # 模型可用后分类器版本变化，重新分类
+                category = ml_classify or 'other'
+                (predicted if ml_classify else fallback).append((*pair, category))
+                labels[pair] = category
+            self.label_cache.put_many(predicted)
+            self.label_cache.put_many(fallback, fallback=True)
+
+        return [labels[pair] for pair in pairs]
+
+    @cached_query()
     def get_classified_statistics(self, start_date: str, end_date: str) -> Dict[str, Any]:
         """
         获取指定日期范围内的分类统计
@@ -209,21 +280,12 @@ class ActivityClassifier:
         Returns:
             Dict: 包含分类统计信息
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 获取所有会话
-            cursor.execute('''
-                SELECT p.name, ws.window_title, ws.duration_seconds
-                FROM window_sessions ws
-                JOIN processes p ON ws.process_id = p.id
-                WHERE DATE(ws.start_time) >= DATE(?) 
-                  AND DATE(ws.start_time) <= DATE(?)
-                  AND ws.end_time IS NOT NULL
-                ORDER BY ws.start_time
-            ''', (start_date, end_date))
-            
-            sessions = cursor.fetchall()
+        # 日用量汇总按 (进程, 标题) 关联已保存的分类，在 SQL 中按分类汇总；
+        # 跨越范围边界的会话只计算范围内的部分，会话数只计入开始日期所在的范围。
+        # 还没有分类的组合（通常只有刚结束的会话）交给后台分类线程补齐
+        start_day, end_day = day_bounds(start_date, end_date)
+        self.category_worker.categorize_range(start_day, end_day)
+        usage = category_usage(self.connections.reader(), self.label_cache.version, start_day, end_day)
         
         # 分类和统计
         classified = {}
@@ -245,13 +307,13 @@ class ActivityClassifier:
             'color': '#999999'
         }
         
-        # 统计各类别
+        # 统计各类别（模型可能给出关键词表之外的分类）
         total_seconds = 0
-        for app_name, window_title, duration_seconds in sessions:
-            category = self.classify_activity(app_name, window_title)
-            classified[category]['seconds'] += duration_seconds  # 直接累加秒数
-            classified[category]['session_count'] += 1
-            total_seconds += duration_seconds
+        for category, seconds, count in usage:
+            stats = classified.setdefault(category, dict(classified['other'], seconds=0, session_count=0))
+            stats['seconds'] += seconds  # 直接累加秒数
+            stats['session_count'] += count
+            total_seconds += seconds
         
         # 计算小时和百分比
         if total_seconds > 0:
@@ -287,35 +349,37 @@ class ActivityClassifier:
         Returns:
             List: 应用列表，按时长降序排列
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT p.name, ws.window_title, 
-                       SUM(ws.duration_seconds) as total_seconds,
-                       COUNT(*) as session_count
-                FROM window_sessions ws
-                JOIN processes p ON ws.process_id = p.id
-                WHERE DATE(ws.start_time) >= DATE(?) 
-                  AND DATE(ws.start_time) <= DATE(?)
-                GROUP BY p.name, ws.window_title
-                ORDER BY total_seconds DESC
-                LIMIT ?
-            ''', (start_date, end_date, limit))
-            
-            apps = []
-            for app_name, window_title, total_seconds, count in cursor.fetchall():
-                # 检查是否属于该分类
-                if self.classify_activity(app_name, window_title) == category:
-                    apps.append({
-                        'app': app_name,
-                        'window': window_title,
-                        'minutes': total_seconds // 60,
-                        'hours': round(total_seconds / 3600, 2),
-                        'session_count': count
-                    })
+        # 同一范围内依次查询各个分类时共用 get_top_apps_all_categories 的缓存，只扫描一次
+        return self.get_top_apps_all_categories(start_date, end_date, limit).get(category, [])
+
+    @cached_query()
+    def get_top_apps_all_categories(self, start_date: str, end_date: str,
+                                    limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        一次获取所有分类中使用最频繁的应用
+        
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            limit: 每个分类返回的结果数量
             
-            return apps[:limit]
+        Returns:
+            Dict: 分类标签 -> 应用列表（格式同 get_top_apps_by_category），没有数据的分类为空列表
+        """
+        start_day, end_day = day_bounds(start_date, end_date)
+        self.category_worker.categorize_range(start_day, end_day)
+        top = top_apps_by_category(self.connections.reader(), self.label_cache.version, start_day, end_day, limit)
+
+        result = {category: [] for category in [*self.categories, 'other']}
+        for category, rows in top.items():
+            result[category] = [{
+                'app': app_name,
+                'window': window_title,
+                'minutes': total_seconds // 60,
+                'hours': round(total_seconds / 3600, 2),
+                'session_count': count
+            } for app_name, window_title, total_seconds, count in rows]
+        return result
     
 
     def get_daily_classification(self, date: str) -> Dict[str, Any]:
@@ -421,6 +485,12 @@ def _get_base_dir():
         return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+def _default_model_path() -> str:
+    """默认的 FastText 模型路径"""
+    # 优先使用压缩版本 (.ftz) 以减小打包大小
+    return os.path.join(_get_base_dir(), "model", "fasttext_model_compressed.ftz")
+
+
 def _load_fasttext_model(model_path: str = None):
     """加载 FastText 模型"""
     # if not HAS_FASTTEXT:
@@ -430,9 +500,7 @@ def _load_fasttext_model(model_path: str = None):
         return _MODEL_CACHE["fasttext_model"]
     
     if model_path is None:
-        base_dir = _get_base_dir()
-        # 优先使用压缩版本 (.ftz) 以减小打包大小
-        model_path = os.path.join(base_dir, "model", "fasttext_model_compressed.ftz")
+        model_path = _default_model_path()
         # if not os.path.exists(model_path):
         #     # 降级到 .bin 版本
         #     model_path = os.path.join(base_dir, "model", "fasttext_model.bin")
@@ -464,15 +532,28 @@ def ml_classify_activity(app_name: str, window_title: str):
     Returns:
         str: 分类标签，如果失败返回 None
     """
+    return ml_classify_activities([(app_name, window_title)])[0]
+
+
+def ml_classify_activities(pairs: Sequence[Tuple[str, str]]) -> List[Optional[str]]:
+    """
+    使用 FastText 模型批量分类，所有文本在一次 predict 调用中完成
+    
+    Args:
+        pairs: [(应用名, 窗口标题)]
+        
+    Returns:
+        List: 与 pairs 一一对应的分类标签，失败时为 None
+    """
     model = _load_fasttext_model()
     if model is None:
-        return None
+        return [None] * len(pairs)
     
     try:
-        text = f"{app_name} | {window_title}"
-        prediction = model.predict(text, k=1)
-        label = prediction[0][0].replace("__label__", "")
-        return label
+        # fastText 的 predict 不接受含换行的文本
+        texts = [f"{app_name} | {window_title}".replace("\n", " ") for app_name, window_title in pairs]
+        predictions, _ = model.predict(texts, k=1)
+        return [labels[0].replace("__label__", "") if labels else None for labels in predictions]
     except Exception as e:
         print(f"⚠️ FastText 预测失败: {e}")
-        return None
\ No newline at end of file
+        return [None] * len(pairs)
\ No newline at end of file
@@ -0,0 +1,439 @@
+"""
+历史会话冷归档 - 把已经结束的月份从 window_sessions 移到按月存放的列式文件中
+
+每个月一个归档，列为 id / process_id / title_id / start_ts / end_ts（按 start_ts 排序）：
+- 安装了 pyarrow 时写成 zstd 压缩的 Parquet 文件（sessions-YYYY-MM-<随机后缀>.parquet），读取时内存映射
+- 否则用 np.savez_compressed 写成压缩的 .npz 文件（sessions-YYYY-MM-<随机后缀>.npz）；
+  压缩的 .npz 不能内存映射，读取时该月的列整个解压到内存中（一个月的会话通常只有几 MB）
+归档记录在 archived_months 表中，与删除明细在同一个写事务中提交；
+归档文件写入后不再修改：重写某个月时写入新文件并在同一个事务中更新 archived_months.path，
+事务回滚时数据库仍指向旧文件，不再被引用的文件由 remove_orphan_files 在提交后删除；
+daily_usage / hourly_usage 汇总保留不变，按日/小时/应用的统计不受影响，
+需要会话明细的查询（时间线、活动列表、列式引擎）由 SessionArchive 把归档与数据库中的会话合并
+
+    python -m data.archive activity.db --before 2026-01
+"""
+import argparse
+import heapq
+import os
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - 取决于运行环境
+    np = None
+    HAS_NUMPY = False
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:  # pragma: no cover - 取决于运行环境
+    pyarrow = pq = None
+    HAS_PYARROW = False
+
+from .database_utils import (DAY_FORMAT, SESSION_BATCH_SIZE, TIME_FORMAT, SessionRecord, local_day,
+                             subtract_usage_rows, to_epoch)
+
+# 归档文件中的列，按此顺序写入
+ARCHIVE_COLUMNS = ('id', 'process_id', 'title_id', 'start_ts', 'end_ts')
+# 默认的归档目录（相对数据库文件所在目录）
+ARCHIVE_DIR = 'archive'
+# 归档文件名的前缀，remove_orphan_files 只清理带这个前缀的条目
+ARCHIVE_PREFIX = 'sessions-'
+
+
+def archive_directory(db_path: str, directory: Optional[str] = None) -> str:
+    """归档目录的绝对路径，默认在数据库文件旁边的 archive/"""
+    base = os.path.dirname(os.path.abspath(db_path))
+    return os.path.join(base, directory or ARCHIVE_DIR)
+
+
+def _next_month(month: str) -> str:
+    year, mon = map(int, month.split('-'))
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+def write_month(directory: str, month: str, arrays: Dict[str, "np.ndarray"]) -> str:
+    """
+    把一个月的列写入归档目录中的新文件，返回它的名称
+    每次都使用新的名称，不覆盖已登记的归档；先写到临时名称再重命名，中途失败不会留下半个归档
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = f"{ARCHIVE_PREFIX}{month}-{uuid.uuid4().hex[:8]}"
+    if HAS_PYARROW:
+        name = stem + '.parquet'
+        tmp = os.path.join(directory, name + '.tmp')
+        table = pyarrow.table({column: arrays[column] for column in ARCHIVE_COLUMNS})
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, os.path.join(directory, name))
+        return name
+
+    name = stem + '.npz'
+    tmp = os.path.join(directory, name + '.tmp')
+    # 传入文件对象，np.savez_compressed 不会给临时文件名追加 .npz
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **{column: arrays[column] for column in ARCHIVE_COLUMNS})
+    os.replace(tmp, os.path.join(directory, name))
+    return name
+
+
+def read_month(path: str) -> Dict[str, "np.ndarray"]:
+    """读取一个月的归档：Parquet 文件内存映射读取，.npz 文件解压到内存"""
+    if path.endswith('.parquet'):
+        if not HAS_PYARROW:
+            raise ImportError(f"读取 {path} 需要 pyarrow")
+        table = pq.read_table(path, memory_map=True)
+        return {column: table.column(column).to_numpy() for column in ARCHIVE_COLUMNS}
+    with np.load(path) as npz:
+        return {column: npz[column] for column in ARCHIVE_COLUMNS}
+
+
+def _db_dir(conn: sqlite3.Connection) -> str:
+    """连接所打开的数据库文件所在的目录（归档路径相对于它保存）"""
+    return os.path.dirname(os.path.abspath(conn.execute("PRAGMA database_list").fetchone()[2]))
+
+
+def archived_rollup_rows(conn: sqlite3.Connection, start_ts: Optional[int] = None,
+                         end_ts: Optional[int] = None) -> Iterator[Tuple[str, int, int, int, int]]:
+    """
+    重建汇总时使用：归档中与范围重叠的会话 (day, process_id, title_id, start_ts, end_ts)，
+    与 rebuild_usage_rollups 读取 window_sessions 的条件相同（end_ts >= 起点，start_ts < 终点）
+    """
+    try:
+        paths = [row[0] for row in conn.execute("SELECT path FROM archived_months ORDER BY month")]
+    except sqlite3.OperationalError:
+        # 迁移到有归档表之前调用（例如 v7 迁移中重建汇总）
+        return
+    if paths and not HAS_NUMPY:
+        raise ImportError("数据库中有归档，重建汇总需要 numpy")
+
+    db_dir = _db_dir(conn)
+    for path in paths:
+        arrays = read_month(os.path.join(db_dir, path))
+        mask = np.ones(len(arrays['start_ts']), dtype=bool)
+        if start_ts is not None:
+            mask &= arrays['end_ts'] >= start_ts
+        if end_ts is not None:
+            mask &= arrays['start_ts'] < end_ts
+        for start, end, process_id, title_id in zip(arrays['start_ts'][mask].tolist(), arrays['end_ts'][mask].tolist(),
+                                                    arrays['process_id'][mask].tolist(),
+                                                    arrays['title_id'][mask].tolist()):
+            yield local_day(datetime.fromtimestamp(start)), process_id, title_id, start, end
+
+
+def _register_month(conn: sqlite3.Connection, month: str, directory: str, data: "np.ndarray") -> None:
+    """把 (n, 5) 的会话数组写成该月的新归档文件，并在当前事务中登记（替换该月原有的登记）"""
+    arrays = {column: np.ascontiguousarray(data[:, i]) for i, column in enumerate(ARCHIVE_COLUMNS)}
+    arrays['process_id'] = arrays['process_id'].astype(np.int32)
+    arrays['title_id'] = arrays['title_id'].astype(np.int32)
+    name = write_month(directory, month, arrays)
+    db_dir = _db_dir(conn)
+    try:
+        path = os.path.relpath(os.path.join(directory, name), db_dir)
+    except ValueError:
+        # Windows 上归档目录与数据库不在同一个盘符
+        path = os.path.join(directory, name)
+
+    conn.execute('''
+        INSERT OR REPLACE INTO archived_months (month, path, session_count, min_start_ts, max_end_ts)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (month, path, len(data), int(data[:, 3].min()), int(data[:, 4].max())))
+
+
+def archive_month(conn: sqlite3.Connection, month: str, directory: str) -> int:
+    """
+    写线程中执行：把 month（'YYYY-MM'）内开始的已结束会话移入归档，返回归档的会话数
+    该月已有归档时与原有内容合并后写成新文件；汇总表保持不变
+    """
+    if not HAS_NUMPY:
+        raise ImportError("归档需要 numpy")
+    start_day, end_day = f"{month}-01", f"{_next_month(month)}-01"
+    rows = conn.execute('''
+        SELECT id, process_id, title_id, start_ts, end_ts
+        FROM window_sessions
+        WHERE day >= ?
+          AND day < ?
+          AND end_ts IS NOT NULL
+        ORDER BY start_ts
+    ''', (start_day, end_day)).fetchall()
+    if not rows:
+        return 0
+
+    data = np.array(rows, dtype=np.int64)
+    db_dir = _db_dir(conn)
+    existing = conn.execute("SELECT path FROM archived_months WHERE month = ?", (month,)).fetchone()
+    if existing is not None:
+        old = read_month(os.path.join(db_dir, existing[0]))
+        data = np.concatenate([np.column_stack([old[column] for column in ARCHIVE_COLUMNS]), data])
+        data = data[np.argsort(data[:, 3], kind='stable')]
+
+    _register_month(conn, month, directory, data)
+    # 只删除明细，汇总表保留
+    conn.executemany('DELETE FROM window_sessions WHERE id = ?', [(row[0],) for row in rows])
+    return len(rows)
+
+
+def archived_months_between(conn: sqlite3.Connection, start_day: str, end_day: str) -> List[Tuple[str, str]]:
+    """会话开始日期可能落在半开区间 [start_day, end_day) 内的归档月份 [(month, 绝对路径)]"""
+    try:
+        rows = conn.execute('''
+            SELECT month, path
+            FROM archived_months
+            WHERE month >= ?
+              AND month <= ?
+            ORDER BY month
+        ''', (start_day[:7], end_day[:7])).fetchall()
+    except sqlite3.OperationalError:
+        # 尚未迁移的数据库没有归档表
+        return []
+    db_dir = _db_dir(conn)
+    return [(month, os.path.join(db_dir, path)) for month, path in rows]
+
+
+def delete_archived_days(conn: sqlite3.Connection, month: str, start_day: str, end_day: str) -> int:
+    """
+    写线程中执行：从 month 的归档中删除开始日期在 [start_day, end_day) 内的会话
+    （与 delete_sessions_chunk 的口径相同），并从日/小时汇总中扣除它们
+    还有剩余会话时写成新文件并更新登记，删空时取消登记；旧文件提交后由 remove_orphan_files 删除
+
+    Returns:
+        int: 删除的会话数
+    """
+    row = conn.execute("SELECT path FROM archived_months WHERE month = ?", (month,)).fetchone()
+    if row is None:
+        return 0
+    path = os.path.join(_db_dir(conn), row[0])
+    arrays = read_month(path)
+    starts = np.asarray(arrays['start_ts'])
+    mask = ((starts >= to_epoch(datetime.strptime(start_day, DAY_FORMAT)))
+            & (starts < to_epoch(datetime.strptime(end_day, DAY_FORMAT))))
+    count = int(mask.sum())
+    if not count:
+        return 0
+
+    subtract_usage_rows(conn.cursor(), (
+        (local_day(datetime.fromtimestamp(start)), process_id, title_id, start, end)
+        for start, end, process_id, title_id in zip(starts[mask].tolist(), arrays['end_ts'][mask].tolist(),
+                                                    arrays['process_id'][mask].tolist(),
+                                                    arrays['title_id'][mask].tolist())))
+    if count == len(starts):
+        conn.execute("DELETE FROM archived_months WHERE month = ?", (month,))
+    else:
+        data = np.column_stack([np.asarray(arrays[column])[~mask] for column in ARCHIVE_COLUMNS]).astype(np.int64)
+        _register_month(conn, month, os.path.dirname(path), data)
+    return count
+
+
+def remove_orphan_files(conn: sqlite3.Connection, directories: Sequence[str] = (),
+                        committed: Optional[sqlite3.Connection] = None) -> int:
+    """
+    写线程中执行：删除 directories 及已登记归档所在目录中不再被 archived_months 引用的归档文件
+    （被重写或删空的月份的旧文件、提交失败或中途崩溃留下的新文件/临时文件）
+    在写事务中执行，其他进程此时不会有写到一半的归档；删除失败（例如 Windows 上文件仍被映射）时留到下次
+
+    Args:
+        committed: 读连接；同一事务中排在前面的命令可能还会回滚，它（已提交的状态）引用的文件也保留
+
+    Returns:
+        int: 删除的文件（目录）数
+    """
+    try:
+        paths = [row[0] for row in conn.execute("SELECT path FROM archived_months")]
+        if committed is not None:
+            paths += [row[0] for row in committed.execute("SELECT path FROM archived_months")]
+    except sqlite3.OperationalError:
+        return 0
+    db_dir = _db_dir(conn)
+    referenced = {os.path.normcase(os.path.abspath(os.path.join(db_dir, path))) for path in paths}
+    removed = 0
+    for directory in set(directories) | {os.path.dirname(path) for path in referenced}:
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.startswith(ARCHIVE_PREFIX) or os.path.normcase(os.path.abspath(path)) in referenced:
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"⚠️ 删除旧归档 {path} 失败: {e}")
+    return removed
+
+
+def archivable_months(conn: sqlite3.Connection, before_month: str) -> List[str]:
+    """before_month（'YYYY-MM'，不含）之前还有会话明细的月份"""
+    cursor = conn.execute('''
+        SELECT DISTINCT substr(day, 1, 7)
+        FROM window_sessions
+        WHERE day < ?
+          AND end_ts IS NOT NULL
+        ORDER BY 1
+    ''', (f"{before_month}-01",))
+    return [row[0] for row in cursor.fetchall()]
+
+
+class SessionArchive:
+    """按时间范围读取归档中的会话，并与数据库中的会话合并"""
+
+    def __init__(self, connections):
+        """
+        Args:
+            connections: ConnectionManager，用于读取 archived_months 和进程/标题名称
+        """
+        self.connections = connections
+        self.db_dir = os.path.dirname(os.path.abspath(connections.db_path))
+
+    def months(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> List[Tuple[str, str]]:
+        """与 [start_ts, end_ts) 重叠的归档月份 [(month, 绝对路径)]，按月份排序"""
+        if not HAS_NUMPY:
+            return []
+        try:
+            rows = self.connections.reader().execute('''
+                SELECT month, path
+                FROM archived_months
+                WHERE max_end_ts > ?
+                  AND min_start_ts < ?
+                ORDER BY month
+            ''', (start_ts if start_ts is not None else -2 ** 63,
+                  end_ts if end_ts is not None else 2 ** 63 - 1)).fetchall()
+        except sqlite3.OperationalError:
+            # 尚未迁移的数据库没有归档表
+            return []
+        return [(month, os.path.join(self.db_dir, path)) for month, path in rows]
+
+    def _month_slice(self, path: str, start_ts: Optional[int], end_ts: Optional[int]) -> Dict[str, "np.ndarray"]:
+        """一个月的归档中与范围重叠的会话"""
+        arrays = read_month(path)
+        mask = np.ones(len(arrays['start_ts']), dtype=bool)
+        if start_ts is not None:
+            mask &= arrays['end_ts'] > start_ts
+        if end_ts is not None:
+            mask &= arrays['start_ts'] < end_ts
+        return {column: np.asarray(values[mask]) for column, values in arrays.items()}
+
+    def rows(self, start_ts: int, end_ts: int) -> "np.ndarray":
+        """与范围重叠的归档会话，(n, 4) int64 数组：start_ts, end_ts, process_id, title_id（供列式引擎使用）"""
+        chunks = []
+        for _, path in self.months(start_ts, end_ts):
+            part = self._month_slice(path, start_ts, end_ts)
+            chunks.append(np.column_stack([part['start_ts'], part['end_ts'],
+                                           part['process_id'], part['title_id']]).astype(np.int64))
+        return np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.int64)
+
+    def first_last(self, start_ts: int, end_ts: int) -> Tuple[Optional[int], Optional[int]]:
+        """归档中范围内首个会话的开始时间、最后一个会话的结束时间（同 get_summary 的口径）"""
+        first = last = None
+        for _, path in self.months(start_ts, end_ts):
+            arrays = read_month(path)
+            starts = arrays['start_ts'][(arrays['start_ts'] >= start_ts) & (arrays['start_ts'] < end_ts)]
+            ends = arrays['end_ts'][(arrays['end_ts'] > start_ts) & (arrays['end_ts'] <= end_ts)]
+            if len(starts):
+                first = int(starts.min()) if first is None else min(first, int(starts.min()))
+            if len(ends):
+                last = int(ends.max()) if last is None else max(last, int(ends.max()))
+        return first, last
+
+    def iter_sessions(self, start_ts: Optional[int], end_ts: Optional[int], columns: Sequence[str],
+                      batch_size: int = SESSION_BATCH_SIZE, newest_first: bool = False) -> Iterator[SessionRecord]:
+        """
+        逐月读取归档中与范围重叠的会话，字段与 database_utils.iter_sessions 相同
+        只在迭代到某个月时才读取该月的归档
+        """
+        months = self.months(start_ts, end_ts)
+        if newest_first:
+            months.reverse()
+        for _, path in months:
+            part = self._month_slice(path, start_ts, end_ts)
+            order = np.arange(len(part['start_ts']))
+            if newest_first:
+                order = order[::-1]
+            for offset in range(0, len(order), batch_size):
+                index = order[offset:offset + batch_size]
+                yield from self._records(part, index, columns)
+
+    def _records(self, part: Dict[str, "np.ndarray"], index: "np.ndarray",
+                 columns: Sequence[str]) -> Iterator[SessionRecord]:
+        """把一批归档行转换为 SessionRecord，进程名/标题按这一批用到的 ID 查询"""
+        starts = part['start_ts'][index].tolist()
+        ends = part['end_ts'][index].tolist()
+        process_ids = part['process_id'][index].tolist()
+        title_ids = part['title_id'][index].tolist()
+        names = self._lookup('processes', 'name', process_ids) if 'process' in columns else {}
+        titles = self._lookup('titles', 'title', title_ids) if 'window_title' in columns else {}
+
+        selected = [self._column(column, part, index, starts, ends, names, titles, process_ids, title_ids)
+                    for column in columns]
+        for row in zip(*selected):
+            yield SessionRecord(columns, row)
+
+    @staticmethod
+    def _column(column: str, part, index, starts, ends, names, titles, process_ids, title_ids) -> List[Any]:
+        """一批归档行中某一列的值"""
+        if column == 'id':
+            return part['id'][index].tolist()
+        if column == 'process':
+            return [names.get(i) for i in process_ids]
+        if column == 'window_title':
+            return [titles.get(i) for i in title_ids]
+        if column == 'start_ts':
+            return starts
+        if column == 'end_ts':
+            return ends
+        if column == 'duration_seconds':
+            return [end - start for start, end in zip(starts, ends)]
+        if column == 'start_time':
+            return [datetime.fromtimestamp(ts).strftime(TIME_FORMAT) for ts in starts]
+        if column == 'end_time':
+            return [datetime.fromtimestamp(ts).strftime(TIME_FORMAT) for ts in ends]
+        return [local_day(datetime.fromtimestamp(ts)) for ts in starts]  # day
+
+    def _lookup(self, table: str, column: str, ids: List[int]) -> Dict[int, str]:
+        """按 ID 批量查询名称（每次最多 500 个参数）"""
+        unique = sorted(set(ids))
+        result: Dict[int, str] = {}
+        conn = self.connections.reader()
+        for offset in range(0, len(unique), 500):
+            chunk = unique[offset:offset + 500]
+            result.update(conn.execute(
+                f"SELECT id, {column} FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+        return result
+
+    def merge(self, live: Iterator[SessionRecord], start_ts: Optional[int], end_ts: Optional[int],
+              columns: Sequence[str], batch_size: int = SESSION_BATCH_SIZE,
+              newest_first: bool = False) -> Iterator[SessionRecord]:
+        """
+        把数据库中的会话 live（必须包含 start_ts 列）与归档中的会话按开始时间合并
+        范围内没有归档时直接返回 live
+        """
+        if not self.months(start_ts, end_ts):
+            return live
+        archived = self.iter_sessions(start_ts, end_ts, columns, batch_size, newest_first)
+        return heapq.merge(archived, live, key=lambda record: record.start_ts, reverse=newest_first)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="把已经结束的月份的会话明细移入归档文件")
+    parser.add_argument('db_path', nargs='?', default='activity.db')
+    parser.add_argument('--before', help="只归档该月份（'YYYY-MM'）之前的数据，默认为本月之前")
+    parser.add_argument('--dir', help=f"归档目录，默认为数据库旁边的 {ARCHIVE_DIR}/")
+    args = parser.parse_args()
+
+    from .database import ActivityDatabase
+
+    with ActivityDatabase(args.db_path) as db:
+        archived = db.archive_months(args.before, args.dir)
+    print(f"✅ 已归档 {sum(archived.values())} 条会话: {', '.join(archived) or '无'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+分类结果缓存 - ActivityClassifier.classify_activity 的两级缓存
+
+同样的 (应用名, 窗口标题) 会反复出现，关键词未命中时还要调用 fastText 模型。
+- 第一级：进程内有界 LRU（线程安全）
+- 第二级：数据库中的 classification_cache 表，以 (版本, process_id, title_id) 为主键，程序重启后仍然有效；
+  同名的进程（可执行文件路径不同）都保存同一个分类，还没有出现在 processes / titles 中的组合只保存在 LRU 中
+版本是关键词表和模型文件内容的哈希，关键词或模型变化后旧的结果自动失效；
+模型缺失或预测失败时的兜底分类带 fallback 标记保存，同一版本内不再重新分类（后台补齐分类时也跳过）；
+模型变化后版本不同，兜底结果和其他结果一起失效。
+启动后（ActivityClassifier.start）把当前版本的结果预热到 LRU，新结果通过写线程（ConnectionManager.submit）异步写入
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 进程内 LRU 的最大条目数
+CLASSIFICATION_CACHE_SIZE = 8192
+# 计算模型文件哈希时每次读取的字节数
+_HASH_CHUNK_SIZE = 1 << 20
+
+# (绝对路径, 大小, 修改时间) -> 模型文件内容的哈希，文件不变时重新编译关键词不必再读一遍模型
+_model_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def _model_digest(model_path: str) -> str:
+    """模型文件内容的 sha256"""
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    digest = _model_digests.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = _model_digests[key] = sha.hexdigest()
+    return digest
+
+
+def classifier_version(groups: Sequence[Tuple[str, Sequence[str]]], model_path: Optional[str]) -> str:
+    """
+    分类器版本：关键词表（含分类顺序）与模型文件内容的哈希
+    两者任何一个变化，版本都会不同；只与内容有关，模型所在的路径变化
+    （例如 PyInstaller 单文件版每次启动解压到新的临时目录）不影响版本
+    """
+    model = None
+    if model_path is not None and os.path.exists(model_path):
+        model = _model_digest(model_path)
+    payload = json.dumps({'keywords': [[label, list(keywords)] for label, keywords in groups], 'model': model},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _store_labels(conn: sqlite3.Connection, version: str, rows: List[Tuple[str, str, str, bool]]) -> None:
+    """写线程中执行：保存一批 (应用名, 窗口标题, 分类, 是否兜底)，应用名和窗口标题换成 processes / titles 的 ID"""
+    conn.executemany('''
+        INSERT OR REPLACE INTO classification_cache (version, process_id, title_id, category, fallback)
+        SELECT ?, p.id, t.id, ?, ?
+        FROM processes p
+                 JOIN titles t ON t.title = ?
+        WHERE p.name = ?
+    ''', [(version, category, fallback, title, app) for app, title, category, fallback in rows])
+
+
+def _drop_other_versions(conn: sqlite3.Connection, version: str) -> int:
+    """写线程中执行：删除其他版本的分类结果"""
+    return conn.execute("DELETE FROM classification_cache WHERE version != ?", (version,)).rowcount
+
+
+class ClassificationCache:
+    """(应用名, 窗口标题) -> 分类 的两级缓存"""
+
+    def __init__(self, connections, version: str, maxsize: int = CLASSIFICATION_CACHE_SIZE):
+        """
+        Args:
+            connections: ConnectionManager；数据库中没有 classification_cache 表时只使用内存缓存
+            version: 当前分类器版本（classifier_version）
+            maxsize: 进程内 LRU 的最大条目数
+        """
+        self.connections = connections
+        self.maxsize = maxsize
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        # (应用名, 窗口标题) -> (分类, 是否兜底)
+        self._labels: "OrderedDict[Tuple[str, str], Tuple[str, bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent = True
+        # 是否已经预热过（warm 会清理其他版本的结果，只在显式启动后执行）
+        self._warmed = False
+
+    def set_version(self, version: str) -> None:
+        """关键词或模型变化后调用：清空内存缓存，已经预热过时按新版本重新预热"""
+        if version == self.version:
+            return
+        with self._lock:
+            self.version = version
+            self._labels.clear()
+        if self._warmed:
+            self.warm()
+
+    def warm(self) -> int:
+        """
+        从数据库读取当前版本的结果填充 LRU（最多 maxsize 条），并在后台删除其他版本的结果
+        Returns:
+            int: 预热的条目数
+        """
+        try:
+            rows = self.connections.reader().execute('''
+                SELECT p.name, t.title, cc.category, cc.fallback
+                FROM classification_cache cc
+                         JOIN processes p ON cc.process_id = p.id
+                         JOIN titles t ON cc.title_id = t.id
+                WHERE cc.version = ?
+                LIMIT ?
+            ''', (self.version, self.maxsize)).fetchall()
+        except sqlite3.OperationalError:
+            # 没有经过 ActivityDatabase 迁移的数据库：只使用内存缓存
+            self._persistent = False
+            return 0
+
+        self._warmed = True
+        with self._lock:
+            for app_name, window_title, category, fallback in rows:
+                self._remember((app_name, window_title), category, bool(fallback))
+        self.connections.submit(_drop_other_versions, self.version)
+        return len(rows)
+
+    def get(self, app_name: str, window_title: str) -> Optional[str]:
+        """已缓存的分类；两级都没有时返回 None"""
+        key = (app_name, window_title)
+        with self._lock:
+            entry = self._labels.get(key)
+            if entry is not None:
+                self._labels.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self._persistent:
+            try:
+                row = self.connections.reader().execute('''
+                    SELECT cc.category, cc.fallback
+                    FROM processes p
+                             JOIN titles t ON t.title = :title
+                             JOIN classification_cache cc
+                                  ON cc.version = :version AND cc.process_id = p.id AND cc.title_id = t.id
+                    WHERE p.name = :app
+                    LIMIT 1
+                ''', {'version': self.version, 'app': app_name, 'title': window_title}).fetchone()
+            except sqlite3.OperationalError:
+                # 没有经过 ActivityDatabase 迁移的数据库：只使用内存缓存
+                self._persistent = False
+                row = None
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0], bool(row[1]))
+                    self.hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, app_name: str, window_title: str, category: str, fallback: bool = False) -> None:
+        """
+        记录新的分类结果，并交给写线程保存
+        fallback 为 True 表示兜底结果（模型缺失或预测失败），带标记保存
+        """
+        self.put_many([(app_name, window_title, category)], fallback)
+
+    def put_many(self, rows: Sequence[Tuple[str, str, str]], fallback: bool = False) -> None:
+        """批量记录 [(应用名, 窗口标题, 分类)]，一条写命令保存"""
+        if not rows:
+            return
+        with self._lock:
+            for app_name, window_title, category in rows:
+                self._remember((app_name, window_title), category, fallback)
+        if self._persistent:
+            self.connections.submit(_store_labels, self.version,
+                                    [(app, title, category, fallback) for app, title, category in rows])
+
+    def store(self, pairs: Sequence[Tuple[str, str]]) -> None:
+        """
+        把 LRU 中已有的 (应用名, 窗口标题) 结果（连同兜底标记）再交给写线程保存一次，
+        用于组合出现在新的进程/标题 ID 下的情况；已经不在 LRU 中的组合跳过
+        """
+        with self._lock:
+            rows = [(*pair, *self._labels[pair]) for pair in pairs if pair in self._labels]
+        if rows and self._persistent:
+            self.connections.submit(_store_labels, self.version, rows)
+
+    def _remember(self, key: Tuple[str, str], category: str, fallback: bool) -> None:
+        """写入 LRU（调用方持有锁）"""
+        self._labels[key] = (category, fallback)
+        self._labels.move_to_end(key)
+        if len(self._labels) > self.maxsize:
+            self._labels.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中次数和当前条目数"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._labels), 'maxsize': self.maxsize}
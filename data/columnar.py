@@ -0,0 +1,373 @@
+"""
+列式会话存储 - DataAnalyzer 的可选分析引擎（engine='columnar'）
+
+把一个时间范围内已结束的会话一次性读入 NumPy 列：
+    start_ts / end_ts: int64（已裁剪到范围内）
+    process_id / title_id: int32
+    category: int16（未提供分类函数时为 -1）
+之后按应用/日期/小时/分类的汇总和 Top-N 都在内存中用 bincount / searchsorted 完成，
+不再为每个统计单独查询数据库。结果与 SQL 引擎（读取 daily_usage / hourly_usage 汇总表）一致
+
+NumPy 是可选依赖：未安装时 HAS_NUMPY 为 False，DataAnalyzer 回退到 SQL 引擎
+"""
+from datetime import datetime, time, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - 取决于运行环境
+    np = None
+    HAS_NUMPY = False
+
+from .database_utils import epoch_bounds, local_day, summarize_usage, to_epoch
+from .query_cache import data_version
+
+# 从数据库读取会话时每批的行数
+FETCH_BATCH_SIZE = 65536
+# 按 ID 查询窗口标题时每条语句的参数个数（低于旧版 SQLite 的 999 个参数上限）
+TITLE_BATCH_SIZE = 500
+
+
+def local_boundaries(start_ts: int, end_ts: int, unit: str = 'day') -> "np.ndarray":
+    """
+    [start_ts, end_ts] 内的本地日/小时边界（包含两端）
+    与 database_utils.split_by_hour 使用相同的规则，夏令时按本地时间处理
+    """
+    points = [start_ts]
+    t = start_ts
+    while t < end_ts:
+        local = datetime.fromtimestamp(t)
+        if unit == 'hour':
+            boundary = t - local.minute * 60 - local.second + 3600
+        else:
+            boundary = to_epoch(datetime.combine(local.date() + timedelta(days=1), time()))
+        t = min(boundary, end_ts)
+        points.append(t)
+    return np.array(points, dtype=np.int64)
+
+
+def bucket_seconds(starts: "np.ndarray", ends: "np.ndarray", boundaries: "np.ndarray") -> "np.ndarray":
+    """
+    各时间段 [starts, ends) 落在每个桶 [boundaries[k], boundaries[k+1]) 内的总秒数
+
+    累计覆盖函数 F(t) = Σ|[s, e) ∩ (-∞, t)| = Σ_{s<t}(t - s) - Σ_{e<t}(t - e)，
+    排序后用前缀和 + searchsorted 对所有边界一次求值，桶内秒数即相邻边界的差，
+    不需要逐条会话切分
+    """
+    if len(starts) == 0:
+        return np.zeros(len(boundaries) - 1, dtype=np.int64)
+    s = np.sort(starts)
+    e = np.sort(ends)
+    s_prefix = np.concatenate(([0], np.cumsum(s)))
+    e_prefix = np.concatenate(([0], np.cumsum(e)))
+    ns = np.searchsorted(s, boundaries, side='left')
+    ne = np.searchsorted(e, boundaries, side='left')
+    covered = boundaries * ns - s_prefix[ns] - (boundaries * ne - e_prefix[ne])
+    return np.diff(covered)
+
+
+class SessionColumns:
+    """一个时间范围 [range_start, range_end) 内已结束会话的列式存储"""
+
+    __slots__ = ('range_start', 'range_end', 'start_ts', 'end_ts', 'process_id', 'title_id',
+                 'category', 'starts_in_range', 'ends_in_range', 'first_ts', 'last_ts')
+
+    def __init__(self, range_start: int, range_end: int, rows: "np.ndarray"):
+        """
+        Args:
+            rows: (n, 4) int64 数组，列为原始的 start_ts, end_ts, process_id, title_id
+        """
+        self.range_start = range_start
+        self.range_end = range_end
+        raw_start, raw_end = rows[:, 0], rows[:, 1]
+        # 会话次数按开始时间计入（与 daily_usage 的 session_count 一致）
+        self.starts_in_range = raw_start >= range_start
+        self.ends_in_range = (raw_end > range_start) & (raw_end <= range_end)
+        self.first_ts = int(raw_start[self.starts_in_range].min()) if self.starts_in_range.any() else None
+        self.last_ts = int(raw_end[self.ends_in_range].max()) if self.ends_in_range.any() else None
+
+        self.start_ts = np.clip(raw_start, range_start, range_end)
+        self.end_ts = np.clip(raw_end, range_start, range_end)
+        self.process_id = rows[:, 2].astype(np.int32)
+        self.title_id = rows[:, 3].astype(np.int32)
+        self.category = np.full(len(rows), -1, dtype=np.int16)
+
+    def __len__(self) -> int:
+        return len(self.start_ts)
+
+    @property
+    def durations(self) -> "np.ndarray":
+        """范围内的时长（秒）"""
+        return self.end_ts - self.start_ts
+
+    def totals_by(self, codes: "np.ndarray", size: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """按整数编码分组的 (总秒数, 会话数)"""
+        seconds = np.bincount(codes, weights=self.durations, minlength=size).astype(np.int64)
+        counts = np.bincount(codes[self.starts_in_range], minlength=size)
+        return seconds, counts
+
+    def bucket_totals(self, boundaries: "np.ndarray", mask: Optional["np.ndarray"] = None) -> "np.ndarray":
+        """每个时间桶内的总秒数；mask 选出参与统计的会话"""
+        if mask is None:
+            return bucket_seconds(self.start_ts, self.end_ts, boundaries)
+        return bucket_seconds(self.start_ts[mask], self.end_ts[mask], boundaries)
+
+    def counts_by_bucket(self, boundaries: "np.ndarray") -> "np.ndarray":
+        """每个时间桶内开始的会话数"""
+        starts = self.start_ts[self.starts_in_range]
+        return np.diff(np.searchsorted(np.sort(starts), boundaries, side='left'))
+
+
+class ColumnarEngine:
+    """
+    基于 SessionColumns 的分析引擎，方法返回值与 DataAnalyzer 对应方法相同
+    同一范围在数据没有变化时只从数据库读取一次
+    """
+
+    def __init__(self, connections, categorize: Optional[Callable[[str, str], str]] = None, archive=None,
+                 categorize_pairs: Optional[Callable[[Sequence[Tuple[str, str]]], List[str]]] = None,
+                 categorize_version: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            connections: ConnectionManager
+            categorize: 可选的分类函数 (app_name, window_title) -> 分类名，用于填充 category 列
+            archive: 可选的 SessionArchive，加载时合并已归档月份的会话
+            categorize_pairs: 可选的批量分类函数 [(app_name, window_title)] -> [分类名]
+                （如 ActivityClassifier.classify_pairs），未分类的组合一次交给它；默认逐个调用 categorize
+            categorize_version: 可选，返回当前分类器版本；版本变化后已记住的分类全部失效
+        """
+        if not HAS_NUMPY:
+            raise ImportError("列式引擎需要 numpy")
+        self.connections = connections
+        self.categorize = categorize
+        self.categorize_pairs = categorize_pairs
+        self.categorize_version = categorize_version
+        self.archive = archive
+        self.category_names: List[str] = []
+
+        self._loaded: Optional[Tuple[Any, Tuple[int, int], SessionColumns]] = None
+        self._names: Optional[Tuple[Tuple[int, int], "np.ndarray", List[str]]] = None
+        # (process_id, title_id) -> 分类编码，只对 _pair_version 版本的分类器有效
+        self._pair_categories: Dict[Tuple[int, int], int] = {}
+        self._pair_version: Any = None
+
+    # ---------- 加载 ----------
+
+    def load(self, start_date: str, end_date: str) -> SessionColumns:
+        """读取 [start_date, end_date] 内（含跨越边界的）已结束会话"""
+        range_start, range_end = epoch_bounds(start_date, end_date)
+        classifier_version = self.categorize_version() if self.categorize_version is not None else None
+        version = (data_version(self.connections), classifier_version)
+        if self._loaded is not None and self._loaded[:2] == ((range_start, range_end), version):
+            return self._loaded[2]
+
+        cursor = self.connections.reader().execute('''
+            SELECT start_ts, end_ts, process_id, title_id
+            FROM window_sessions
+            WHERE end_ts >= ?
+              AND +start_ts < ?
+        ''', (range_start, range_end))
+        chunks = []
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not batch:
+                break
+            chunks.append(np.array(batch, dtype=np.int64))
+        if self.archive is not None:
+            chunks.append(self.archive.rows(range_start, range_end))
+        rows = np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.int64)
+
+        columns = SessionColumns(range_start, range_end, rows)
+        if self.categorize is not None:
+            self._assign_categories(columns, classifier_version)
+        self._loaded = ((range_start, range_end), version, columns)
+        return columns
+
+    def _process_names(self) -> Tuple["np.ndarray", List[str]]:
+        """process_id -> 名称编码（同名不同路径的进程合并）以及编码对应的名称"""
+        version = data_version(self.connections)
+        if self._names is None or self._names[0] != version:
+            rows = self.connections.reader().execute('SELECT id, name FROM processes').fetchall()
+            names = sorted({name for _, name in rows})
+            index = {name: i for i, name in enumerate(names)}
+            lookup = np.zeros(max((pid for pid, _ in rows), default=0) + 1, dtype=np.int32)
+            for pid, name in rows:
+                lookup[pid] = index[name]
+            self._names = (version, lookup, names)
+        return self._names[1], self._names[2]
+
+    def _assign_categories(self, columns: SessionColumns, classifier_version: Any = None) -> None:
+        """按 (进程, 标题) 去重后分类，还没有记住分类的组合一次批量分类"""
+        if classifier_version != self._pair_version:
+            # 分类规则或模型变化：之前记住的分类不再有效
+            self._pair_categories.clear()
+            self.category_names = []
+            self._pair_version = classifier_version
+        if not len(columns):
+            return
+        pairs = (columns.process_id.astype(np.int64) << 32) | columns.title_id.astype(np.int64)
+        unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+        keys = [(int(p >> 32), int(p & 0xFFFFFFFF)) for p in unique_pairs]
+
+        missing = [key for key in keys if key not in self._pair_categories]
+        if missing:
+            lookup, names = self._process_names()
+            titles = self._titles({title_id for _, title_id in missing})
+            named = [(names[lookup[process_id]], titles[title_id]) for process_id, title_id in missing]
+            if self.categorize_pairs is not None:
+                categories = self.categorize_pairs(named)
+            else:
+                categories = [self.categorize(name, title) for name, title in named]
+            codes = {name: i for i, name in enumerate(self.category_names)}
+            for key, category in zip(missing, categories):
+                if category not in codes:
+                    codes[category] = len(self.category_names)
+                    self.category_names.append(category)
+                self._pair_categories[key] = codes[category]
+
+        codes = np.array([self._pair_categories[key] for key in keys], dtype=np.int16)
+        columns.category = codes[inverse]
+
+    def _titles(self, title_ids) -> Dict[int, str]:
+        """title_id -> 窗口标题，按批查询"""
+        ids = sorted(title_ids)
+        conn = self.connections.reader()
+        titles: Dict[int, str] = {}
+        for offset in range(0, len(ids), TITLE_BATCH_SIZE):
+            batch = ids[offset:offset + TITLE_BATCH_SIZE]
+            titles.update(conn.execute(f"SELECT id, title FROM titles WHERE id IN ({','.join('?' * len(batch))})",
+                                       batch).fetchall())
+        return titles
+
+    # ---------- 与 DataAnalyzer 对应的统计 ----------
+
+    def _app_totals(self, columns: SessionColumns) -> Tuple[List[str], "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """按应用名汇总，返回 (名称, 秒数, 会话数, 按秒数降序、名称升序的下标)"""
+        lookup, names = self._process_names()
+        codes = lookup[columns.process_id]
+        seconds, counts = columns.totals_by(codes, len(names))
+        present = np.flatnonzero((seconds > 0) | (counts > 0))
+        order = present[np.lexsort((present, -seconds[present]))]
+        return names, seconds, counts, order
+
+    def summary(self, start_date: str, end_date: str) -> Dict[str, Any]:
+        """同 DataAnalyzer.get_summary"""
+        columns = self.load(start_date, end_date)
+        names, seconds, counts, order = self._app_totals(columns)
+        return summarize_usage(start_date, end_date,
+                               [(names[i], int(seconds[i]), int(counts[i])) for i in order],
+                               columns.first_ts, columns.last_ts)
+
+    def top_apps(self, start_date: str, end_date: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """同 DataAnalyzer.get_top_apps"""
+        names, seconds, _, order = self._app_totals(self.load(start_date, end_date))
+        return [{
+            'name': names[i],
+            'total_hours': round(int(seconds[i]) / 3600, 2),
+            'total_minutes': int(seconds[i]) // 60
+        } for i in order[:limit]]
+
+    def daily_usage(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """同 DataAnalyzer.get_daily_usage：只返回有记录的日期"""
+        columns = self.load(start_date, end_date)
+        boundaries = local_boundaries(columns.range_start, columns.range_end, 'day')
+        seconds = columns.bucket_totals(boundaries)
+        counts = columns.counts_by_bucket(boundaries)
+
+        daily_usage = []
+        for k in np.flatnonzero((seconds > 0) | (counts > 0)):
+            total = int(seconds[k])
+            daily_usage.append({
+                'date': local_day(datetime.fromtimestamp(int(boundaries[k]))),
+                'total_hours': round(total / 3600, 2),
+                'total_minutes': total // 60
+            })
+        return daily_usage
+
+    def hourly_usage(self, date: str) -> List[Dict[str, Any]]:
+        """同 DataAnalyzer.get_hourly_usage"""
+        columns = self.load(date, date)
+        boundaries = local_boundaries(columns.range_start, columns.range_end, 'hour')
+        lookup, names = self._process_names()
+        codes = lookup[columns.process_id]
+
+        seconds_by_hour = np.zeros(24, dtype=np.int64)
+        apps_by_hour: List[List[Tuple[int, str]]] = [[] for _ in range(24)]
+        hours = [datetime.fromtimestamp(int(b)).hour for b in boundaries[:-1]]
+        for code in np.unique(codes):
+            per_bucket = columns.bucket_totals(boundaries, codes == code)
+            per_hour = np.zeros(24, dtype=np.int64)
+            # 夏令时回拨时同一小时有两个桶，合并到一起
+            np.add.at(per_hour, hours, per_bucket)
+            seconds_by_hour += per_hour
+            for hour in np.flatnonzero(per_hour):
+                apps_by_hour[hour].append((int(per_hour[hour]), names[code]))
+
+        return [{
+            'hour': hour,
+            'total_minutes': int(seconds_by_hour[hour]) // 60,
+            'apps': [{'name': name, 'minutes': seconds // 60}
+                     for seconds, name in sorted(apps_by_hour[hour], key=lambda x: (-x[0], x[1]))]
+        } for hour in range(24)]
+
+    def heatmap(self, start_date: str, end_date: str,
+                by: str = 'process') -> Tuple[List[List[int]], Dict[str, List[List[int]]]]:
+        """
+        星期 × 小时的使用秒数（行为周一到周日），同 DataAnalyzer.get_usage_heatmap
+        每个分组先按本地整点分桶，再用 bincount 把桶累加到 168 个 (星期, 小时) 格子
+
+        Returns:
+            (total, groups): 7×24 总矩阵，以及 {应用名或分类名: 7×24 矩阵}
+        """
+        columns = self.load(start_date, end_date)
+        boundaries = local_boundaries(columns.range_start, columns.range_end, 'hour')
+        cells = np.array([local.weekday() * 24 + local.hour
+                          for local in map(datetime.fromtimestamp, boundaries[:-1].tolist())], dtype=np.int64)
+        codes, names = self._group_codes(columns, by)
+
+        total = np.zeros(168, dtype=np.int64)
+        groups: Dict[str, List[List[int]]] = {}
+        for code in np.unique(codes):
+            per_bucket = columns.bucket_totals(boundaries, codes == code)
+            matrix = np.bincount(cells, weights=per_bucket, minlength=168).astype(np.int64)
+            if matrix.any():
+                total += matrix
+                groups[names[code]] = matrix.reshape(7, 24).tolist()
+        return total.reshape(7, 24).tolist(), groups
+
+    def timeline(self, start_date: str, end_date: str, boundaries: List[int],
+                 by: str = 'process') -> Dict[str, List[int]]:
+        """
+        每个应用/分类在各时间桶 [boundaries[k], boundaries[k+1]) 内的秒数，
+        同 DataAnalyzer.get_timeline 的 SQL 路径；只包含有使用时间的分组
+        """
+        columns = self.load(start_date, end_date)
+        edges = np.array(boundaries, dtype=np.int64)
+        codes, names = self._group_codes(columns, by)
+
+        groups: Dict[str, List[int]] = {}
+        for code in np.unique(codes):
+            per_bucket = columns.bucket_totals(edges, codes == code)
+            if per_bucket.any():
+                groups[names[code]] = per_bucket.tolist()
+        return groups
+
+    def _group_codes(self, columns: SessionColumns, by: str) -> Tuple["np.ndarray", List[str]]:
+        """按应用名或分类分组时每条会话的编码，以及编码对应的名称"""
+        if by == 'category':
+            if self.categorize is None:
+                raise ValueError("未提供分类函数，无法按分类统计")
+            return columns.category, self.category_names
+        lookup, names = self._process_names()
+        return lookup[columns.process_id], names
+
+    def category_usage(self, start_date: str, end_date: str) -> Dict[str, int]:
+        """各分类的总秒数（需要在构造时提供 categorize）"""
+        columns = self.load(start_date, end_date)
+        if self.categorize is None:
+            raise ValueError("未提供分类函数，无法按分类统计")
+        mask = columns.category >= 0
+        seconds = np.bincount(columns.category[mask], weights=columns.durations[mask],
+                              minlength=len(self.category_names)).astype(np.int64)
+        return {name: int(seconds[i]) for i, name in enumerate(self.category_names)}
@@ -0,0 +1,208 @@
+"""
+数据库连接管理器 - 为 ActivityDatabase / DataAnalyzer / ActivityClassifier 提供长连接
+
+同一个数据库文件在进程内只保留：
+- 一个写连接，由单独的写线程（DatabaseWriter）持有，所有修改都通过 submit() 提交
+- 每个线程一个读连接（分析、分类查询使用）
+数据库使用 WAL 模式，读查询不会阻塞写线程
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .db_writer import DatabaseWriter
+
+
+class ConnectionManager:
+    """SQLite 长连接管理（一写多读）"""
+
+    def __init__(self, db_path: str, timeout: float = 10.0, flush_interval: float = 0.2):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._writer_thread: Optional[DatabaseWriter] = None
+        self._writer_thread_lock = threading.Lock()
+        self._commit_hooks: List[Callable[[], None]] = [self._count_commit]
+        self._write_seq = 0
+        # 当前事务中是否执行过会改变数据的命令（只在写线程中读写）
+        self._changed = False
+        self._external_version = 0
+
+        # 每个线程独立的读连接；generation 用于 close() 之后让旧连接失效
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._generation = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建并配置一个新连接"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        # WAL 下 NORMAL 只在检查点时 fsync，提交本身不再同步刷盘
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        获取写连接并在一个事务中执行
+        正常退出时提交，出现异常时回滚并继续抛出
+        """
+        with self._writer_lock:
+            conn = self._writer_connection()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        """写连接（调用方持有 _writer_lock），首次使用时创建"""
+        if self._writer_conn is None:
+            self._writer_conn = self._connect()
+            # journal_mode 会持久化到数据库文件中
+            self._writer_conn.execute("PRAGMA journal_mode = WAL")
+        return self._writer_conn
+
+    def _get_writer_thread(self) -> DatabaseWriter:
+        with self._writer_thread_lock:
+            if self._writer_thread is None:
+                self._writer_thread = DatabaseWriter(self, flush_interval=self.flush_interval)
+                for hook in self._commit_hooks:
+                    self._writer_thread.add_commit_hook(hook)
+                self._writer_thread.start()
+            return self._writer_thread
+
+    def submit(self, command: Callable, *args: Any, wait: bool = False, urgent: bool = False,
+               quiet: bool = False) -> Any:
+        """
+        把写命令交给写线程执行
+
+        Args:
+            command: command(conn, *args)，在写线程的事务中执行
+            wait: 为 True 时阻塞直到事务提交并返回命令结果（异常会重新抛出）；
+                  为 False 时立即返回 Future
+            urgent: 不等待时也尽快提交（调用方稍后会等待返回的 Future）；wait=True 时总是尽快提交
+            quiet: 命令不改变任何查询会读到的数据（例如心跳），只包含这类命令的事务不推进 write_seq
+
+        Returns:
+            wait=True 时为命令返回值，否则为 Future
+        """
+        if not quiet:
+            command = self._mark_changed(command)
+        future = self._get_writer_thread().submit(command, *args, urgent=wait or urgent)
+        return future.result() if wait else future
+
+    def flush(self) -> None:
+        """等待此前提交的所有写命令落盘"""
+        self.submit(lambda conn: None, wait=True, quiet=True)
+
+    def add_commit_hook(self, hook: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册提交回调，每次写线程提交事务后调用
+        管理器按数据库文件在进程内共享，回调的所有者关闭时应调用返回的函数取消注册
+
+        Returns:
+            取消注册的函数（可重复调用）
+        """
+        self._commit_hooks.append(hook)
+        with self._writer_thread_lock:
+            if self._writer_thread is not None:
+                self._writer_thread.add_commit_hook(hook)
+
+        def remove() -> None:
+            with self._writer_thread_lock:
+                if hook in self._commit_hooks:
+                    self._commit_hooks.remove(hook)
+                if self._writer_thread is not None:
+                    self._writer_thread.remove_commit_hook(hook)
+
+        return remove
+
+    def _mark_changed(self, command: Callable) -> Callable:
+        """包装写命令：在写线程中执行时记下本事务改变了数据"""
+        def run(conn: sqlite3.Connection, *args: Any) -> Any:
+            self._changed = True
+            return command(conn, *args)
+        return run
+
+    def _count_commit(self) -> None:
+        if self._changed:
+            self._changed = False
+            self._write_seq += 1
+
+    @property
+    def write_seq(self) -> int:
+        """写线程已提交的、改变了数据的事务数（单调递增，可用于判断数据是否变化；quiet 命令不计入）"""
+        return self._write_seq
+
+    def external_version(self) -> int:
+        """
+        其他连接（包括其他进程）的提交计数：在写连接上读取 PRAGMA data_version，
+        该值不受本连接自己的提交影响，所以心跳等本进程的写入不会改变它
+        写线程正在执行事务时不等待，返回上一次读到的值（之后的调用会读到新值）
+        """
+        if self._writer_lock.acquire(blocking=False):
+            try:
+                conn = self._writer_connection()
+                self._external_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            finally:
+                self._writer_lock.release()
+        return self._external_version
+
+    def reader(self) -> sqlite3.Connection:
+        """获取当前线程的读连接（首次调用时创建）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'generation', -1) != self._generation:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.generation = self._generation
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """停止写线程（先处理完队列）并关闭所有连接；之后再次使用会自动重新连接"""
+        with self._writer_thread_lock:
+            thread, self._writer_thread = self._writer_thread, None
+        if thread is not None:
+            thread.stop()
+
+        with self._writer_lock:
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+
+        with self._readers_lock:
+            self._generation += 1
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+_MANAGERS: Dict[str, ConnectionManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+
+def get_connection_manager(db_path: str) -> ConnectionManager:
+    """
+    获取指定数据库文件的连接管理器
+    同一文件在进程内共享一个管理器，保证只有一个写连接
+    """
+    key = os.path.abspath(db_path)
+    with _MANAGERS_LOCK:
+        manager = _MANAGERS.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _MANAGERS[key] = manager
+        return manager
@@ -1,11 +1,94 @@
-import sqlite3
-from typing import List, Dict, Any
+import itertools
+from typing import Callable, Iterator, List, Dict, Any, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
 
+from .connection_manager import ConnectionManager, get_connection_manager
+from .database_utils import (DEFAULT_SESSION_COLUMNS, SESSION_BATCH_SIZE, TIME_FORMAT, SessionRecord,
+                             day_bounds, epoch_bounds, iter_sessions, local_day, merge_open_session,
+                             summarize_usage, to_epoch)
+from .query_cache import QUERY_CACHE_SIZE, QueryCache, cached_query
+from .columnar import HAS_NUMPY, ColumnarEngine
+from .archive import SessionArchive
+
+
+# 按应用聚合：在 daily_usage 的主键 (day, process_id, title_id) 上按 process_id 分组，
+# 再只对分组结果关联 processes 取名称（同名不同路径的进程合并为一项）
+_APP_USAGE_SQL = '''
+    SELECT p.name, SUM(usage.total_seconds) AS total_seconds
+    FROM (SELECT process_id, SUM(seconds) AS total_seconds
+          FROM daily_usage
+          WHERE day >= ? AND day < ?
+          GROUP BY process_id) usage
+             JOIN processes p ON p.id = usage.process_id
+    GROUP BY p.name
+    ORDER BY total_seconds DESC, p.name
+'''
+
+# 范围摘要：一条语句给出每个应用的时长和会话数（总计由 summarize_usage 累加）；
+# 首个会话开始/最后一个会话结束时间由 start_ts、end_ts 索引上的 MIN/MAX 直接定位
+_SUMMARY_SQL = '''
+    SELECT p.name,
+           SUM(usage.total_seconds)                                  AS total_seconds,
+           SUM(usage.session_count)                                  AS session_count,
+           (SELECT MIN(start_ts) FROM window_sessions
+            WHERE start_ts >= :start_ts AND start_ts < :end_ts)      AS first_ts,
+           (SELECT MAX(end_ts) FROM window_sessions
+            WHERE end_ts > :start_ts AND end_ts <= :end_ts)          AS last_ts,
+           EXISTS (SELECT 1 FROM archived_months
+                   WHERE max_end_ts > :start_ts AND min_start_ts < :end_ts) AS archived
+    FROM (SELECT process_id, SUM(seconds) AS total_seconds, SUM(session_count) AS session_count
+          FROM daily_usage
+          WHERE day >= :start_day AND day < :end_day
+          GROUP BY process_id) usage
+             JOIN processes p ON p.id = usage.process_id
+    GROUP BY p.name
+    ORDER BY total_seconds DESC, p.name
+'''
+
+# get_timeline 可选的时间桶大小（秒）：请求的粒度会导致桶数过多时，依次换用更粗的粒度
+TIMELINE_RESOLUTIONS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 86400)
+# get_timeline 最多返回的时间桶数
+TIMELINE_MAX_BUCKETS = 1500
+
 
 class DataAnalyzer:
-    def __init__(self, db_path: str = "activity.db"):
+    def __init__(self, db_path: str = "activity.db",
+                 connections: Optional[ConnectionManager] = None,
+                 cache_size: int = QUERY_CACHE_SIZE, engine: str = 'sql',
+                 categorize: Optional[Callable[[str, str], str]] = None, live=None,
+                 categorize_pairs: Optional[Callable[[Sequence[Tuple[str, str]]], List[str]]] = None,
+                 categorize_version: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            engine: 'sql' 读取汇总表；'columnar' 把范围内的会话读入 NumPy 列后在内存中统计
+                    （需要 numpy，未安装时回退到 'sql'）
+            categorize: 分类函数 (app_name, window_title) -> 分类名（如 ActivityClassifier.classify_activity），
+                        按分类统计时使用
+            live: 正在记录的 ActivityDatabase；提供后摘要中会合并当前打开会话已经过的时长，
+                  get_today_summary 直接读取它在内存中维护的今日累计
+            categorize_pairs / categorize_version: 列式引擎使用的批量分类函数（如 ActivityClassifier.classify_pairs）
+                  和返回当前分类器版本的函数，见 ColumnarEngine
+        """
+        if engine not in ('sql', 'columnar'):
+            raise ValueError(f"未知的分析引擎: {engine}")
         self.db_path = db_path
+        # 每个线程复用自己的读连接
+        self.connections = connections or get_connection_manager(db_path)
+        # 查询结果缓存，数据没有写入时重复调用直接返回；cache_size 为 0 时不缓存
+        self.cache = QueryCache(self.connections, cache_size) if cache_size else None
+        self.categorize = categorize
+        self.live = live
+        # 已归档月份的会话明细，需要明细的查询与数据库中的会话合并
+        self.archive = SessionArchive(self.connections)
+
+        self.columnar: Optional[ColumnarEngine] = None
+        if engine == 'columnar':
+            if HAS_NUMPY:
+                self.columnar = ColumnarEngine(self.connections, categorize, self.archive,
+                                               categorize_pairs, categorize_version)
+            else:
+                print("⚠️ 未安装 numpy，列式引擎不可用，使用 SQL 引擎")
+        self.engine = 'columnar' if self.columnar is not None else 'sql'
 
     def get_today_summary(self) -> Dict[str, Any]:
         """
@@ -15,138 +98,370 @@ class DataAnalyzer:
                                         total hours:
                                         total minutes:
                                         list [ app usage]
+                 以及 get_summary 的其他字段
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
-            # 总使用时间
-            cursor.execute('''
-                            SELECT SUM(duration_seconds)
-                            FROM window_sessions
-                            WHERE DATE (start_time) = DATE ('now')
-                            ''')
-            total_seconds = cursor.fetchone()[0] or 0
-
-            # 按应用统计
-            cursor.execute('''
-                            SELECT p.name, SUM(ws.duration_seconds) as total_seconds
-                            FROM window_sessions ws
-                                    JOIN processes p ON ws.process_id = p.id
-                            WHERE DATE (ws.start_time) = DATE ('now')
-                            GROUP BY p.name
-                            ORDER BY total_seconds DESC
-                            ''')
-
-            app_usage = []
-            for name, seconds in cursor.fetchall():
-                app_usage.append({
-                    'name': name,
-                    'hours': round(seconds / 3600, 2),
-                    'minutes': seconds // 60
-                })
-
-            return {
-                'total_hours': round(total_seconds / 3600, 2),
-                'total_minutes': total_seconds // 60,
-                'app_usage': app_usage
-            }
+        if self.live is not None:
+            return self.live.get_today_summary()
+        today = local_day(datetime.now())
+        return self.get_summary(today, today)
+
+    def get_summary(self, start_date: str, end_date: str) -> Dict[str, Any]:
+        """获取指定日期范围内（包含两端）的使用摘要，只查询一次数据库
+
+        Args:
+            start_date: 起始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'
+
+        Returns:
+            Dict: total_seconds / total_hours / total_minutes / session_count，
+                  first_activity / last_activity（范围内首个会话开始、最后一个会话结束的时间，无数据时为 None），
+                  app_usage：每个应用的 {'name','seconds','hours','minutes','session_count'}，按时长降序
+            提供了 live 时包括当前打开会话到现在为止的时长（不写入数据库）
+        """
+        summary = self._stored_summary(start_date, end_date)
+        current = self.live.get_current_session_info() if self.live is not None else None
+        if current is None:
+            return summary
+        start_ts = to_epoch(datetime.strptime(current.start_time, TIME_FORMAT))
+        return merge_open_session(summary, current.process_name, start_ts, to_epoch(datetime.now()))
+
+    @cached_query()
+    def _stored_summary(self, start_date: str, end_date: str) -> Dict[str, Any]:
+        """get_summary 中已经写入数据库的部分（可缓存）"""
+        if self.columnar is not None:
+            return self.columnar.summary(start_date, end_date)
+
+        try:
+            start_day, end_day = day_bounds(start_date, end_date)
+            start_ts, end_ts = epoch_bounds(start_date, end_date)
+        except ValueError:
+            raise ValueError("start_date 和 end_date 必须为 'YYYY-MM-DD' 格式")
+
+        cursor = self.connections.reader().execute(_SUMMARY_SQL, {
+            'start_day': start_day, 'end_day': end_day, 'start_ts': start_ts, 'end_ts': end_ts})
+
+        apps = []
+        first_ts = last_ts = None
+        archived = False
+        for name, seconds, sessions, first_ts, last_ts, archived in cursor.fetchall():
+            apps.append((name, seconds, sessions))
+
+        # 汇总表包含已归档的月份，范围与归档月份重叠时首/末会话时间还需要查看归档文件
+        if archived:
+            archived_first, archived_last = self.archive.first_last(start_ts, end_ts)
+            first_ts = min(filter(None, (first_ts, archived_first)), default=None)
+            last_ts = max(filter(None, (last_ts, archived_last)), default=None)
+        return summarize_usage(start_date, end_date, apps, first_ts, last_ts)
+
+
+    @staticmethod
+    def _days_ago(days: int) -> str:
+        """N 天前的本地日期，用于 day >= ? 查询"""
+        return local_day(datetime.now() - timedelta(days=days))
 
 
 #TODO： ============== the following functions are not accomplished / need test =====================
 
+    def iter_sessions(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      columns: Sequence[str] = DEFAULT_SESSION_COLUMNS,
+                      batch_size: int = SESSION_BATCH_SIZE, newest_first: bool = False,
+                      closed_only: bool = False) -> Iterator[SessionRecord]:
+        """逐批读取与日期范围（包含两端）重叠的会话，不会一次性载入整个范围
+
+        Args:
+            start_date / end_date: 格式 'YYYY-MM-DD'，None 表示不限
+            columns: 要读取的列（见 database_utils.SESSION_COLUMNS），其余属性为 None
+            batch_size: 每次 fetchmany 的行数
+            newest_first: 为 True 时按开始时间倒序
+            closed_only: 为 True 时跳过仍在进行的会话
+
+        Returns:
+            Iterator[SessionRecord]: 按开始时间排序的会话记录，包括已归档月份中的会话
+        """
+        start_ts = epoch_bounds(start_date, start_date)[0] if start_date else None
+        end_ts = epoch_bounds(end_date, end_date)[1] if end_date else None
+        # 与归档合并时按 start_ts 排序
+        live_columns = tuple(columns) if 'start_ts' in columns else tuple(columns) + ('start_ts',)
+        live = iter_sessions(self.connections.reader(), start_ts, end_ts, live_columns,
+                             batch_size, newest_first, closed_only)
+        return self.archive.merge(live, start_ts, end_ts, live_columns, batch_size, newest_first)
+
+    @staticmethod
+    def _activity(record: SessionRecord) -> Dict[str, Any]:
+        """活动列表中的一项"""
+        return {
+            'process': record.process,
+            'window_title': record.window_title,
+            'start_time': record.start_time,
+            'duration_minutes': record.duration_seconds // 60
+        }
+
+    @cached_query()
     def get_recent_activities(self, limit: int = 10) -> List[Dict[str, Any]]:
         """获取最近的活动记录"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                            SELECT p.name, ws.window_title, ws.start_time, ws.duration_seconds
-                            FROM window_sessions ws
-                                    JOIN processes p ON ws.process_id = p.id
-                            ORDER BY ws.start_time DESC LIMIT ?
-                            ''', (limit,))
-
-            activities = []
-            for name, title, start_time, duration in cursor.fetchall():
-                activities.append({
-                    'process': name,
-                    'window_title': title,
-                    'start_time': start_time,
-                    'duration_minutes': duration // 60
-                })
-
-            return activities
+        records = self.iter_sessions(newest_first=True, batch_size=limit)
+        return [self._activity(record) for record in itertools.islice(records, limit)]
 
+    @cached_query(today=True)
     def get_top_apps(self, days: int = 1, limit: int = 5) -> List[Dict[str, Any]]:
         """获取最常用的应用"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                            SELECT p.name, SUM(ws.duration_seconds) as total_seconds
-                            FROM window_sessions ws
-                                    JOIN processes p ON ws.process_id = p.id
-                            WHERE DATE (ws.start_time) >= DATE ('now', ?)
-                            GROUP BY p.name
-                            ORDER BY total_seconds DESC
-                               LIMIT ?
-                           ''', (f'-{days} days', limit))
-
-            top_apps = []
-            for name, seconds in cursor.fetchall():
-                top_apps.append({
-                    'name': name,
-                    'total_hours': round(seconds / 3600, 2),
-                    'total_minutes': seconds // 60
-                })
-
-            return top_apps
+        if self.columnar is not None:
+            return self.columnar.top_apps(self._days_ago(days), local_day(datetime.now()), limit)
+        conn = self.connections.reader()
+        cursor = conn.cursor()
+        cursor.execute(_APP_USAGE_SQL + ' LIMIT ?',
+                       (*day_bounds(self._days_ago(days), local_day(datetime.now())), limit))
+
+        top_apps = []
+        for name, seconds in cursor.fetchall():
+            top_apps.append({
+                'name': name,
+                'total_hours': round(seconds / 3600, 2),
+                'total_minutes': seconds // 60
+            })
 
+        return top_apps
+
+    @cached_query(today=True)
     def get_daily_usage(self, days: int = 7) -> List[Dict[str, Any]]:
         """获取每日使用时间"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                            SELECT DATE (start_time), SUM (duration_seconds)
-                            FROM window_sessions
-                            WHERE DATE (start_time) >= DATE ('now', ?)
-                            GROUP BY DATE (start_time)
-                            ORDER BY DATE (start_time)
-                            ''', (f'-{days} days',))
-
-            daily_usage = []
-            for date_str, seconds in cursor.fetchall():
-                daily_usage.append({
-                    'date': date_str,
-                    'total_hours': round(seconds / 3600, 2),
-                    'total_minutes': seconds // 60
-                })
-
-            return daily_usage
+        if self.columnar is not None:
+            return self.columnar.daily_usage(self._days_ago(days), local_day(datetime.now()))
+        conn = self.connections.reader()
+        cursor = conn.cursor()
+        cursor.execute('''
+                        SELECT day, SUM(seconds)
+                        FROM daily_usage
+                        WHERE day >= ?
+                        GROUP BY day
+                        ORDER BY day
+                        ''', (self._days_ago(days),))
+
+        daily_usage = []
+        for date_str, seconds in cursor.fetchall():
+            daily_usage.append({
+                'date': date_str,
+                'total_hours': round(seconds / 3600, 2),
+                'total_minutes': seconds // 60
+            })
+
+        return daily_usage
+
+    @cached_query()
+    def get_hourly_usage(self, date: str) -> List[Dict[str, Any]]:
+        """获取指定日期每个小时的使用时间（来自按小时切分的汇总），共 24 项
 
+        Args:
+            date: 日期，格式 'YYYY-MM-DD'
+
+        Returns:
+            List[Dict]: [{'hour', 'total_minutes', 'apps': [{'name', 'minutes'}]}]，按小时排序
+        """
+        if self.columnar is not None:
+            return self.columnar.hourly_usage(date)
+
+        conn = self.connections.reader()
+        cursor = conn.cursor()
+        cursor.execute('''
+                        SELECT usage.hour, p.name, SUM(usage.total_seconds)
+                        FROM (SELECT hour, process_id, SUM(seconds) AS total_seconds
+                              FROM hourly_usage
+                              WHERE day = ?
+                              GROUP BY hour, process_id) usage
+                                 JOIN processes p ON p.id = usage.process_id
+                        GROUP BY usage.hour, p.name
+                        ORDER BY usage.hour, 3 DESC, p.name
+                        ''', (date,))
+
+        hours = [{'hour': hour, 'total_minutes': 0, 'apps': []} for hour in range(24)]
+        seconds_by_hour = [0] * 24
+        for hour, name, seconds in cursor.fetchall():
+            seconds_by_hour[hour] += seconds
+            hours[hour]['apps'].append({'name': name, 'minutes': seconds // 60})
+        for hour, seconds in enumerate(seconds_by_hour):
+            hours[hour]['total_minutes'] = seconds // 60
+
+        return hours
+
+    @cached_query()
+    def get_usage_heatmap(self, start_date: str, end_date: str, by: str = 'process') -> Dict[str, Any]:
+        """获取星期 × 小时的使用热力图（来自按小时切分的汇总）
+
+        Args:
+            start_date: 起始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'（包含）
+            by: 'process' 按应用分组；'category' 按分类分组（需要在构造时提供 categorize）
+
+        Returns:
+            Dict: {'by', 'start_date', 'end_date',
+                   'total': 7×24 秒数矩阵（行为周一到周日，列为 0-23 时），
+                   'groups': {应用名或分类名: 7×24 秒数矩阵}}
+        """
+        if by not in ('process', 'category'):
+            raise ValueError(f"by 只能是 'process' 或 'category': {by}")
+        if by == 'category' and self.categorize is None:
+            raise ValueError("未提供分类函数，无法按分类统计")
+
+        if self.columnar is not None:
+            total, groups = self.columnar.heatmap(start_date, end_date, by)
+        else:
+            total, groups = self._sql_heatmap(start_date, end_date, by)
+
+        return {
+            'by': by,
+            'start_date': start_date,
+            'end_date': end_date,
+            'total': total,
+            'groups': groups
+        }
+
+    def _sql_heatmap(self, start_date: str, end_date: str, by: str):
+        """在 hourly_usage 上按 (星期, 小时, 分组) 聚合，结果最多 168 × 分组数 行"""
+        # strftime('%w') 以周日为 0，换算为周一为 0
+        if by == 'process':
+            sql = '''
+                SELECT (CAST(strftime('%w', usage.day) AS INTEGER) + 6) % 7 AS weekday, usage.hour,
+                       p.name, SUM(usage.seconds)
+                FROM hourly_usage usage
+                         JOIN processes p ON p.id = usage.process_id
+                WHERE usage.day >= ? AND usage.day < ?
+                GROUP BY weekday, usage.hour, p.name
+            '''
+        else:
+            sql = '''
+                SELECT (CAST(strftime('%w', usage.day) AS INTEGER) + 6) % 7 AS weekday, usage.hour,
+                       p.name, t.title, SUM(usage.seconds)
+                FROM hourly_usage usage
+                         JOIN processes p ON p.id = usage.process_id
+                         JOIN titles t ON t.id = usage.title_id
+                WHERE usage.day >= ? AND usage.day < ?
+                GROUP BY weekday, usage.hour, usage.process_id, usage.title_id
+            '''
+        cursor = self.connections.reader().execute(sql, day_bounds(start_date, end_date))
+
+        total = [[0] * 24 for _ in range(7)]
+        groups: Dict[str, List[List[int]]] = {}
+        categories: Dict[tuple, str] = {}
+        for row in cursor.fetchall():
+            weekday, hour, seconds = row[0], row[1], row[-1]
+            if by == 'process':
+                group = row[2]
+            else:
+                # 每个 (应用, 标题) 组合只分类一次
+                group = categories.get(row[2:4])
+                if group is None:
+                    group = categories[row[2:4]] = self.categorize(row[2], row[3])
+            matrix = groups.setdefault(group, [[0] * 24 for _ in range(7)])
+            matrix[weekday][hour] += seconds
+            total[weekday][hour] += seconds
+        return total, groups
+
+    @cached_query()
+    def get_timeline(self, start_date: str, end_date: str, resolution: int = 900,
+                     by: str = 'process', max_buckets: int = TIMELINE_MAX_BUCKETS) -> Dict[str, Any]:
+        """获取按固定时间桶降采样的前台应用时间线
+
+        Args:
+            start_date: 起始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'（包含）
+            resolution: 时间桶大小（秒），如 60、900、3600
+            by: 'process' 按应用；'category' 按分类（需要在构造时提供 categorize）
+            max_buckets: 桶数上限，超过时自动换用 TIMELINE_RESOLUTIONS 中更粗的粒度
+
+        Returns:
+            Dict: {'by', 'start_date', 'end_date', 'resolution'（实际使用的桶大小）,
+                   'buckets': [{'start', 'active_seconds', 'dominant'（占用最多的应用/分类，无使用时为 None）,
+                                'fractions': {应用名或分类名: 占桶时长的比例}}]}
+        """
+        if by not in ('process', 'category'):
+            raise ValueError(f"by 只能是 'process' 或 'category': {by}")
+        if by == 'category' and self.categorize is None:
+            raise ValueError("未提供分类函数，无法按分类统计")
+        if resolution <= 0:
+            raise ValueError(f"resolution 必须为正数: {resolution}")
+
+        range_start, range_end = epoch_bounds(start_date, end_date)
+        resolution = self._timeline_resolution(range_end - range_start, resolution, max_buckets)
+        boundaries = list(range(range_start, range_end, resolution)) + [range_end]
+
+        if self.columnar is not None:
+            groups = self.columnar.timeline(start_date, end_date, boundaries, by)
+        else:
+            groups = self._sql_timeline(start_date, end_date, boundaries, resolution, by)
+
+        buckets = []
+        for k, bucket_start in enumerate(boundaries[:-1]):
+            length = boundaries[k + 1] - bucket_start
+            used = [(seconds[k], name) for name, seconds in groups.items() if seconds[k] > 0]
+            # 时长相同时按名称取第一个，结果与分组的遍历顺序无关
+            dominant = min(used, key=lambda x: (-x[0], x[1]))[1] if used else None
+            buckets.append({
+                'start': datetime.fromtimestamp(bucket_start).strftime(TIME_FORMAT),
+                'active_seconds': sum(seconds for seconds, _ in used),
+                'dominant': dominant,
+                'fractions': {name: round(seconds / length, 4) for seconds, name in sorted(used, key=lambda x: x[1])}
+            })
+
+        return {
+            'by': by,
+            'start_date': start_date,
+            'end_date': end_date,
+            'resolution': resolution,
+            'buckets': buckets
+        }
+
+    @staticmethod
+    def _timeline_resolution(span: int, resolution: int, max_buckets: int) -> int:
+        """不超过 max_buckets 个桶的最细粒度（不细于请求的 resolution）"""
+        if span <= resolution * max_buckets:
+            return resolution
+        for candidate in TIMELINE_RESOLUTIONS:
+            if candidate > resolution and span <= candidate * max_buckets:
+                return candidate
+        days = -(-span // (86400 * max_buckets))
+        return 86400 * days
+
+    def _sql_timeline(self, start_date: str, end_date: str, boundaries: List[int],
+                      resolution: int, by: str) -> Dict[str, List[int]]:
+        """逐批读取范围内已结束的会话，把每条会话的时长切分到所在的时间桶"""
+        range_start, range_end = boundaries[0], boundaries[-1]
+        bucket_count = len(boundaries) - 1
+        columns = ('process', 'window_title', 'start_ts', 'end_ts') if by == 'category' \
+            else ('process', 'start_ts', 'end_ts')
+
+        groups: Dict[str, List[int]] = {}
+        categories: Dict[tuple, str] = {}
+        for session in self.iter_sessions(start_date, end_date, columns=columns, closed_only=True):
+            start, end = max(session.start_ts, range_start), min(session.end_ts, range_end)
+            if end <= start:
+                continue
+            if by == 'process':
+                group = session.process
+            else:
+                # 每个 (应用, 标题) 组合只分类一次
+                key = (session.process, session.window_title)
+                group = categories.get(key)
+                if group is None:
+                    group = categories[key] = self.categorize(*key)
+            seconds = groups.setdefault(group, [0] * bucket_count)
+
+            k = (start - range_start) // resolution
+            while start < end:
+                bucket_end = min(boundaries[k + 1], end)
+                seconds[k] += bucket_end - start
+                start = bucket_end
+                k += 1
+        return groups
+
+    @cached_query(today=True)
     def get_today_activities(self) -> List[Dict[str, Any]]:
         """获取今日的所有活动记录（按时间排序）
 
+        包括昨天开始、跨过午夜的会话和仍在进行的会话；
         返回每条记录的进程名、窗口标题、开始时间和持续分钟数
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                            SELECT p.name, ws.window_title, ws.start_time, ws.duration_seconds
-                            FROM window_sessions ws
-                                    JOIN processes p ON ws.process_id = p.id
-                            WHERE DATE(ws.start_time) = DATE('now')
-                            ORDER BY ws.start_time
-                            ''')
-
-            activities = []
-            for name, title, start_time, duration in cursor.fetchall():
-                activities.append({
-                    'process': name,
-                    'window_title': title,
-                    'start_time': start_time,
-                    'duration_minutes': duration // 60
-                })
-
-            return activities
+        today = local_day(datetime.now())
+        return [self._activity(record) for record in self.iter_sessions(today, today)]
 
     def get_usage_between(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """获取在指定日期范围内（包含两端）的按应用聚合使用时间
@@ -156,45 +471,6 @@ class DataAnalyzer:
             end_date: 结束日期，格式 'YYYY-MM-DD'
 
         Returns:
-            List[Dict]: 每个应用的 {'name','hours','minutes'} 列表，按时长降序
+            List[Dict]: 每个应用的 {'name','seconds','hours','minutes','session_count'} 列表，按时长降序
         """
-        # Normalize dates - basic validation
-        try:
-            # ensure parseable
-            _ = datetime.strptime(start_date, "%Y-%m-%d")
-            _ = datetime.strptime(end_date, "%Y-%m-%d")
-        except Exception:
-            raise ValueError("start_date 和 end_date 必须为 'YYYY-MM-DD' 格式")
-
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 先检查是否有该日期范围内的数据
-            cursor.execute('''
-                            SELECT COUNT(*) FROM window_sessions 
-                            WHERE DATE(start_time) >= DATE(?) AND DATE(start_time) <= DATE(?)
-                            ''', (start_date, end_date))
-            count = cursor.fetchone()[0]
-            print(f"DEBUG: 日期范围 {start_date} 到 {end_date} 中有 {count} 条记录")
-            
-            cursor.execute('''
-                            SELECT p.name, SUM(ws.duration_seconds) as total_seconds
-                            FROM window_sessions ws
-                                    JOIN processes p ON ws.process_id = p.id
-                            WHERE DATE(ws.start_time) >= DATE(?) AND DATE(ws.start_time) <= DATE(?)
-                            GROUP BY p.name
-                            ORDER BY total_seconds DESC
-                            ''', (start_date, end_date))
-
-            app_usage = []
-            for name, seconds in cursor.fetchall():
-                seconds = seconds or 0
-                app_usage.append({
-                    'name': name,
-                    'hours': round(seconds / 3600, 2),
-                    'minutes': seconds // 60
-                })
-            
-            print(f"DEBUG: 获取到 {len(app_usage)} 个应用的使用数据")
-
-            return app_usage
\ No newline at end of file
+        return self.get_summary(start_date, end_date)['app_usage']
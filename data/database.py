@@ -1,19 +1,121 @@
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Optional, Tuple, List, Dict, Any
+from typing import Callable, Optional, Tuple, List, Dict, Any, NamedTuple
 from .database_utils import*
+from .connection_manager import get_connection_manager
+from .migrations import apply_migrations
+from .archive import (archive_directory, archive_month, archivable_months, archived_months_between,
+                      delete_archived_days, remove_orphan_files)
+
+
+class SessionInfo(NamedTuple):
+    """当前打开的会话（内存中的权威副本）"""
+    process_name: str
+    window_title: str
+    start_time: str
+    session_id: Optional[int]  # 写线程提交前为 None
+
+
+class TodayUsage:
+    """
+    今日用量的内存累加器：加载时从 daily_usage 读取，之后每次切换/停止会话时累加刚结束的会话，
+    get_today_summary 不需要查询数据库
+    """
+
+    def __init__(self):
+        self.day: Optional[str] = None
+        self.day_start = self.day_end = 0
+        # 应用名 -> [秒数, 会话数]
+        self.apps: Dict[str, List[int]] = {}
+        self.first_ts: Optional[int] = None
+        self.last_ts: Optional[int] = None
+
+    def load(self, conn: sqlite3.Connection, day: str) -> None:
+        """从汇总表读取 day 当天已结束会话的用量（与 DataAnalyzer.get_summary 的统计口径相同）"""
+        self.day = day
+        self.day_start, self.day_end = epoch_bounds(day, day)
+        self.apps = {name: [seconds, count] for name, seconds, count in conn.execute('''
+            SELECT p.name, SUM(usage.seconds), SUM(usage.session_count)
+            FROM daily_usage usage
+                     JOIN processes p ON p.id = usage.process_id
+            WHERE usage.day = ?
+            GROUP BY p.name
+        ''', (day,))}
+        self.first_ts, self.last_ts = conn.execute('''
+            SELECT (SELECT MIN(start_ts) FROM window_sessions WHERE start_ts >= :start AND start_ts < :end),
+                   (SELECT MAX(end_ts) FROM window_sessions WHERE end_ts > :start AND end_ts <= :end)
+        ''', {'start': self.day_start, 'end': self.day_end}).fetchone()
+
+    def add_closed(self, process_name: str, start_ts: int, end_ts: int) -> None:
+        """累加一个刚结束的会话落在今天的部分"""
+        if self.day is None:
+            return
+        seconds = min(end_ts, self.day_end) - max(start_ts, self.day_start)
+        starts_today = self.day_start <= start_ts < self.day_end
+        if seconds <= 0 and not starts_today:
+            return
+        app = self.apps.setdefault(process_name, [0, 0])
+        app[0] += max(seconds, 0)
+        if starts_today:
+            app[1] += 1
+            self.first_ts = start_ts if self.first_ts is None else min(self.first_ts, start_ts)
+        if self.day_start < end_ts <= self.day_end:
+            self.last_ts = end_ts if self.last_ts is None else max(self.last_ts, end_ts)
+
+    def summary(self) -> Dict[str, Any]:
+        """已结束会话的今日摘要（DataAnalyzer.get_summary 格式）"""
+        return summarize_usage(self.day, self.day, [(name, seconds, count)
+                                                    for name, (seconds, count) in self.apps.items()],
+                               self.first_ts, self.last_ts)
+
+
+# 范围删除时每个写事务最多删除的会话数
+DELETE_CHUNK_SIZE = 500
+
+# 当前会话心跳的最小间隔（秒）：追踪循环每秒调用 heartbeat()，但只有间隔到了才写库
+HEARTBEAT_INTERVAL = 30
 
 
 class ActivityDatabase:
     def __init__(self, db_path: str = "activity.db"):
         """初始化数据库连接"""
         self.db_path = db_path
+        # 已提交的当前会话 ID，供其他线程读取（只在提交回调中更新）
         self.current_session_id: Optional[int] = None
+        # 写线程内部的当前会话 ID 及对应的状态序号（只在写线程中修改）
+        self._open_session_id: Optional[int] = None
+        self._open_token = 0
+        # 调用方线程维护的当前会话；每次切换/停止都递增 _state_token
+        self._state_lock = threading.Lock()
+        self._current: Optional[SessionInfo] = None
+        self._state_token = 0
+        self._last_heartbeat = 0.0
+        # 今日累计用量（与 _current 一起由 _state_lock 保护）
+        self._today = TodayUsage()
+        # 已计入内存累计、但写线程还没有执行对应命令的会话 [(命令的 token, 应用名, start_ts, end_ts)]，
+        # 重新加载今日累计时数据库里还没有它们，需要重放
+        self._unapplied_closes: List[Tuple[int, str, int, int]] = []
+        # 进程 ID 缓存（只在写线程中使用，启动时预热）
+        self._process_cache = ProcessCache()
+        # 窗口标题 ID 的 LRU 缓存（只在写线程中使用）
+        self._title_cache = TitleCache()
+        # 长连接管理器：写线程 + 每线程读连接（与 DataAnalyzer/ActivityClassifier 共享）
+        self.connections = get_connection_manager(db_path)
+        self._remove_commit_hook = self.connections.add_commit_hook(self._on_commit)
         self._init_database()
+        # 清理上次归档/删除时提交失败或未来得及删除的归档文件
+        self.connections.submit(self._remove_orphan_archives_command, [archive_directory(db_path)], quiet=True)
 
     # initialize the database
     def _init_database(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.writer() as conn:
+            # 必须在建表/开启事务之前设置，旧数据库会执行一次 VACUUM
+            enable_incremental_vacuum(conn)
+
             cursor = conn.cursor()
 
             # The Table of process
@@ -38,17 +140,25 @@ class ActivityDatabase:
     FOREIGN KEY (process_id) REFERENCES processes (id))'''
             cursor.execute(sql2)
 
-            # 索引
+            # 索引（会话表的时间索引由迁移创建）
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_processes_name ON processes(name)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_time ON window_sessions(start_time)')
 
-            conn.commit()
+            # 结构迁移（按 user_version 依次执行）
+            apply_migrations(conn)
+
+            # 上次异常退出留下的未结束会话：在最后一次心跳处结束
+            recover_open_sessions(conn)
+
+            self._process_cache.load(conn)
+            self._title_cache.clear()
+            self._today.load(conn, local_day(datetime.now()))
 
     def record_window_switch(self, process_name: str, window_title: str,
                              executable_path: Optional[str] = None) -> bool:
         """
         Record the incident of switching between two windows.
         Call this function when a different foreground window has been detected
+        写入由写线程异步完成，调用方不会等待磁盘提交
 
         :param:
             process_name: 进程名称
@@ -56,175 +166,344 @@ class ActivityDatabase:
             executable_path: 可执行文件路径（可选）
 
         :return:
-            bool: 记录是否成功
+            bool: 记录请求是否已提交
         """
         try:
             # jump all the invalid data
             if not process_name or not window_title.strip():
                 return False
 
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            self.switch_session(process_name, window_title, executable_path)
+            return True
+
+        except Exception as e:
+            print(f"❌ 窗口切换记录失败: {e}")
+            return False
 
-                # 1. get or create the record of process
-                process_id = get_or_create_process(self.db_path, process_name, executable_path)
-                if process_id is None:
-                    print("❌ 获取进程ID失败")
-                    return False
+    def switch_session(self, process_name: str, window_title: str,
+                       executable_path: Optional[str] = None,
+                       switch_time: Optional[datetime] = None) -> Future:
+        """
+        原子地切换会话：结束上一个会话、获取进程 ID、开始新会话在同一个 SAVEPOINT 中完成，
+        任何一步失败都整体回滚，不会留下孤立或未结束的会话
 
-                # 2. end the current conversation
-                if self.current_session_id is not None:
-                    #print('has current_session_id')
-                    self.stop_current_session(None)
+        Args:
+            process_name: 进程名称
+            window_title: 窗口标题
+            executable_path: 可执行文件路径（可选）
+            switch_time: 切换时间；默认取调用时刻，作为旧会话的结束时间和新会话的开始时间
 
-                # 3. start a new conversation
-                self.current_session_id = start_window_session(self.db_path, process_id, window_title)
+        Returns:
+            Future: 提交后给出新会话 ID
+        """
+        if switch_time is None:
+            switch_time = datetime.now()
+
+        # 先更新内存中的当前会话，追踪循环之后的比较不再需要访问数据库；
+        # 在锁内提交写命令，保证 token 顺序与写线程中的执行顺序一致
+        with self._state_lock:
+            self._state_token += 1
+            token = self._state_token
+            self._close_current_in_memory(switch_time, token)
+            self._current = SessionInfo(process_name, window_title,
+                                        switch_time.strftime(TIME_FORMAT), None)
+
+            return self.connections.submit(self._switch_command, process_name, window_title,
+                                           executable_path, switch_time, token)
+
+    def _close_current_in_memory(self, end_time: datetime, token: int) -> None:
+        """
+        把内存中的当前会话计入今日累计（调用方持有 _state_lock）
+        token 是把这次结束写入数据库的命令的序号，命令执行前重新加载今日累计时据此重放
+        """
+        if self._current is not None:
+            start_ts = to_epoch(datetime.strptime(self._current.start_time, TIME_FORMAT))
+            end_ts = max(to_epoch(end_time), start_ts)
+            self._today.add_closed(self._current.process_name, start_ts, end_ts)
+            self._unapplied_closes.append((token, self._current.process_name, start_ts, end_ts))
+
+    def _mark_closes_applied(self, token: int) -> None:
+        """写线程中执行：序号不大于 token 的命令已执行，对应的会话不再需要重放"""
+        with self._state_lock:
+            if self._unapplied_closes:
+                self._unapplied_closes = [close for close in self._unapplied_closes if close[0] > token]
+
+    def _switch_command(self, conn: sqlite3.Connection, process_name: str, window_title: str,
+                        executable_path: Optional[str], switch_time: datetime, token: int) -> int:
+        """写线程中执行：结束旧会话并开始新会话（失败时抛出异常以回滚整个切换）"""
+        self._mark_closes_applied(token)
+        try:
+            process_id = get_or_create_process(conn, process_name, executable_path, self._process_cache)
+            if process_id is None:
+                raise sqlite3.DatabaseError(f"获取进程ID失败: {process_name}")
+            title_id = get_or_create_title(conn, window_title, self._title_cache)
+
+            session_id = switch_window_session(conn, self._open_session_id, process_id,
+                                               title_id, switch_time)
+        except Exception:
+            # 切换失败：清空内存状态，让追踪循环下一次重新记录
+            self._reset_current(token)
+            raise
+
+        self._open_session_id = session_id
+        self._open_token = token
+        return session_id
+
+    def _reset_current(self, token: int) -> None:
+        """如果内存中的当前会话仍对应 token，则清空它"""
+        with self._state_lock:
+            if self._state_token == token:
+                self._current = None
+
+    def _on_commit(self) -> None:
+        """写线程提交后调用：把写线程中的会话状态发布给其他线程"""
+        self.current_session_id = self._open_session_id
+        with self._state_lock:
+            if self._current is not None and self._state_token == self._open_token:
+                self._current = self._current._replace(session_id=self._open_session_id)
+
+    def heartbeat(self, beat_time: Optional[datetime] = None) -> bool:
+        """
+        追踪循环每次检测到活动时调用；每 HEARTBEAT_INTERVAL 秒最多写一次，
+        把当前时间记为打开会话的临时结束时间，崩溃后最多丢失一个间隔的数据
 
-                # 🎯 检验新对话是否创建成功
-                if self.current_session_id is None:
-                    print("❌ 创建新会话失败")
-                    return False
+        Returns:
+            bool: 本次是否提交了心跳写入
+        """
+        if self._current is None:
+            return False
 
-                # # 验证会话是否真的存在于数据库中
-                # if not self._verify_session_exists(self.current_session_id):
-                #     print("❌ 会话在数据库中不存在")
-                #     self.current_session_id = None
-                #     return False
+        now = time.monotonic()
+        if now - self._last_heartbeat < HEARTBEAT_INTERVAL:
+            return False
+        self._last_heartbeat = now
 
-                # print(f"✅ 成功创建会话: ID={self.current_session_id}, 进程={process_name}, 窗口={window_title}")
-                return True
+        # 心跳只更新 last_heartbeat（崩溃恢复用），不使查询缓存失效
+        self.connections.submit(self._heartbeat_command, beat_time or datetime.now(), quiet=True)
+        return True
 
-        except Exception as e:
-            print(f"❌ 窗口切换记录失败: {e}")
+    def _heartbeat_command(self, conn: sqlite3.Connection, beat_time: datetime) -> bool:
+        """写线程中执行：更新当前会话的心跳时间"""
+        if self._open_session_id is None:
             return False
+        return heartbeat_window_session(conn, self._open_session_id, beat_time)
 
-    def get_current_session_info(self) -> Optional[Tuple]:
+    def is_current_window(self, process_name: str, window_title: str) -> bool:
+        """前台窗口是否就是当前会话的窗口（纯内存比较）"""
+        current = self._current
+        return (current is not None
+                and current.process_name == process_name
+                and current.window_title == window_title)
+
+    def get_current_session_info(self) -> Optional[SessionInfo]:
         """
-        获取当前活跃会话信息
+        获取当前活跃会话信息（直接读取内存，不访问数据库）
 
         Returns:
-            Optional[Tuple]: (process_name, window_title, start_time, session_id) 或 None
+            Optional[SessionInfo]: (process_name, window_title, start_time, session_id) 或 None
         """
-        # 检查是否有当前会话
-        if self.current_session_id is None:
-            return None
+        return self._current
 
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                # 查询当前会话的详细信息
-                cursor.execute('''
-                                SELECT p.name as process_name,
-                                        ws.window_title,
-                                        ws.start_time,
-                                        ws.id  as session_id
-                                FROM window_sessions ws
-                                        JOIN processes p ON ws.process_id = p.id
-                                WHERE ws.id = ?
-                                    AND ws.end_time IS NULL
-                                ''', (self.current_session_id,))
-
-                result = cursor.fetchone()
-
-                if result:
-                    #process_name, window_title, start_time, session_id = result
-                    return result
-                else:
-                    print('数据库中没有找到对应的会话，重置当前会话ID')
-                    self.current_session_id = None
-                    return None
-
-        except Exception as e:
-            print(f"❌ 获取当前会话信息失败: {e}")
-            return None
+    def get_today_summary(self) -> Dict[str, Any]:
+        """
+        今日使用摘要（DataAnalyzer.get_summary 格式），由内存中的今日累计加上当前会话已经过的时长得到，
+        不查询数据库；跨过午夜后第一次调用时在写线程中从汇总表重新加载
+        """
+        now = datetime.now()
+        today = local_day(now)
+        if self._today.day != today:
+            self.connections.submit(self._load_today_command, today, wait=True)
+
+        with self._state_lock:
+            summary = self._today.summary()
+            current = self._current
+        if current is None:
+            return summary
+        start_ts = to_epoch(datetime.strptime(current.start_time, TIME_FORMAT))
+        return merge_open_session(summary, current.process_name, start_ts, to_epoch(now))
+
+    def _load_today_command(self, conn: sqlite3.Connection, day: str) -> None:
+        """
+        写线程中执行：重新加载今日累计
+        之前执行的切换都已写入数据库；已经计入内存、但命令排在本命令之后的会话在加载后重放
+        """
+        with self._state_lock:
+            self._today.load(conn, day)
+            for _, process_name, start_ts, end_ts in self._unapplied_closes:
+                self._today.add_closed(process_name, start_ts, end_ts)
 
-    def stop_current_session(self,endTime:Optional[datetime]) -> bool:
+    def stop_current_session(self, endTime: Optional[datetime] = None) -> bool:
         """
-        停止当前活跃会话
+        停止当前活跃会话（等待写线程提交）
         Returns:
             bool: 是否成功停止
         """
-        if self.current_session_id is None : return False
-
-        # TODO : acccomplish in utils
-        
         try:
-            return end_window_session(self.db_path, self.current_session_id,endTime)
+            with self._state_lock:
+                self._state_token += 1
+                token = self._state_token
+                self._close_current_in_memory(endTime or datetime.now(), token)
+                self._current = None
+                future = self.connections.submit(self._stop_command, endTime, token, urgent=True)
+
+            return future.result()
 
         except Exception as e:
             print("falied when stop_current_session()",e)
             return False
 
-    def delete_today_data(self) -> int:
-        """删除今日的所有 window_sessions 记录（本地时间），并返回删除的行数"""
-        try:
-            today = datetime.now().strftime("%Y-%m-%d")
+    def _stop_command(self, conn: sqlite3.Connection, end_time: Optional[datetime], token: int) -> bool:
+        """写线程中执行：结束当前会话"""
+        self._mark_closes_applied(token)
+        self._open_token = token
+        if self._open_session_id is None:
+            return False
 
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+        stopped = end_window_session(conn, self._open_session_id, end_time)
+        self._open_session_id = None
+        return stopped
 
-                # Count rows to be deleted
-                cursor.execute(
-                    "SELECT COUNT(*) FROM window_sessions WHERE DATE(start_time) = DATE(?)",
-                    (today,)
-                )
-                count = cursor.fetchone()[0] or 0
+    def _forget_deleted_session(self, conn: sqlite3.Connection) -> None:
+        """写线程中执行：如果当前会话的记录已被删除，则不再追踪它"""
+        if self._open_session_id is None:
+            return
+        cursor = conn.execute("SELECT 1 FROM window_sessions WHERE id = ?", (self._open_session_id,))
+        if cursor.fetchone() is None:
+            self._open_session_id = None
+            self._reset_current(self._open_token)
 
-                # Delete rows
-                cursor.execute(
-                    "DELETE FROM window_sessions WHERE DATE(start_time) = DATE(?)",
-                    (today,)
-                )
-                conn.commit()
-                return count
+    def flush(self) -> None:
+        """等待所有已提交的写入完成"""
+        self.connections.flush()
+
+    def delete_today_data(self, progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """删除今日的所有 window_sessions 记录（本地时间），并返回删除的行数"""
+        try:
+            today = datetime.now().strftime("%Y-%m-%d")
+            return self._delete_days(today, today, progress)
 
         except Exception as e:
             print(f"Error deleting today's data: {e}")
             return 0
 
-    def delete_range(self, start_date: str, end_date: str) -> int:
+    def delete_range(self, start_date: str, end_date: str,
+                     progress: Optional[Callable[[int, int], None]] = None) -> int:
         """删除指定范围内的 window_sessions 记录（使用本地时间），返回删除的行数"""
         try:
             # Ensure correct date format
             start = datetime.strptime(start_date, "%Y-%m-%d").strftime("%Y-%m-%d")
             end = datetime.strptime(end_date, "%Y-%m-%d").strftime("%Y-%m-%d")
-
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                # Count rows
-                cursor.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM window_sessions
-                    WHERE DATE (start_time) >= DATE (?)
-                      AND DATE (start_time) <= DATE (?)
-                    """,
-                    (start, end)
-                )
-                count = cursor.fetchone()[0] or 0
-
-                # Delete rows
-                cursor.execute(
-                    """
-                    DELETE
-                    FROM window_sessions
-                    WHERE DATE(start_time) >= DATE(?)
-                      AND DATE(start_time) <= DATE(?)
-                    """,
-                    (start, end)
-                )
-                conn.commit()
-                return count
+            return self._delete_days(start, end, progress)
 
         except Exception as e:
             print(f"Error deleting range data: {e}")
             return 0
 
+    def _delete_days(self, start: str, end: str,
+                     progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        分块删除 [start, end] 日期范围内的会话（包括已归档月份中的会话），最后回收空闲页
+        每块是一条单独提交的写命令，块与块之间写线程可以继续处理窗口切换，
+        不会长时间占住写锁
+
+        Args:
+            progress: 每删除一块后调用 progress(已删除行数, 预计总行数)
+
+        Returns:
+            int: 删除的行数
+        """
+        start_day, end_day = day_bounds(start, end)
+        # 只用于进度显示：在 day 索引上计数，不回表
+        total = self.connections.reader().execute(
+            "SELECT COUNT(*) FROM window_sessions WHERE day >= ? AND day < ?",
+            (start_day, end_day)).fetchone()[0]
+
+        deleted = 0
+        while True:
+            count = self.connections.submit(self._delete_chunk_command, start_day, end_day,
+                                            DELETE_CHUNK_SIZE, wait=True)
+            deleted += count
+            if progress is not None and count:
+                progress(deleted, max(total, deleted))
+            if count < DELETE_CHUNK_SIZE:
+                break
+
+        # 已归档月份的会话不在 window_sessions 中，逐月从归档文件中删除（每个月一条写命令）
+        months = archived_months_between(self.connections.reader(), start_day, end_day)
+        for month, _ in months:
+            count = self.connections.submit(delete_archived_days, month, start_day, end_day, wait=True)
+            deleted += count
+            if progress is not None and count:
+                progress(deleted, max(total, deleted))
+        if months:
+            # 被重写或删空的月份的旧文件在上面的命令提交之后才删除
+            self.connections.submit(self._remove_orphan_archives_command,
+                                    [os.path.dirname(path) for _, path in months], quiet=True, wait=True)
+
+        if deleted:
+            if start_day <= self._today.day < end_day:
+                self.connections.submit(self._load_today_command, self._today.day)
+            self.connections.submit(reclaim_free_pages)
+        return deleted
+
+    def _delete_chunk_command(self, conn: sqlite3.Connection, start_day: str, end_day: str,
+                              limit: int) -> int:
+        """写线程中执行：删除半开区间 [start_day, end_day) 内最多 limit 条会话"""
+        count = delete_sessions_chunk(conn, start_day, end_day, limit)
+        if count:
+            self._forget_deleted_session(conn)
+        return count
+
+    def _remove_orphan_archives_command(self, conn: sqlite3.Connection, directories: List[str]) -> int:
+        """写线程中执行：删除不再被 archived_months 引用的归档文件（见 archive.remove_orphan_files）"""
+        return remove_orphan_files(conn, directories, self.connections.reader())
+
+    def rebuild_usage_rollups(self, start_date: Optional[str] = None,
+                              end_date: Optional[str] = None) -> int:
+        """
+        从会话明细重新生成日/小时用量汇总（默认全部日期），返回生成的日汇总行数
+        正常情况下汇总随会话结束自动更新，只在修复数据时需要调用
+        """
+        return self.connections.submit(rebuild_usage_rollups, start_date, end_date, wait=True)
+
+    def archive_months(self, before_month: Optional[str] = None,
+                       directory: Optional[str] = None) -> Dict[str, int]:
+        """
+        把已经结束的月份的会话明细移入列式归档文件（见 data/archive.py），日/小时汇总保留
+        每个月是一条单独提交的写命令
+
+        Args:
+            before_month: 只归档该月份（'YYYY-MM'）之前的数据，默认且最晚为本月
+            directory: 归档目录，默认为数据库旁边的 archive/
+
+        Returns:
+            Dict[str, int]: {月份: 归档的会话数}
+        """
+        current = datetime.now().strftime("%Y-%m")
+        before = min(before_month or current, current)
+        directory = archive_directory(self.db_path, directory)
+
+        self.flush()
+        archived = {}
+        for month in archivable_months(self.connections.reader(), before):
+            try:
+                count = self.connections.submit(archive_month, month, directory, wait=True)
+            except Exception as e:
+                print(f"❌ 归档 {month} 失败: {e}")
+                break
+            if count:
+                archived[month] = count
+
+        # 重新归档的月份的旧文件、失败的月份写到一半的文件在提交之后删除
+        self.connections.submit(self._remove_orphan_archives_command, [directory], quiet=True, wait=True)
+        if archived:
+            self.connections.submit(reclaim_free_pages)
+        return archived
+
     def close(self) -> None:
-        """关闭数据库连接（如有需要）"""
-        pass
+        """关闭数据库连接"""
+        self._remove_commit_hook()
+        self.connections.close()
 
     def __enter__(self):
         """上下文管理器支持"""
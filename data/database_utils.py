@@ -1,83 +1,361 @@
+import itertools
 import sqlite3
-from datetime import datetime
-from typing import Optional, Tuple, List, Dict, Any
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple, List, Dict, Any, Iterable, Iterator, Sequence
 
 
-def get_or_create_process(db_path: str, process_name: str,
-                          executable_path: Optional[str] = None) -> Optional[int]:
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def to_epoch(value: datetime) -> int:
+    """本地时间 -> Unix 时间戳（秒）"""
+    return int(value.timestamp())
+
+
+def local_day(value: datetime) -> str:
+    """本地时间所在的日期 'YYYY-MM-DD'（对应 window_sessions.day）"""
+    return value.strftime(DAY_FORMAT)
+
+
+def day_bounds(start_date: str, end_date: str) -> Tuple[str, str]:
+    """
+    闭区间 [start_date, end_date] -> 半开区间 [start_date, end_date 的下一天)
+    用于 day >= ? AND day < ? 形式的查询，可以直接使用 day 索引
+    """
+    next_day = datetime.strptime(end_date, DAY_FORMAT) + timedelta(days=1)
+    return start_date, next_day.strftime(DAY_FORMAT)
+
+
+def epoch_bounds(start_date: str, end_date: str) -> Tuple[int, int]:
+    """闭区间 [start_date, end_date] -> 本地午夜时间戳组成的半开区间 [start_ts, end_ts)"""
+    start, end = day_bounds(start_date, end_date)
+    return (to_epoch(datetime.strptime(start, DAY_FORMAT)),
+            to_epoch(datetime.strptime(end, DAY_FORMAT)))
+
+
+# 已知进程的 last_seen 最多每隔这么久（秒）写一次
+PROCESS_TOUCH_INTERVAL = 300
+
+
+class ProcessCache:
+    """
+    (name, executable_path) -> 进程 ID 的内存缓存
+    进程 ID 一经创建就不再变化，所以缓存永远不会过期；只在写线程中使用
+    """
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, Optional[str]], int] = {}
+        self._touched: Dict[int, float] = {}
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        """启动时一次性载入所有已知进程"""
+        self._ids = {
+            (name, executable_path): process_id
+            for process_id, name, executable_path
+            in conn.execute('SELECT id, name, executable_path FROM processes')
+        }
+        self._touched.clear()
+
+    def get(self, process_name: str, executable_path: Optional[str]) -> Optional[int]:
+        return self._ids.get((process_name, executable_path))
+
+    def put(self, process_name: str, executable_path: Optional[str], process_id: int) -> None:
+        self._ids[(process_name, executable_path)] = process_id
+        self._touched[process_id] = time.monotonic()
+
+    def should_touch(self, process_id: int) -> bool:
+        """距离上次更新 last_seen 超过 PROCESS_TOUCH_INTERVAL 时返回 True 并记录本次时间"""
+        now = time.monotonic()
+        last = self._touched.get(process_id)
+        if last is not None and now - last < PROCESS_TOUCH_INTERVAL:
+            return False
+        self._touched[process_id] = now
+        return True
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._touched.clear()
+
+
+def get_or_create_process(conn: sqlite3.Connection, process_name: str,
+                          executable_path: Optional[str] = None,
+                          cache: Optional[ProcessCache] = None) -> Optional[int]:
     """
-    获取或创建进程记录（使用 UPSERT 方式）
+    获取或创建进程记录（使用 UPSERT 方式，已有记录的 ID 保持不变）
+    命中缓存时不查询 processes，只按需延迟更新 last_seen
+    事务由调用方（ConnectionManager.writer）负责提交
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-
-            # 使用本地时间
-            cursor.execute('''
-                INSERT OR REPLACE INTO processes (name, executable_path, last_seen)
-                VALUES (?, ?, datetime('now','localtime'))
-            ''', (process_name, executable_path))
-
-            cursor.execute('''
-                SELECT id
-                FROM processes
-                WHERE name = ?
-                  AND (executable_path = ? OR (executable_path IS NULL AND ? IS NULL))
-            ''', (process_name, executable_path, executable_path))
-
-            result = cursor.fetchone()
-            conn.commit()
-            return result[0] if result else None
+        cursor = conn.cursor()
+
+        if cache is not None:
+            process_id = cache.get(process_name, executable_path)
+            if process_id is not None:
+                if cache.should_touch(process_id):
+                    cursor.execute('''
+                        UPDATE processes SET last_seen = datetime('now','localtime') WHERE id = ?
+                    ''', (process_id,))
+                return process_id
+
+        # 使用本地时间
+        cursor.execute('''
+            INSERT INTO processes (name, executable_path, first_seen, last_seen)
+            VALUES (?, ?, datetime('now','localtime'), datetime('now','localtime'))
+            ON CONFLICT (name, IFNULL(executable_path, ''))
+                DO UPDATE SET last_seen = excluded.last_seen
+        ''', (process_name, executable_path))
+
+        cursor.execute('''
+            SELECT id
+            FROM processes
+            WHERE name = ?
+              AND IFNULL(executable_path, '') = IFNULL(?, '')
+        ''', (process_name, executable_path))
+
+        result = cursor.fetchone()
+        if result is None:
+            return None
+
+        if cache is not None:
+            cache.put(process_name, executable_path, result[0])
+        return result[0]
 
     except sqlite3.Error as e:
         print(f"❌ 数据库错误 - 获取/创建进程失败: {e}")
         return None
 
 
+# 标题 ID 缓存的最大条目数（标题种类远多于进程，只保留最近使用的）
+TITLE_CACHE_SIZE = 4096
 
-def get_session_details(db_path: str, session_id: int) -> Optional[Tuple]:
+
+class TitleCache:
+    """
+    窗口标题 -> titles.id 的 LRU 缓存
+    标题 ID 同样不会变化；只在写线程中使用，所以不加锁
+    """
+
+    def __init__(self, maxsize: int = TITLE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+
+    def get(self, title: str) -> Optional[int]:
+        title_id = self._ids.get(title)
+        if title_id is not None:
+            self._ids.move_to_end(title)
+        return title_id
+
+    def put(self, title: str, title_id: int) -> None:
+        self._ids[title] = title_id
+        self._ids.move_to_end(title)
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def get_or_create_title(conn: sqlite3.Connection, title: str,
+                        cache: Optional[TitleCache] = None) -> int:
+    """
+    获取或创建窗口标题记录，返回 titles.id
+    命中缓存时不访问数据库；出错时直接抛出异常，由调用方的事务回滚
+    """
+    if cache is not None:
+        title_id = cache.get(title)
+        if title_id is not None:
+            return title_id
+
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR IGNORE INTO titles (title) VALUES (?)', (title,))
+    if cursor.rowcount > 0:
+        title_id = cursor.lastrowid
+    else:
+        title_id = cursor.execute('SELECT id FROM titles WHERE title = ?', (title,)).fetchone()[0]
+
+    if cache is not None:
+        cache.put(title, title_id)
+    return title_id
+
+
+def get_session_details(conn: sqlite3.Connection, session_id: int) -> Optional[Tuple]:
     """
     获取会话详细信息
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT p.name,
-                       ws.window_title,
-                       ws.start_time,
-                       ws.id
-                FROM window_sessions ws
-                JOIN processes p ON ws.process_id = p.id
-                WHERE ws.id = ?
-            ''', (session_id,))
-            return cursor.fetchone()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.name,
+                   t.title,
+                   ws.start_time,
+                   ws.id
+            FROM window_sessions ws
+            JOIN processes p ON ws.process_id = p.id
+            JOIN titles t ON ws.title_id = t.id
+            WHERE ws.id = ?
+        ''', (session_id,))
+        return cursor.fetchone()
     except Exception as e:
         print(f"❌ 获取会话详情失败: {e}")
         return None
 
 
+# iter_sessions 可选的列：记录属性名 -> SQL 表达式
+SESSION_COLUMNS = {
+    'id': 'ws.id',
+    'process': 'p.name',
+    'window_title': 't.title',
+    'start_time': 'ws.start_time',
+    'end_time': 'ws.end_time',
+    'duration_seconds': 'ws.duration_seconds',
+    'start_ts': 'ws.start_ts',
+    'end_ts': 'ws.end_ts',
+    'day': 'ws.day',
+}
+DEFAULT_SESSION_COLUMNS = ('process', 'window_title', 'start_time', 'duration_seconds')
+# 每次 fetchmany 读取的行数
+SESSION_BATCH_SIZE = 1000
+
+
+class SessionRecord:
+    """iter_sessions 返回的会话记录，未查询的列为 None"""
+    __slots__ = tuple(SESSION_COLUMNS)
+
+    def __init__(self, columns: Sequence[str], values: Sequence[Any]):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        for name, value in zip(columns, values):
+            setattr(self, name, value)
 
-def start_window_session(db_path: str, process_id: int, window_title: str) -> Optional[int]:
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__
+                           if getattr(self, name) is not None)
+        return f"SessionRecord({fields})"
+
+
+def iter_sessions(conn: sqlite3.Connection, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+                  columns: Sequence[str] = DEFAULT_SESSION_COLUMNS, batch_size: int = SESSION_BATCH_SIZE,
+                  newest_first: bool = False, closed_only: bool = False) -> Iterator[SessionRecord]:
     """
-    开始一个新的窗口会话
+    按开始时间顺序逐批读取与 [start_ts, end_ts) 重叠的会话（包括跨边界和仍在进行的会话）
+    每次只用 fetchmany 取 batch_size 行，内存占用与范围大小无关
+
+    Args:
+        start_ts / end_ts: 范围的起止时间戳，None 表示不限
+        columns: 要读取的列，取自 SESSION_COLUMNS
+        newest_first: 为 True 时按开始时间倒序
+        closed_only: 为 True 时跳过仍在进行的会话
     """
+    unknown = [name for name in columns if name not in SESSION_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的会话列: {unknown}")
+    columns = tuple(columns)
+
+    conditions, params = [], []
+    # 与 get_today_activities 相同：end_ts 走索引定位，start_ts 前加 + 避免优化器改用 start_ts 索引扫描全部历史
+    if end_ts is not None:
+        conditions.append('+ws.start_ts < ?')
+        params.append(end_ts)
+    if start_ts is not None:
+        conditions.append('ws.end_ts > ?' if closed_only else '(ws.end_ts > ? OR ws.end_ts IS NULL)')
+        params.append(start_ts)
+    elif closed_only:
+        conditions.append('ws.end_ts IS NOT NULL')
+    order = '+ws.start_ts' if start_ts is not None else 'ws.start_ts'
+
+    cursor = conn.execute(f'''
+        SELECT {', '.join(SESSION_COLUMNS[name] for name in columns)}
+        FROM window_sessions ws
+                 JOIN processes p ON ws.process_id = p.id
+                 JOIN titles t ON ws.title_id = t.id
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY {order} {'DESC' if newest_first else ''}
+    ''', params)
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield SessionRecord(columns, row)
+    finally:
+        cursor.close()
+
 
-            cursor.execute('''
-                INSERT INTO window_sessions (process_id, window_title, start_time, is_foreground)
-                VALUES (?, ?, datetime('now','localtime'), 1)
-            ''', (process_id, window_title))
+def summarize_usage(start_date: str, end_date: str, apps: Iterable[Tuple[str, int, int]],
+                    first_ts: Optional[int], last_ts: Optional[int]) -> Dict[str, Any]:
+    """
+    由按应用汇总的 (名称, 秒数, 会话数) 生成 DataAnalyzer.get_summary 格式的摘要，应用按时长降序、名称升序
+    first_ts / last_ts: 范围内首个会话开始、最后一个会话结束的时间戳（无数据时为 None）
+    """
+    apps = sorted(apps, key=lambda app: (-app[1], app[0]))
+    total_seconds = sum(seconds for _, seconds, _ in apps)
 
-            session_id = cursor.lastrowid
-            conn.commit()
+    def format_ts(ts: Optional[int]) -> Optional[str]:
+        return datetime.fromtimestamp(ts).strftime(TIME_FORMAT) if ts is not None else None
 
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(
-                f"开始新会话: 进程ID={process_id}, 窗口='{window_title}', 会话ID={session_id}, 开始时间={current_time}")
-            return session_id
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_seconds': total_seconds,
+        'total_hours': round(total_seconds / 3600, 2),
+        'total_minutes': total_seconds // 60,
+        'session_count': sum(count for _, _, count in apps),
+        'first_activity': format_ts(first_ts),
+        'last_activity': format_ts(last_ts),
+        'app_usage': [{
+            'name': name,
+            'seconds': seconds,
+            'hours': round(seconds / 3600, 2),
+            'minutes': seconds // 60,
+            'session_count': count
+        } for name, seconds, count in apps]
+    }
+
+
+def merge_open_session(summary: Dict[str, Any], process_name: str, start_ts: int, now_ts: int) -> Dict[str, Any]:
+    """
+    把仍在进行的会话（到 now_ts 为止的部分）合并进 summarize_usage 格式的摘要，返回新的摘要
+    打开的会话在数据库中时长为 0，只在内存中计算，不写库
+    """
+    range_start, range_end = epoch_bounds(summary['start_date'], summary['end_date'])
+    seconds = min(now_ts, range_end) - max(start_ts, range_start)
+    starts_in_range = range_start <= start_ts < range_end
+    if seconds <= 0 and not starts_in_range:
+        return summary
+
+    apps = {item['name']: [item['seconds'], item['session_count']] for item in summary['app_usage']}
+    app = apps.setdefault(process_name, [0, 0])
+    app[0] += max(seconds, 0)
+    app[1] += starts_in_range
+
+    def parse_ts(value: Optional[str]) -> Optional[int]:
+        return to_epoch(datetime.strptime(value, TIME_FORMAT)) if value is not None else None
+
+    first_ts = parse_ts(summary['first_activity'])
+    if starts_in_range and (first_ts is None or start_ts < first_ts):
+        first_ts = start_ts
+    last_ts = parse_ts(summary['last_activity'])
+    if range_start < now_ts <= range_end:
+        last_ts = now_ts if last_ts is None else max(last_ts, now_ts)
+
+    return summarize_usage(summary['start_date'], summary['end_date'],
+                           [(name, secs, count) for name, (secs, count) in apps.items()], first_ts, last_ts)
+
+
+def start_window_session(conn: sqlite3.Connection, process_id: int, window_title: str) -> Optional[int]:
+    """
+    开始一个新的窗口会话
+    """
+    try:
+        title_id = get_or_create_title(conn, window_title)
+        return switch_window_session(conn, None, process_id, title_id, datetime.now())
 
     except sqlite3.Error as e:
         print(f"❌ 数据库错误 - 开始会话失败: {e}")
@@ -85,57 +363,265 @@ def start_window_session(db_path: str, process_id: int, window_title: str) -> Op
 
 
 
-def end_window_session(db_path: str, session_id: int, specific_time: Optional[datetime]) -> bool:
+# 切换会话时使用的语句：SQL 文本固定，sqlite3 会复用已编译的语句
+_END_SESSION_AT_SQL = '''
+    UPDATE window_sessions
+    SET end_time = ?,
+        end_ts = ?,
+        duration_seconds = ? - start_ts
+    WHERE id = ?
+      AND end_time IS NULL
+'''
+
+_START_SESSION_AT_SQL = '''
+    INSERT INTO window_sessions (process_id, title_id, start_time, start_ts, day, is_foreground)
+    VALUES (?, ?, ?, ?, ?, 1)
+'''
+
+
+def _close_session(cursor: sqlite3.Cursor, session_id: int, end_time: datetime) -> bool:
+    """按给定时间结束会话并计入日用量汇总，返回是否有会话被结束"""
+    end_ts = to_epoch(end_time)
+    cursor.execute(_END_SESSION_AT_SQL, (end_time.strftime(TIME_FORMAT), end_ts, end_ts, session_id))
+    if cursor.rowcount == 0:
+        return False
+    update_usage_rollups(cursor, [session_id])
+    return True
+
+
+def split_by_hour(start_ts: int, end_ts: int) -> List[Tuple[str, int, int]]:
+    """
+    把时间段 [start_ts, end_ts) 按本地整点切分
+    每一段归属于它开始时刻的本地日期和小时，跨午夜的会话因此会分到两天；
+    夏令时切换时按本地时间计算（回拨时同一小时出现两段，会在汇总中合并）
+
+    Returns:
+        List[Tuple[str, int, int]]: (day, hour, seconds) 列表，seconds 之和等于 end_ts - start_ts
+    """
+    pieces = []
+    t = start_ts
+    while t < end_ts:
+        local = datetime.fromtimestamp(t)
+        boundary = min(t - local.minute * 60 - local.second + 3600, end_ts)
+        pieces.append((local.strftime(DAY_FORMAT), local.hour, boundary - t))
+        t = boundary
+    return pieces
+
+
+_UPSERT_DAILY_USAGE_SQL = '''
+    INSERT INTO daily_usage (day, process_id, title_id, seconds, session_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, process_id, title_id)
+        DO UPDATE SET seconds       = seconds + excluded.seconds,
+                      session_count = session_count + excluded.session_count
+'''
+
+_UPSERT_HOURLY_USAGE_SQL = '''
+    INSERT INTO hourly_usage (day, hour, process_id, title_id, seconds)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, hour, process_id, title_id)
+        DO UPDATE SET seconds = seconds + excluded.seconds
+'''
+
+# 汇总所需的会话字段，顺序与 _collect_usage 的解包一致
+_ROLLUP_COLUMNS = 'day, process_id, title_id, start_ts, end_ts'
+
+
+def _collect_usage(rows, start_day: Optional[str] = None, end_day: Optional[str] = None):
+    """
+    把会话按本地日期/小时切分后累加
+    会话次数只计入开始的那一天；给出 [start_day, end_day) 时丢弃范围外的部分
+
+    Returns:
+        (daily, hourly): {(day, process_id, title_id): [seconds, count]},
+                         {(day, hour, process_id, title_id): seconds}
+    """
+    daily: Dict[Tuple[str, int, int], List[int]] = {}
+    hourly: Dict[Tuple[str, int, int, int], int] = {}
+
+    def in_range(day: str) -> bool:
+        return (start_day is None or day >= start_day) and (end_day is None or day < end_day)
+
+    for day, process_id, title_id, start_ts, end_ts in rows:
+        if in_range(day):
+            daily.setdefault((day, process_id, title_id), [0, 0])[1] += 1
+        for piece_day, hour, seconds in split_by_hour(start_ts, end_ts):
+            if not in_range(piece_day):
+                continue
+            daily.setdefault((piece_day, process_id, title_id), [0, 0])[0] += seconds
+            key = (piece_day, hour, process_id, title_id)
+            hourly[key] = hourly.get(key, 0) + seconds
+    return daily, hourly
+
+
+def _write_usage(cursor: sqlite3.Cursor, daily, hourly, sign: int = 1) -> None:
+    """把 _collect_usage 的结果加到（sign=1）或从（sign=-1）汇总表中"""
+    cursor.executemany(_UPSERT_DAILY_USAGE_SQL, [
+        (*key, sign * seconds, sign * count) for key, (seconds, count) in daily.items()
+    ])
+    cursor.executemany(_UPSERT_HOURLY_USAGE_SQL, [
+        (*key, sign * seconds) for key, seconds in hourly.items()
+    ])
+    if sign < 0:
+        cursor.executemany('''
+            DELETE FROM daily_usage
+            WHERE day = ? AND process_id = ? AND title_id = ? AND seconds <= 0 AND session_count <= 0
+        ''', list(daily))
+        cursor.executemany('''
+            DELETE FROM hourly_usage
+            WHERE day = ? AND hour = ? AND process_id = ? AND title_id = ? AND seconds <= 0
+        ''', list(hourly))
+
+
+def update_usage_rollups(cursor: sqlite3.Cursor, session_ids: List[int], sign: int = 1) -> None:
+    """
+    把已结束会话计入（sign=1）或移出（sign=-1）daily_usage / hourly_usage
+    必须与会话的结束/删除在同一个事务中执行，保证汇总与明细一致；
+    未结束的会话不计入汇总
+    """
+    rows = []
+    for start in range(0, len(session_ids), 500):
+        chunk = session_ids[start:start + 500]
+        cursor.execute(f'''
+            SELECT {_ROLLUP_COLUMNS}
+            FROM window_sessions
+            WHERE id IN ({','.join('?' * len(chunk))})
+              AND end_ts IS NOT NULL
+        ''', chunk)
+        rows.extend(cursor.fetchall())
+
+    if rows:
+        _write_usage(cursor, *_collect_usage(rows), sign=sign)
+
+
+def subtract_usage_rows(cursor: sqlite3.Cursor, rows: Iterable[Tuple[str, int, int, int, int]]) -> None:
+    """
+    从 daily_usage / hourly_usage 中扣除不在 window_sessions 中的会话（例如已归档的明细）
+    rows 为 (day, process_id, title_id, start_ts, end_ts)，与 update_usage_rollups 的扣除口径相同
+    """
+    rows = list(rows)
+    if rows:
+        _write_usage(cursor, *_collect_usage(rows), sign=-1)
+
+
+def rebuild_usage_rollups(conn: sqlite3.Connection, start_date: Optional[str] = None,
+                          end_date: Optional[str] = None) -> int:
+    """
+    从 window_sessions 和归档重新生成 daily_usage 和 hourly_usage（闭区间 [start_date, end_date]，默认全部）
+    只读取与范围重叠的会话（end_ts 索引 + start_ts 上界），跨越范围边界的会话只计入范围内的部分
+
+    Returns:
+        int: 范围内生成的日汇总行数
+    """
+    # 归档模块依赖本模块，延迟导入
+    from .archive import archived_rollup_rows
+
+    start_day = end_day = start_ts = end_ts = None
+    day_filter, session_filter, day_params, ts_params = '', '', [], []
+    if start_date is not None:
+        start_day = start_date
+        day_filter += ' AND day >= ?'
+        day_params.append(start_day)
+        # end_ts >= ?：包含恰好在范围起点开始的零时长会话
+        start_ts = epoch_bounds(start_date, start_date)[0]
+        session_filter += ' AND end_ts >= ?'
+        ts_params.append(start_ts)
+    if end_date is not None:
+        end_day = day_bounds(end_date, end_date)[1]
+        day_filter += ' AND day < ?'
+        day_params.append(end_day)
+        end_ts = epoch_bounds(end_date, end_date)[1]
+        session_filter += ' AND +start_ts < ?'
+        ts_params.append(end_ts)
+
+    conn.execute(f'DELETE FROM daily_usage WHERE 1 {day_filter}', day_params)
+    conn.execute(f'DELETE FROM hourly_usage WHERE 1 {day_filter}', day_params)
+    cursor = conn.execute(f'''
+        SELECT {_ROLLUP_COLUMNS}
+        FROM window_sessions
+        WHERE end_ts IS NOT NULL {session_filter}
+    ''', ts_params)
+
+    # 已归档月份的明细不在 window_sessions 中，从归档文件读取
+    rows = itertools.chain(cursor, archived_rollup_rows(conn, start_ts, end_ts))
+    daily, hourly = _collect_usage(rows, start_day, end_day)
+    _write_usage(conn.cursor(), daily, hourly)
+    return len(daily)
+
+
+def switch_window_session(conn: sqlite3.Connection, previous_session_id: Optional[int],
+                          process_id: int, title_id: int, switch_time: datetime) -> int:
+    """
+    结束上一个会话并开始新会话，两者使用同一个时间点，保证会话之间没有空隙
+    出错时直接抛出异常，由调用方的事务（SAVEPOINT）整体回滚
+
+    Returns:
+        int: 新会话 ID
+    """
+    cursor = conn.cursor()
+
+    if previous_session_id is not None:
+        _close_session(cursor, previous_session_id, switch_time)
+
+    cursor.execute(_START_SESSION_AT_SQL, (process_id, title_id, switch_time.strftime(TIME_FORMAT),
+                                           to_epoch(switch_time), local_day(switch_time)))
+    return cursor.lastrowid
+
+
+
+def heartbeat_window_session(conn: sqlite3.Connection, session_id: int, beat_time: datetime) -> bool:
+    """
+    记录会话心跳：把当前时间作为未结束会话的临时结束时间
+    """
+    cursor = conn.execute('''
+        UPDATE window_sessions
+        SET last_heartbeat = ?
+        WHERE id = ?
+          AND end_time IS NULL
+    ''', (beat_time.strftime(TIME_FORMAT), session_id))
+    return cursor.rowcount > 0
+
+
+def recover_open_sessions(conn: sqlite3.Connection) -> int:
+    """
+    启动时调用：把上次异常退出遗留的未结束会话在最后一次心跳处结束
+    没有心跳记录的会话以开始时间结束（时长为 0）
+
+    Returns:
+        int: 恢复的会话数
+    """
+    session_ids = [row[0] for row in conn.execute('SELECT id FROM window_sessions WHERE end_time IS NULL')]
+    if not session_ids:
+        return 0
+
+    cursor = conn.execute('''
+        UPDATE window_sessions
+        SET end_time         = COALESCE(last_heartbeat, start_time),
+            end_ts           = COALESCE(CAST(strftime('%s', last_heartbeat, 'utc') AS INTEGER), start_ts),
+            duration_seconds = COALESCE(CAST(strftime('%s', last_heartbeat, 'utc') AS INTEGER), start_ts)
+                               - start_ts
+        WHERE end_time IS NULL
+    ''')
+    update_usage_rollups(cursor, session_ids)
+    print(f"已恢复 {len(session_ids)} 个未正常结束的会话")
+    return len(session_ids)
+
+
+
+def end_window_session(conn: sqlite3.Connection, session_id: int, specific_time: Optional[datetime]) -> bool:
     """
     结束窗口会话
-    如果 specific_time（用户指定时间）不为 None，就用它作为结束时间
+    如果 specific_time（用户指定时间）不为 None，就用它作为结束时间，否则使用当前本地时间
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-
-            if specific_time is not None:
-                # 转换为字符串，格式与 SQLite 兼容
-                end_time_str = specific_time.strftime("%Y-%m-%d %H:%M:%S")
-                print(end_time_str)
-
-                # 更新 end_time 与 duration
-                cursor.execute('''
-                    UPDATE window_sessions
-                    SET end_time = ?,
-                        duration_seconds =
-                            CAST((julianday(?) - julianday(start_time)) * 86400 AS INTEGER)
-                    WHERE id = ?
-                      AND end_time IS NULL
-                ''', (end_time_str, end_time_str, session_id))
-
-                used_time = end_time_str
-            else:
-                # 使用本地时间
-                cursor.execute("SELECT datetime('now','localtime')")
-                local_now = cursor.fetchone()[0]
-
-                cursor.execute('''
-                    UPDATE window_sessions
-                    SET end_time         = datetime('now','localtime'),
-                        duration_seconds = CAST(
-                               (julianday(datetime('now','localtime')) - julianday(start_time))
-                               * 86400 AS INTEGER)
-                    WHERE id = ?
-                      AND end_time IS NULL
-                ''', (session_id,))
-
-                used_time = local_now
-
-            rows_affected = cursor.rowcount
-            conn.commit()
-
-            if rows_affected > 0:
-                print(f"结束会话: 会话ID={session_id}, 结束时间={used_time}")
-                return True
-            else:
-                print(f"⚠️ 会话已结束或不存在: 会话ID={session_id}")
-                return False
+        end_time = specific_time if specific_time is not None else datetime.now()
+
+        if _close_session(conn.cursor(), session_id, end_time):
+            print(f"结束会话: 会话ID={session_id}, 结束时间={end_time.strftime(TIME_FORMAT)}")
+            return True
+        else:
+            print(f"⚠️ 会话已结束或不存在: 会话ID={session_id}")
+            return False
 
     except sqlite3.Error as e:
         print(f"❌ 数据库错误 - 结束会话失败: {e}")
@@ -143,3 +629,66 @@ def end_window_session(db_path: str, session_id: int, specific_time: Optional[da
     except Exception as e:
         print(f"❌ 未知错误 - 结束会话失败: {e}")
         return False
+
+
+
+def delete_sessions_chunk(conn: sqlite3.Connection, start_day: str, end_day: str, limit: int) -> int:
+    """
+    删除半开区间 [start_day, end_day) 内最多 limit 条会话，并同步扣除日用量汇总
+    只走 day 开头的覆盖索引取出 rowid，再按主键删除
+
+    Returns:
+        int: 本次删除的行数（小于 limit 说明已删完）
+    """
+    cursor = conn.execute('''
+        SELECT id
+        FROM window_sessions
+        WHERE day >= ?
+          AND day < ?
+        LIMIT ?
+    ''', (start_day, end_day, limit))
+    session_ids = [row[0] for row in cursor.fetchall()]
+    if not session_ids:
+        return 0
+
+    # 先从日用量汇总中扣除，再删除明细
+    update_usage_rollups(cursor, session_ids, sign=-1)
+    cursor.executemany('DELETE FROM window_sessions WHERE id = ?', [(i,) for i in session_ids])
+    return len(session_ids)
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """
+    把数据库切换为 auto_vacuum = INCREMENTAL，之后可以用 reclaim_free_pages 回收空间
+    已有数据的数据库需要一次 VACUUM 才能生效，VACUUM 不能在事务中执行
+
+    Returns:
+        bool: 本次是否进行了切换
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # 文件已创建（包括刚切换为 WAL 的空库）时都要 VACUUM 才会生效；空库的 VACUUM 几乎没有开销
+    if conn.execute("PRAGMA page_count").fetchone()[0] > 0:
+        conn.execute("VACUUM")
+    return True
+
+
+def reclaim_free_pages(conn: sqlite3.Connection, max_pages: int = 0) -> int:
+    """
+    把空闲页归还给文件系统（PRAGMA incremental_vacuum）
+    可以在写事务中执行；max_pages 为 0 时回收全部空闲页
+
+    Returns:
+        int: 回收的页数
+    """
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if max_pages:
+        free_pages = min(free_pages, max_pages)
+    # 该 PRAGMA 每执行一步释放一页，而 sqlite3 模块对不返回列的语句只执行一步，
+    # 所以按页数循环执行（executescript 会先提交当前事务，不能在写线程中使用）
+    for _ in range(free_pages):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+    return free_pages
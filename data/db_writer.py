@@ -0,0 +1,134 @@
+"""
+数据库写线程 - 所有修改操作都在这一个线程里执行
+
+调用方把命令放入队列后立即返回（或按需等待结果），
+写线程把一段时间内积累的命令合并到同一个事务中提交（group commit），
+避免每次窗口切换都单独 fsync，也避免多个线程争抢写锁导致 "database is locked"
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+# 停止信号
+_STOP = object()
+
+
+class DatabaseWriter(threading.Thread):
+    """
+    单写线程
+    命令形如 command(conn, *args)，在写线程中执行，返回值通过 Future 交给调用方
+    """
+
+    def __init__(self, connections, flush_interval: float = 0.2, max_batch: int = 256):
+        """
+        Args:
+            connections: ConnectionManager，提供写连接
+            flush_interval: 最长合并等待时间（秒），第一条命令入队后最多等这么久就提交
+            max_batch: 单个事务最多包含的命令数
+        """
+        super().__init__(name="db-writer", daemon=True)
+        self.connections = connections
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._on_commit: List[Callable[[], None]] = []
+
+    def submit(self, command: Callable, *args: Any, urgent: bool = False) -> Future:
+        """
+        提交一条写命令
+
+        Args:
+            command: 在写线程中执行的函数，第一个参数是写连接
+            urgent: 为 True 时不再等待合并，尽快提交（调用方需要同步等待结果时使用）
+
+        Returns:
+            Future: 事务提交后给出命令的返回值或异常
+        """
+        future: Future = Future()
+        self._queue.put((future, command, args, urgent))
+        return future
+
+    def add_commit_hook(self, hook: Callable[[], None]) -> None:
+        """注册一个在每次成功提交后（写线程中）调用的回调"""
+        self._on_commit.append(hook)
+
+    def remove_commit_hook(self, hook: Callable[[], None]) -> None:
+        """取消 add_commit_hook 注册的回调（未注册时忽略）"""
+        try:
+            self._on_commit.remove(hook)
+        except ValueError:
+            pass
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """处理完队列中剩余的命令后停止线程"""
+        self._queue.put(_STOP)
+        self.join(timeout)
+
+    def run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            urgent = item[3]
+            deadline = time.monotonic() + self.flush_interval
+
+            # 在 flush_interval 内尽量多收集命令，遇到 urgent 命令则只收集已在队列中的
+            while len(batch) < self.max_batch:
+                remaining = 0 if urgent else deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                urgent = urgent or item[3]
+
+            self._apply(batch)
+
+    def _apply(self, batch: List[Tuple]) -> None:
+        """在一个事务中执行一批命令，每条命令用 SAVEPOINT 隔离，单条失败不影响其他命令"""
+        results = []
+        try:
+            with self.connections.writer() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for future, command, args, _ in batch:
+                    conn.execute("SAVEPOINT writer_cmd")
+                    try:
+                        result = command(conn, *args)
+                        conn.execute("RELEASE writer_cmd")
+                        results.append((future, result, None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO writer_cmd")
+                        conn.execute("RELEASE writer_cmd")
+                        results.append((future, None, e))
+        except Exception as e:
+            print(f"❌ 数据库写入事务失败: {e}")
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # 复制一份：其他线程可能同时注册或取消回调
+        for hook in list(self._on_commit):
+            try:
+                hook()
+            except Exception as e:
+                print(f"⚠️ 提交回调执行失败: {e}")
+
+        for future, result, error in results:
+            if error is not None:
+                print(f"❌ 数据库写入失败: {error}")
+                future.set_exception(error)
+            else:
+                future.set_result(result)
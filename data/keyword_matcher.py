@@ -0,0 +1,90 @@
+"""
+关键词匹配 - ActivityClassifier.classify_activity 的关键词分类
+
+原来的做法对每个分类的每个关键词做一次小写转换和两次子串查找，
+每条会话的代价是 O(分类数 × 关键词数 × 文本长度)。
+这里把所有关键词编译成一个 Aho-Corasick 自动机，对文本只扫描一遍，
+每个状态记录能匹配到的最高优先级（分类顺序中最靠前的）分类，
+结果与按分类顺序逐个查找完全一致
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class KeywordMatcher:
+    """按优先级排列的多组关键词的 Aho-Corasick 自动机（不区分大小写）"""
+
+    def __init__(self, groups: Sequence[Tuple[str, Iterable[str]]]):
+        """
+        Args:
+            groups: [(分类名, 关键词列表)]，越靠前优先级越高
+        """
+        self.labels: List[str] = [label for label, _ in groups]
+        # 每个状态的转移表、失败指针，以及到达该状态时已匹配到的最高优先级（无匹配为 None）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None]
+
+        for priority, (_, keywords) in enumerate(groups):
+            for keyword in keywords:
+                # 空关键词落在根状态上，匹配任何文本（与 '' in text 一致）
+                self._add(keyword.lower(), priority)
+        self._link()
+
+    def _add(self, keyword: str, priority: int) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            state = next_state
+        if self._best[state] is None or priority < self._best[state]:
+            self._best[state] = priority
+
+    def _link(self) -> None:
+        """按层（BFS）计算失败指针，并把后缀状态的匹配结果合并到当前状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                inherited = self._best[self._fail[next_state]]
+                if inherited is not None and (self._best[next_state] is None or inherited < self._best[next_state]):
+                    self._best[next_state] = inherited
+
+    def match(self, text: str) -> Optional[str]:
+        """text 中出现的关键词所属的最高优先级分类，没有匹配时返回 None"""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        best = best_at[0]
+        if best == 0:
+            return self.labels[0]
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = best_at[state]
+            if found is not None and (best is None or found < best):
+                if found == 0:
+                    return self.labels[0]
+                best = found
+        return self.labels[best] if best is not None else None
+
+
+def naive_match(groups: Sequence[Tuple[str, Iterable[str]]], text: str) -> Optional[str]:
+    """逐个分类、逐个关键词查找（原来的实现），用于测试和性能对比"""
+    text_lower = text.lower()
+    for label, keywords in groups:
+        for keyword in keywords:
+            if keyword.lower() in text_lower or keyword in text:
+                return label
+    return None
@@ -0,0 +1,263 @@
+"""
+数据库结构迁移
+使用 PRAGMA user_version 记录已应用的版本，按顺序执行尚未应用的迁移
+每个迁移都在 ActivityDatabase 初始化的同一个写事务中执行
+"""
+import sqlite3
+from typing import Callable, List
+
+from .database_utils import rebuild_usage_rollups
+
+
+def _dedupe_processes(conn: sqlite3.Connection) -> None:
+    """
+    v1: 合并重复的进程记录
+    旧版本用 INSERT OR REPLACE 写 processes，executable_path 为 NULL 时唯一约束不生效，
+    每次切换都会插入一条新记录；这里把同名同路径的记录合并到最小的 ID 上，
+    并建立把 NULL 路径视为相同值的唯一索引
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TEMP TABLE process_remap AS
+        SELECT p.id AS old_id, keep.id AS new_id
+        FROM processes p
+                 JOIN (SELECT MIN(id) AS id, name, IFNULL(executable_path, '') AS path,
+                              MIN(first_seen) AS first_seen, MAX(last_seen) AS last_seen
+                       FROM processes
+                       GROUP BY name, IFNULL(executable_path, '')) keep
+                      ON keep.name = p.name AND keep.path = IFNULL(p.executable_path, '')
+        WHERE p.id != keep.id
+    ''')
+    cursor.execute('''
+        UPDATE window_sessions
+        SET process_id = (SELECT new_id FROM process_remap WHERE old_id = window_sessions.process_id)
+        WHERE process_id IN (SELECT old_id FROM process_remap)
+    ''')
+    cursor.execute('''
+        UPDATE processes
+        SET first_seen = (SELECT MIN(first_seen) FROM processes p
+                          WHERE p.name = processes.name
+                            AND IFNULL(p.executable_path, '') = IFNULL(processes.executable_path, '')),
+            last_seen  = (SELECT MAX(last_seen) FROM processes p
+                          WHERE p.name = processes.name
+                            AND IFNULL(p.executable_path, '') = IFNULL(processes.executable_path, ''))
+        WHERE id IN (SELECT new_id FROM process_remap)
+    ''')
+    cursor.execute('DELETE FROM processes WHERE id IN (SELECT old_id FROM process_remap)')
+    cursor.execute('DROP TABLE process_remap')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_processes_identity
+            ON processes(name, IFNULL(executable_path, ''))
+    ''')
+
+
+def _add_session_heartbeat(conn: sqlite3.Connection) -> None:
+    """v2: 为会话增加心跳时间，崩溃后可用它作为未结束会话的结束时间"""
+    conn.execute('ALTER TABLE window_sessions ADD COLUMN last_heartbeat TIMESTAMP')
+
+
+def _add_epoch_columns(conn: sqlite3.Connection) -> None:
+    """
+    v3: 增加整数时间戳 start_ts/end_ts 和本地日期 day 列
+    查询改为 day >= ? AND day < ? 这类可走索引的半开区间，不再对列套 DATE()
+    旧数据的 start_time/end_time 是本地时间字符串，用 'utc' 修饰符换算为时间戳
+    """
+    cursor = conn.cursor()
+    cursor.execute('ALTER TABLE window_sessions ADD COLUMN start_ts INTEGER')
+    cursor.execute('ALTER TABLE window_sessions ADD COLUMN end_ts INTEGER')
+    cursor.execute('ALTER TABLE window_sessions ADD COLUMN day TEXT')
+    cursor.execute('''
+        UPDATE window_sessions
+        SET start_ts = CAST(strftime('%s', start_time, 'utc') AS INTEGER),
+            end_ts   = CAST(strftime('%s', end_time, 'utc') AS INTEGER),
+            day      = DATE(start_time)
+    ''')
+    # 旧版本用 julianday 截断计算时长，会少算 1 秒；统一改为时间戳之差
+    cursor.execute('''
+        UPDATE window_sessions
+        SET duration_seconds = end_ts - start_ts
+        WHERE end_ts IS NOT NULL
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_sessions_time')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start_ts ON window_sessions(start_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_day ON window_sessions(day)')
+
+
+def _add_covering_indexes(conn: sqlite3.Connection) -> None:
+    """
+    v4: 为分析查询建立覆盖索引
+    按天汇总/按应用汇总只需要 (day, process_id, duration_seconds)，无需回表；
+    它同时覆盖了原来的 day 单列索引
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_day_usage
+            ON window_sessions(day, process_id, duration_seconds)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_sessions_day')
+
+
+def _intern_titles(conn: sqlite3.Connection) -> None:
+    """
+    v5: 窗口标题驻留到 titles 表，会话只保存整数 title_id
+    同一个标题（"微信"、IDE 项目名、浏览器标签页）会重复出现成千上万次，
+    改为整数后表和页缓存都更小，按标题 GROUP BY 也变成整数比较；
+    SQLite 不能删除列，所以重建 window_sessions（保留原有 ID 和自增序号）
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS titles (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE)
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO titles (title)
+        SELECT window_title FROM window_sessions GROUP BY window_title ORDER BY MIN(id)
+    ''')
+    cursor.execute('''
+        CREATE TABLE window_sessions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            process_id INTEGER NOT NULL,
+            title_id INTEGER NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP,
+            duration_seconds INTEGER DEFAULT 0,
+            is_foreground BOOLEAN DEFAULT 1,
+            last_heartbeat TIMESTAMP,
+            start_ts INTEGER,
+            end_ts INTEGER,
+            day TEXT,
+            FOREIGN KEY (process_id) REFERENCES processes (id),
+            FOREIGN KEY (title_id) REFERENCES titles (id))
+    ''')
+    cursor.execute('''
+        INSERT INTO window_sessions_new (id, process_id, title_id, start_time, end_time, duration_seconds,
+                                         is_foreground, last_heartbeat, start_ts, end_ts, day)
+        SELECT ws.id, ws.process_id, t.id, ws.start_time, ws.end_time, ws.duration_seconds,
+               ws.is_foreground, ws.last_heartbeat, ws.start_ts, ws.end_ts, ws.day
+        FROM window_sessions ws
+                 JOIN titles t ON t.title = ws.window_title
+    ''')
+    row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'window_sessions'").fetchone()
+    cursor.execute('DROP TABLE window_sessions')
+    cursor.execute('ALTER TABLE window_sessions_new RENAME TO window_sessions')
+    # 沿用旧表的自增序号，已删除会话的 ID 不会被重新分配
+    if row is not None:
+        cursor.execute('''
+            UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'window_sessions'
+        ''', (row[0],))
+        if cursor.rowcount == 0:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('window_sessions', ?)", (row[0],))
+
+    cursor.execute('CREATE INDEX idx_sessions_start_ts ON window_sessions(start_ts)')
+    # 覆盖索引增加 title_id：按 (应用, 标题) 分组的分类统计同样无需回表
+    cursor.execute('''
+        CREATE INDEX idx_sessions_day_usage
+            ON window_sessions(day, process_id, title_id, duration_seconds)
+    ''')
+
+
+def _add_daily_usage(conn: sqlite3.Connection) -> None:
+    """
+    v6: 按 (日期, 进程, 标题) 汇总的日用量表
+    会话结束时增量更新，分析查询不再逐条聚合 window_sessions；
+    WITHOUT ROWID 让主键即聚簇索引，按日期范围读取是连续的主键区间
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_usage (
+            day TEXT NOT NULL,
+            process_id INTEGER NOT NULL,
+            title_id INTEGER NOT NULL,
+            seconds INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, process_id, title_id)) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO daily_usage (day, process_id, title_id, seconds, session_count)
+        SELECT day, process_id, title_id, SUM(duration_seconds), COUNT(*)
+        FROM window_sessions
+        WHERE end_ts IS NOT NULL
+        GROUP BY day, process_id, title_id
+    ''')
+
+
+def _split_usage_by_hour(conn: sqlite3.Connection) -> None:
+    """
+    v7: 按本地日期/小时切分会话后再汇总
+    之前整段会话都计入开始的那一天，23:30 到次日 02:00 的会话全部算在前一天；
+    新增 hourly_usage 供按小时的视图使用，并在 end_ts 上建索引，
+    与范围 [start, end) 重叠的会话用 end_ts > start AND start_ts < end 查找
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hourly_usage (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            process_id INTEGER NOT NULL,
+            title_id INTEGER NOT NULL,
+            seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour, process_id, title_id)) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_end_ts ON window_sessions(end_ts)')
+    rebuild_usage_rollups(conn)
+
+
+def _add_archived_months(conn: sqlite3.Connection) -> None:
+    """
+    v8: 已归档月份的登记表（见 data/archive.py）
+    归档月份的会话明细移到数据库外的列式文件中，path 相对数据库文件所在目录；
+    min_start_ts / max_end_ts 用于找出与查询范围重叠的归档
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_months (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            session_count INTEGER NOT NULL,
+            min_start_ts INTEGER NOT NULL,
+            max_end_ts INTEGER NOT NULL)
+    ''')
+
+
+def _add_classification_cache(conn: sqlite3.Connection) -> None:
+    """
+    v9: 分类结果缓存（见 data/classification_cache.py）
+    version 是关键词表和模型文件的哈希，放在主键最前面，按版本查询和清理旧版本都走主键；
+    组合保存为 (process_id, title_id)，与日用量汇总按整数主键关联；
+    fallback 标记模型缺失或预测失败时的兜底结果
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS classification_cache (
+            version TEXT NOT NULL,
+            process_id INTEGER NOT NULL,
+            title_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            fallback INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (version, process_id, title_id)) WITHOUT ROWID
+    ''')
+
+
+# 按顺序排列，下标 + 1 即迁移后的 user_version
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _dedupe_processes,
+    _add_session_heartbeat,
+    _add_epoch_columns,
+    _add_covering_indexes,
+    _intern_titles,
+    _add_daily_usage,
+    _split_usage_by_hour,
+    _add_archived_months,
+    _add_classification_cache,
+]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    执行尚未应用的迁移
+
+    Returns:
+        int: 迁移后的数据库版本
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for index in range(version, len(MIGRATIONS)):
+        MIGRATIONS[index](conn)
+        conn.execute(f"PRAGMA user_version = {index + 1}")
+    return len(MIGRATIONS)
@@ -0,0 +1,109 @@
+"""
+查询结果缓存 - DataAnalyzer / ActivityClassifier 的方法级记忆化
+
+GUI 刷新时会用相同的参数反复调用同一批统计方法，而数据往往没有变化。
+缓存以 (方法名, 规范化后的参数) 为键，每条结果记录计算时的数据版本：
+- ConnectionManager.write_seq：本进程写线程提交的、改变了数据的事务数（心跳不计入）
+- ConnectionManager.external_version：其他连接（包括其他进程）提交后会变化
+两者都没变时直接返回缓存结果，否则重新查询
+"""
+import copy
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from .database_utils import local_day
+
+# 默认最多缓存的结果数
+QUERY_CACHE_SIZE = 128
+
+
+def data_version(connections) -> Tuple[int, int]:
+    """
+    当前数据版本 (write_seq, external_version)，两者都不变说明数据没有被修改
+    """
+    return connections.write_seq, connections.external_version()
+
+
+class QueryCache:
+    """带数据版本校验的 LRU 结果缓存（线程安全）"""
+
+    def __init__(self, connections, maxsize: int = QUERY_CACHE_SIZE):
+        """
+        Args:
+            connections: ConnectionManager，用于读取数据版本
+            maxsize: 最多保留的结果数，超出时淘汰最久未使用的
+        """
+        self.connections = connections
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, int], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        返回 key 对应的结果；没有缓存或数据已变化时调用 compute() 重新计算
+        返回的是副本，调用方修改结果不会影响缓存
+        """
+        version = data_version(self.connections)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+
+        # 版本在计算前读取：计算期间若有写入，下次查询会因版本不同而重新计算
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return copy.deepcopy(value)
+
+    def clear(self) -> None:
+        """清空缓存（计数保留）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中次数和当前条目数"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+def cached_query(today: bool = False) -> Callable:
+    """
+    方法装饰器：通过实例的 self.cache（QueryCache）缓存结果，self.cache 为 None 时直接查询
+    位置参数和关键字参数按签名绑定并补齐默认值，get_top_apps(7) 与 get_top_apps(days=7) 共用一条缓存
+
+    Args:
+        today: 结果依赖当前日期（如"今天"、"最近 N 天"）时为 True，键中加入今天的日期
+    """
+    def decorator(method: Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, 'cache', None)
+            if cache is None:
+                return method(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = (method.__name__,) + tuple(list(bound.arguments.items())[1:])
+            if today:
+                key += (local_day(datetime.now()),)
+            return cache.get_or_compute(key, lambda: method(self, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,292 @@
+"""
+会话分类 - 在后台给 (应用名, 窗口标题) 分类，并按分类汇总用量
+
+分类结果只保存在一处：classification_cache 表（见 data/classification_cache.py），
+以分类器版本和 (process_id, title_id) 为主键。同一个组合的所有会话分类相同，所以不在每条会话上保存分类
+（日用量汇总、跨天裁剪和已归档月份都只有组合级别的数据，每条会话上的分类在这些地方都用不上）：
+- CategoryWorker 启动后先给日用量汇总中还没有当前版本分类的组合分类（历史数据），
+  之后在写线程每次提交后被唤醒，给新会话的组合分类；分类（关键词匹配 / fastText）
+  不在跟踪线程、写线程和界面线程中进行
+- 统计时日用量汇总与 classification_cache 按整数主键关联，一条 GROUP BY 得到各分类的时长，
+  已归档月份的汇总同样适用；没有保存分类的组合计入 'other'
+- 分类规则或模型变化后分类器版本不同，旧版本的结果不再被关联，新版本的结果由后台线程重新填写
+"""
+import heapq
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 每批分类的组合（或新会话）数
+CATEGORY_BATCH_SIZE = 500
+# 没有被唤醒时的检查间隔（秒）
+CATEGORY_POLL_INTERVAL = 60.0
+
+
+def missing_pairs(conn: sqlite3.Connection, version: str, start_day: Optional[str] = None,
+                  end_day: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    日用量汇总（半开区间 [start_day, end_day)，默认全部日期）中还没有 version 版本分类的 (进程名, 窗口标题)
+    带兜底标记的结果同样算作已分类，同一版本内不再重复分类
+    """
+    day_filter, params = '', []
+    if start_day is not None:
+        day_filter += ' AND day >= ?'
+        params.append(start_day)
+    if end_day is not None:
+        day_filter += ' AND day < ?'
+        params.append(end_day)
+    return conn.execute(f'''
+        SELECT DISTINCT p.name, t.title
+        FROM (SELECT DISTINCT process_id, title_id
+              FROM daily_usage
+              WHERE 1 {day_filter}) u
+                 JOIN processes p ON u.process_id = p.id
+                 JOIN titles t ON u.title_id = t.id
+        WHERE NOT EXISTS (SELECT 1
+                          FROM classification_cache cc
+                          WHERE cc.version = ?
+                            AND cc.process_id = u.process_id
+                            AND cc.title_id = u.title_id)
+    ''', (*params, version)).fetchall()
+
+
+def new_session_pairs(conn: sqlite3.Connection, version: str, after_id: int,
+                      limit: int) -> Tuple[List[Tuple[str, str]], Optional[int]]:
+    """
+    ID 大于 after_id 的最多 limit 条会话中还没有 version 版本分类的 (进程名, 窗口标题)（去重）
+
+    Returns:
+        ([(进程名, 窗口标题)], 最后一条会话的 ID；没有新会话时为 None)
+    """
+    rows = conn.execute('''
+        SELECT ws.id, p.name, t.title,
+               EXISTS (SELECT 1
+                       FROM classification_cache cc
+                       WHERE cc.version = ?
+                         AND cc.process_id = ws.process_id
+                         AND cc.title_id = ws.title_id)
+        FROM window_sessions ws
+                 JOIN processes p ON ws.process_id = p.id
+                 JOIN titles t ON ws.title_id = t.id
+        WHERE ws.id > ?
+        ORDER BY ws.id
+        LIMIT ?
+    ''', (version, after_id, limit)).fetchall()
+    if not rows:
+        return [], None
+    pairs = dict.fromkeys((name, title) for _, name, title, labelled in rows if not labelled)
+    return list(pairs), rows[-1][0]
+
+
+def category_usage(conn: sqlite3.Connection, version: str, start_day: str,
+                   end_day: str) -> List[Tuple[str, int, int]]:
+    """
+    半开区间 [start_day, end_day) 内各分类的 (分类名, 秒数, 会话数)
+    日用量汇总沿 (day, process_id, title_id) 主键扫描，按 (version, process_id, title_id) 主键关联 classification_cache；
+    没有 version 版本分类的组合计入 'other'，调用方应先补齐（CategoryWorker.categorize_range）
+    """
+    return conn.execute('''
+        SELECT COALESCE(cc.category, 'other'), SUM(u.seconds), SUM(u.session_count)
+        FROM daily_usage u
+                 LEFT JOIN classification_cache cc
+                           ON cc.version = :version AND cc.process_id = u.process_id AND cc.title_id = u.title_id
+        WHERE u.day >= :start
+          AND u.day < :end
+        GROUP BY 1
+    ''', {'version': version, 'start': start_day, 'end': end_day}).fetchall()
+
+
+def top_apps_by_category(conn: sqlite3.Connection, version: str, start_day: str, end_day: str,
+                         limit: int) -> Dict[str, List[Tuple[str, str, int, int]]]:
+    """
+    半开区间 [start_day, end_day) 内每个分类时长最多的前 limit 个 (进程名, 窗口标题, 秒数, 会话数)
+    按 (分类, 应用, 标题) 汇总的结果逐行读取，每个分类维护一个大小为 limit 的最小堆，
+    一次扫描得到所有分类的精确结果；时长相同时按进程名、窗口标题升序
+    """
+    cursor = conn.execute('''
+        SELECT COALESCE(cc.category, 'other') AS category, p.name, t.title,
+               SUM(u.seconds), SUM(u.session_count)
+        FROM daily_usage u
+                 JOIN processes p ON u.process_id = p.id
+                 JOIN titles t ON u.title_id = t.id
+                 LEFT JOIN classification_cache cc
+                           ON cc.version = :version AND cc.process_id = u.process_id AND cc.title_id = u.title_id
+        WHERE u.day >= :start
+          AND u.day < :end
+        GROUP BY category, p.name, t.title
+        ORDER BY category, p.name, t.title
+    ''', {'version': version, 'start': start_day, 'end': end_day})
+
+    heaps: Dict[str, List[Tuple[int, int, str, str, int]]] = {}
+    # 行按 (进程名, 窗口标题) 升序到达，-index 使时长相同时先到的行排名更靠前
+    for index, (category, name, title, seconds, count) in enumerate(cursor):
+        heap = heaps.setdefault(category, [])
+        item = (seconds, -index, name, title, count)
+        if len(heap) < limit:
+            heapq.heappush(heap, item)
+        elif heap and item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    return {category: [(name, title, seconds, count)
+                       for seconds, _, name, title, count in sorted(heap, reverse=True)]
+            for category, heap in heaps.items()}
+
+
+def _session_watermark(conn: sqlite3.Connection) -> int:
+    """
+    跟进新会话的起点：之前的会话都已结束并计入日用量汇总，由 backfill 覆盖；
+    还没有结束的会话不在汇总中，从其中最早的一条开始跟进
+    """
+    return conn.execute('''
+        SELECT COALESCE((SELECT MIN(id) FROM window_sessions WHERE end_ts IS NULL) - 1,
+                        (SELECT MAX(id) FROM window_sessions), 0)
+    ''').fetchone()[0]
+
+
+class CategoryWorker(threading.Thread):
+    """给 (应用名, 窗口标题) 分类的后台线程"""
+
+    def __init__(self, connections, classify_pairs: Callable[[Sequence[Tuple[str, str]]], List[str]],
+                 version: Callable[[], str], batch_size: int = CATEGORY_BATCH_SIZE,
+                 interval: float = CATEGORY_POLL_INTERVAL):
+        """
+        Args:
+            connections: ConnectionManager
+            classify_pairs: [(应用名, 窗口标题)] -> [分类名]，并把所有组合的结果（包括缓存命中的）
+                交给写线程保存到 classification_cache，例如 ActivityClassifier.classify_pairs(pairs, store=True)
+            version: 返回当前分类器版本（classify_pairs 保存结果时使用的版本）
+            batch_size: 每批分类的组合（或新会话）数
+            interval: 没有被唤醒时的检查间隔（秒）
+        """
+        super().__init__(name="category-worker", daemon=True)
+        self.connections = connections
+        self.classify_pairs = classify_pairs
+        self.version = version
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        # 统计前补齐范围内分类的请求 (start_day, end_day, Future)，在本线程中处理
+        self._requests: "queue.Queue" = queue.Queue()
+        # 保证线程退出前处理完已经接受的请求，之后的请求由调用方自己执行
+        self._requests_lock = threading.Lock()
+        # 已经跟进到的会话 ID，第一次 backfill / step 时确定
+        self._last_session_id: Optional[int] = None
+
+    def notify(self) -> None:
+        """唤醒线程处理新会话（写线程每次提交后调用）"""
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def categorize_range(self, start_day: str, end_day: str) -> int:
+        """
+        给半开区间 [start_day, end_day) 的日用量汇总中还没有分类的组合分类，结果提交后返回
+        线程运行时交给它执行并等待（后台线程通常已经分好，只剩刚结束的会话）；
+        线程没有运行时在当前线程中执行
+
+        Returns:
+            int: 分类的组合数
+        """
+        with self._requests_lock:
+            inline = not self.is_alive() or self._stopped.is_set() or threading.current_thread() is self
+            if not inline:
+                future: Future = Future()
+                self._requests.put((start_day, end_day, future))
+                self._wake.set()
+        if inline:
+            return self._categorize(missing_pairs(self.connections.reader(), self.version(), start_day, end_day))
+        return future.result()
+
+    def _categorize(self, pairs: List[Tuple[str, str]]) -> int:
+        """分批分类，并等待结果提交"""
+        for offset in range(0, len(pairs), self.batch_size):
+            self.classify_pairs(pairs[offset:offset + self.batch_size])
+        if pairs:
+            self.connections.flush()
+        return len(pairs)
+
+    def _serve_requests(self) -> None:
+        """处理等待中的 categorize_range 请求"""
+        while True:
+            try:
+                start_day, end_day, future = self._requests.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                future.set_result(self._categorize(
+                    missing_pairs(self.connections.reader(), self.version(), start_day, end_day)))
+            except Exception as e:
+                future.set_exception(e)
+
+    def backfill(self) -> int:
+        """
+        给日用量汇总中所有还没有当前版本分类的组合（包括已有的历史数据）分类
+        待分类的组合只查询一次，分批处理；在本线程中执行时，批与批之间先处理等待中的 categorize_range 请求
+
+        Returns:
+            int: 分类的组合数
+        """
+        conn = self.connections.reader()
+        watermark = _session_watermark(conn)
+        pairs = missing_pairs(conn, self.version())
+        for offset in range(0, len(pairs), self.batch_size):
+            if self._stopped.is_set():
+                return offset
+            self.classify_pairs(pairs[offset:offset + self.batch_size])
+            if threading.current_thread() is self:
+                self.connections.flush()
+                self._serve_requests()
+        if pairs:
+            self.connections.flush()
+        if self._last_session_id is None:
+            self._last_session_id = watermark
+        return len(pairs)
+
+    def step(self) -> bool:
+        """
+        给一批新会话中还没有保存分类的组合分类（之前出现过的组合通常由分类函数的缓存直接给出）
+
+        Returns:
+            bool: 是否读到了新会话
+        """
+        if self._last_session_id is None:
+            self._last_session_id = _session_watermark(self.connections.reader())
+        pairs, last_id = new_session_pairs(self.connections.reader(), self.version(),
+                                           self._last_session_id, self.batch_size)
+        if last_id is None:
+            return False
+        if pairs:
+            self.classify_pairs(pairs)
+        self._last_session_id = last_id
+        return True
+
+    def run(self) -> None:
+        # 线程结束（stop）时取消注册，连接管理器在进程内共享，回调不能留在上面
+        remove_commit_hook = self.connections.add_commit_hook(self.notify)
+        try:
+            try:
+                self.backfill()
+            except Exception as e:
+                print(f"❌ 历史会话分类失败: {e}")
+            while not self._stopped.is_set():
+                # 先清除唤醒标志再处理，处理期间到达的通知会让下一次 wait 立即返回
+                self._wake.clear()
+                self._serve_requests()
+                try:
+                    while self.step() and not self._stopped.is_set():
+                        pass
+                except Exception as e:
+                    print(f"❌ 会话分类失败: {e}")
+                self._wake.wait(self.interval)
+        finally:
+            remove_commit_hook()
+            with self._requests_lock:
+                self._serve_requests()
@@ -137,4 +137,74 @@ class Visualize:
         ax.set_title('按应用使用时间（分钟）')
 
         fig.tight_layout()
-        return fig
\ No newline at end of file
+        return fig
+
+    def plot_heatmap_figure(self, heatmap, group=None, figsize=(8, 4)):
+        """绘制星期 × 小时的使用热力图（单位：分钟）
+
+        heatmap: DataAnalyzer.get_usage_heatmap 的返回值
+        group: 只画某个应用/分类；None 表示全部
+        """
+        matrix = heatmap['total'] if group is None else heatmap['groups'].get(group, [[0] * 24 for _ in range(7)])
+        minutes = [[seconds / 60 for seconds in row] for row in matrix]
+
+        fig = plt.Figure(figsize=figsize)
+        ax = fig.add_subplot(111)
+
+        image = ax.imshow(minutes, aspect='auto', cmap='YlOrRd', interpolation='nearest')
+        ax.set_xticks(range(24))
+        ax.set_xticklabels([str(hour) for hour in range(24)], fontsize=8)
+        ax.set_yticks(range(7))
+        ax.set_yticklabels(['周一', '周二', '周三', '周四', '周五', '周六', '周日'])
+        ax.set_xlabel('小时')
+        ax.set_title(f"使用时间热力图{'' if group is None else ' - ' + group}"
+                     f"（{heatmap['start_date']} ~ {heatmap['end_date']}）")
+        fig.colorbar(image, ax=ax, label='分钟')
+
+        fig.tight_layout()
+        return fig
+
+    def plot_timeline_figure(self, timeline, top=8, colors=None, figsize=(10, 3)):
+        """绘制降采样后的时间线：每个时间桶内各应用/分类所占比例的堆叠面积图
+
+        timeline: DataAnalyzer.get_timeline 的返回值
+        top: 只单独显示总时长最多的 top 项，其余合并为"其他"
+        colors: 可选的 {名称: 颜色}，如分类的颜色
+        """
+        buckets = timeline['buckets']
+        totals = {}
+        for bucket in buckets:
+            for name, fraction in bucket['fractions'].items():
+                totals[name] = totals.get(name, 0) + fraction
+        names = sorted(totals, key=lambda name: -totals[name])[:top]
+
+        series = [[bucket['fractions'].get(name, 0) for bucket in buckets] for name in names]
+        rest = [sum(bucket['fractions'].values()) - sum(column) for bucket, column in zip(buckets, zip(*series))] \
+            if series else [sum(bucket['fractions'].values()) for bucket in buckets]
+        labels = list(names)
+        if any(value > 1e-6 for value in rest):
+            series.append(rest)
+            labels.append('其他')
+
+        fig = plt.Figure(figsize=figsize)
+        ax = fig.add_subplot(111)
+
+        x = range(len(buckets))
+        if series:
+            stack_colors = [colors.get(label) for label in labels] if colors else None
+            if stack_colors and None in stack_colors:
+                stack_colors = None
+            ax.stackplot(x, series, labels=labels, colors=stack_colors, step='post')
+            ax.legend(bbox_to_anchor=(1.02, 0.5), loc='center left', fontsize=8)
+
+        # 横轴最多显示约 8 个时间标签
+        step = max(1, len(buckets) // 8)
+        ax.set_xticks(list(x)[::step])
+        ax.set_xticklabels([bucket['start'][5:16] for bucket in buckets[::step]], fontsize=8, rotation=30)
+        ax.set_xlim(0, max(len(buckets) - 1, 1))
+        ax.set_ylim(0, 1)
+        ax.set_ylabel('占比')
+        ax.set_title(f"使用时间线（每 {timeline['resolution'] // 60} 分钟）")
+
+        fig.tight_layout()
+        return fig
@@ -85,8 +85,14 @@ class App(customtkinter.CTk):
             self.tracker = WindowsTracker(self.config)
         
         self.db = ActivityDatabase()
-        self.analyzer = DataAnalyzer()
-        self.classifier = ActivityClassifier()
+        # 分析器和分类器复用数据库的长连接管理器（每个线程一个读连接）
+        self.classifier = ActivityClassifier(connections=self.db.connections)
+        # 后台给会话分类，不占用跟踪线程和界面线程
+        self.classifier.start()
+        self.analyzer = DataAnalyzer(connections=self.db.connections,
+                                     categorize=self.classifier.classify_activity, live=self.db,
+                                     categorize_pairs=self.classifier.classify_pairs,
+                                     categorize_version=lambda: self.classifier.version)
 
         self.time_manager = TimeManager()
         
@@ -170,6 +176,9 @@ class App(customtkinter.CTk):
 
             # 停掉数据库中未结束的 session
             self.db.stop_current_session(None)
+            self.classifier.stop(timeout=2)
+            # 等待写线程处理完队列并关闭连接
+            self.db.close()
 
             print("程序退出：已自动结束当前会话。")
         except Exception as e:
@@ -389,20 +398,11 @@ class App(customtkinter.CTk):
                 if process_name:
                     # 每次实际活动时，推进内部时钟
                     tm.update_internal_clock()
+                    # 当前会话心跳（内部按间隔合并，不会每秒写库）
+                    self.db.heartbeat()
 
-                    # 当前会话
-                    current_session = self.db.get_current_session_info()
-                    should_record = False
-
-                    # 是否需要记录
-                    if current_session is None:
-                        should_record = True
-                    else:
-                        session_process, session_title, _, _ = current_session
-                        if process_name != session_process or window_title != session_title:
-                            should_record = True
-
-                    if should_record:
+                    # 是否需要记录：与内存中的当前会话比较，窗口没变时不访问数据库
+                    if not self.db.is_current_window(process_name, window_title):
                         if self.db.record_window_switch(process_name, window_title):
                             ts = datetime.now().strftime("%H:%M:%S")
                             self.update_log(f"[{ts}] Switched to: {process_name} - {window_title}\n")
@@ -485,6 +485,12 @@ class App(customtkinter.CTk):
             
 
 
+    @staticmethod
+    def _summary_header(summary):
+        """摘要表格的首行：总时长、会话数、首/末活动时间"""
+        return (f"Total: {summary.get('total_hours', 0)} h | Sessions: {summary.get('session_count', 0)} | "
+                f"First: {summary.get('first_activity') or '-'} | Last: {summary.get('last_activity') or '-'}\n")
+
     def load_range(self):
         start = self.range_start_entry.get().strip()
         end = self.range_end_entry.get().strip()
@@ -500,9 +506,8 @@ class App(customtkinter.CTk):
                 messagebox.showerror("Invalid format", f"Dates must be valid dates in YYYY-MM-DD format (e.g., 2026-01-26).\nError: {e}")
                 return
             
-            print(f"DEBUG: 查询日期范围 {start} 到 {end}")
-            usage = self.analyzer.get_usage_between(start, end)
-            print(f"DEBUG: 获得数据 {len(usage)} 条记录")
+            summary = self.analyzer.get_summary(start, end)
+            usage = summary['app_usage']
 
             # create chart_frame if not exists
             if self.chart_frame is None:
@@ -540,8 +545,9 @@ class App(customtkinter.CTk):
             # show aggregated table
             table_txt = customtkinter.CTkTextbox(self.chart_frame, height=160)
             table_txt.pack(fill="x", pady=(10, 0))
-            table_txt.insert("0.0", "Process | Duration(min) | Duration(hours)\n")
-            table_txt.insert("1.0", "" + ("-" * 80) + "\n")
+            table_txt.insert("0.0", self._summary_header(summary))
+            table_txt.insert("end", "Process | Duration(min) | Duration(hours)\n")
+            table_txt.insert("end", "" + ("-" * 80) + "\n")
             for item in sorted(usage, key=lambda x: x.get('minutes', 0), reverse=True):
                 name = item.get('name')
                 minutes = item.get('minutes', 0)
@@ -557,7 +563,6 @@ class App(customtkinter.CTk):
     def load_today(self):
         """快捷加载今日分析（可通过 Ctrl+T 触发）"""
         try:
-            print("🔍 DEBUG: 开始 load_today")
             summary = self.analyzer.get_today_summary()
             usage = summary.get('app_usage', [])
 
@@ -648,8 +653,9 @@ class App(customtkinter.CTk):
             # show aggregated table
             table_txt = customtkinter.CTkTextbox(self.chart_frame, height=160)
             table_txt.pack(fill="x", pady=(10, 0))
-            table_txt.insert("0.0", "Process | Duration(min) | Duration(hours)\n")
-            table_txt.insert("1.0", "" + ("-" * 80) + "\n")
+            table_txt.insert("0.0", self._summary_header(summary))
+            table_txt.insert("end", "Process | Duration(min) | Duration(hours)\n")
+            table_txt.insert("end", "" + ("-" * 80) + "\n")
 
             # 对数据进行排序，确保有正值
             sorted_usage = sorted(usage, key=lambda x: x.get('minutes', 0), reverse=True)
@@ -674,9 +680,14 @@ class App(customtkinter.CTk):
             traceback.print_exc()
             messagebox.showerror("Error", f"Failed to load today's usage: {str(e)[:100]}...")
 
+    def _log_delete_progress(self, deleted, total):
+        """分块删除的进度回调"""
+        self.log_message(f"Deleting records... {deleted}/{total}")
+        self.update_idletasks()
+
     def clear_today(self):
         if messagebox.askyesno("Confirm", "Delete all records for today? This cannot be undone."):
-            deleted = self.db.delete_today_data()
+            deleted = self.db.delete_today_data(progress=self._log_delete_progress)
             messagebox.showinfo("Deleted", f"Deleted {deleted} records for today.")
             self.log_message(f"Deleted {deleted} records for today.")
             # refresh GUI
@@ -699,7 +710,7 @@ class App(customtkinter.CTk):
         if not messagebox.askyesno("Confirm", f"Delete records from {start} to {end}? This cannot be undone."):
             return
         try:
-            deleted = self.db.delete_range(start, end)
+            deleted = self.db.delete_range(start, end, progress=self._log_delete_progress)
             messagebox.showinfo("Deleted", f"Deleted {deleted} records from {start} to {end}.")
             self.log_message(f"Deleted {deleted} records from {start} to {end}.")
             # destroy chart area if present and show placeholder
@@ -732,7 +743,8 @@ class App(customtkinter.CTk):
             
             result = self.classifier.get_classified_statistics(start, end)
             if result and result.get('statistics'):
-                self._display_classifier_results(result)
+                top_apps = self.classifier.get_top_apps_all_categories(start, end, limit=3)
+                self._display_classifier_results(result, top_apps)
             else:
                 messagebox.showwarning("No data", "No classification data available for the selected date range.")
         except Exception as e:
@@ -744,14 +756,15 @@ class App(customtkinter.CTk):
         try:
             result = self.classifier.get_daily_classification(today)
             if result and result.get('statistics'):
-                self._display_classifier_results(result)
+                top_apps = self.classifier.get_top_apps_all_categories(today, today, limit=3)
+                self._display_classifier_results(result, top_apps)
             else:
                 messagebox.showwarning("No data", "No classification data available for today.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to classify today: {e}")
 
-    def _display_classifier_results(self, result):
-        """显示分类结果"""
+    def _display_classifier_results(self, result, top_apps=None):
+        """显示分类结果，top_apps 为各分类最常用的应用（get_top_apps_all_categories 的结果）"""
         # 创建结果框架（如果不存在）
         if self.classifier_result_frame is None:
             try:
@@ -820,6 +833,8 @@ class App(customtkinter.CTk):
             if data['minutes'] > 0:
                 line = f"{category:15}| {data['minutes']:7} | {data['hours']:6.1f} | {data['percentage']:9.1f}% | {data['session_count']:7}\n"
                 table_txt.insert("end", line)
+                for app in (top_apps or {}).get(category, []):
+                    table_txt.insert("end", f"    {app['app']} - {app['window'][:40]} ({app['hours']:.1f}h)\n")
 
         table_txt.configure(state="disabled")
 
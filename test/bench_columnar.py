@@ -0,0 +1,106 @@
+"""
+列式引擎与 SQL 引擎的性能对比（不是 pytest 测试，手动运行）
+
+    python -m test.bench_columnar --sessions 1000000
+
+在临时目录生成指定数量的会话（约每 2 分钟一次切换，向前铺开），
+然后分别用 engine='sql' 和 engine='columnar' 执行同一组统计并输出耗时
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from data.database import ActivityDatabase
+from data.data_analysis import DataAnalyzer
+from data.database_utils import TIME_FORMAT, local_day, to_epoch
+
+
+def generate(db_path: str, sessions: int, apps: int = 60, titles: int = 5000, seed: int = 1) -> str:
+    """直接批量写入会话并重建汇总，返回最早一条会话的日期"""
+    db = ActivityDatabase(db_path)
+    db.close()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO processes (name, executable_path) VALUES (?, ?)",
+                     [(f"app_{i}.exe", f"C:\\apps\\app_{i}.exe") for i in range(apps)])
+    conn.executemany("INSERT INTO titles (title) VALUES (?)", [(f"window title {i}",) for i in range(titles)])
+
+    t = datetime.now().replace(microsecond=0) - timedelta(minutes=2 * sessions)
+    first_day = local_day(t)
+    batch = []
+    for _ in range(sessions):
+        end = t + timedelta(seconds=rng.randrange(5, 235))
+        start_ts, end_ts = to_epoch(t), to_epoch(end)
+        batch.append((rng.randrange(1, apps + 1), rng.randrange(1, titles + 1),
+                      t.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT), end_ts - start_ts,
+                      start_ts, end_ts, local_day(t)))
+        t = end
+        if len(batch) >= 100000:
+            _insert_sessions(conn, batch)
+            batch = []
+    _insert_sessions(conn, batch)
+    conn.commit()
+    conn.close()
+
+    db = ActivityDatabase(db_path)
+    db.rebuild_usage_rollups()
+    db.close()
+    return first_day
+
+
+def _insert_sessions(conn: sqlite3.Connection, rows) -> None:
+    conn.executemany('''
+        INSERT INTO window_sessions (process_id, title_id, start_time, end_time, duration_seconds,
+                                     start_ts, end_ts, day)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def timed(func, repeat: int = 3) -> float:
+    """最快一次的耗时（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        first_day = generate(db_path, args.sessions)
+        print(f"生成 {args.sessions} 条会话（从 {first_day} 开始）: {time.perf_counter() - start:.1f}s")
+
+        today = local_day(datetime.now())
+        days = (datetime.now() - datetime.strptime(first_day, "%Y-%m-%d")).days + 1
+        sql = DataAnalyzer(db_path, cache_size=0)
+        columnar = DataAnalyzer(db_path, cache_size=0, engine='columnar')
+
+        # 列式引擎首次调用包含从数据库读取整个范围的时间
+        load_ms = timed(lambda: columnar.columnar.load(first_day, today), repeat=1)
+        print(f"列式引擎加载 {first_day} ~ {today}: {load_ms:.1f} ms")
+
+        cases = [
+            ("get_summary(全部)", lambda da: da.get_summary(first_day, today)),
+            ("get_top_apps", lambda da: da.get_top_apps(days=days, limit=10)),
+            ("get_daily_usage", lambda da: da.get_daily_usage(days=days)),
+            ("get_hourly_usage(今天)", lambda da: da.get_hourly_usage(today)),
+        ]
+        print(f"{'查询':<24}{'sql (ms)':>12}{'columnar (ms)':>16}")
+        for name, call in cases:
+            print(f"{name:<24}{timed(lambda: call(sql)):>12.1f}{timed(lambda: call(columnar)):>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
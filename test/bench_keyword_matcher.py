@@ -0,0 +1,64 @@
+"""
+关键词分类的性能对比（不是 pytest 测试，手动运行）
+
+    python -m test.bench_keyword_matcher --titles 20000
+
+用 ActivityClassifier 的关键词表生成窗口标题（一半不含任何关键词，这是逐个查找最慢的情况），
+分别用原来的逐个查找和编译后的自动机分类，输出每条标题的平均耗时
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from data.activity_classifier import ActivityClassifier
+from data.keyword_matcher import KeywordMatcher, naive_match
+
+
+def generate_titles(keywords, count: int, seed: int = 1):
+    rng = random.Random(seed)
+    words = ['document', 'untitled', 'report', 'final', 'draft', 'page', 'home', 'new tab',
+             '新建', '项目', '周报', 'index.html', 'main', 'view', 'chrome.exe', 'notepad.exe']
+    titles = []
+    for i in range(count):
+        parts = rng.sample(words, rng.randrange(2, 6))
+        if i % 2:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(keywords).title())
+        titles.append(' - '.join(parts))
+    return titles
+
+
+def per_title_us(classify, titles) -> float:
+    start = time.perf_counter()
+    for title in titles:
+        classify(title)
+    return (time.perf_counter() - start) / len(titles) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--titles', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        classifier = ActivityClassifier(os.path.join(tmp, "bench.db"), cache_size=0)
+        groups = [(category, config['keywords']) for category, config in classifier.categories.items()]
+        classifier.connections.close()
+
+    keywords = [keyword for _, group in groups for keyword in group]
+    titles = generate_titles(keywords, args.titles)
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(groups)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    assert all(matcher.match(title) == naive_match(groups, title) for title in titles)
+    naive_us = per_title_us(lambda title: naive_match(groups, title), titles)
+    matcher_us = per_title_us(matcher.match, titles)
+    print(f"{len(keywords)} 个关键词，{len(groups)} 个分类，编译 {build_ms:.1f} ms")
+    print(f"逐个查找: {naive_us:.1f} µs/条   自动机: {matcher_us:.1f} µs/条   ({naive_us / matcher_us:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""ActivityClassifier 的测试：fastText / jieba 用 sys.modules 中的替身代替"""
+import importlib
+import sys
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+from data.database import ActivityDatabase
+
+
+class _FakeModel:
+    """记录每次 predict 调用的文本，按应用名给出预设的分类"""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.calls = []
+
+    def predict(self, texts, k=1):
+        self.calls.append(list(texts))
+        labels = [[f"__label__{self.labels[text.split(' | ')[0]]}"] for text in texts]
+        return labels, [[1.0] for _ in texts]
+
+
+@pytest.fixture
+def classifier_module(monkeypatch):
+    """在替身 fasttext / jieba 下导入 data.activity_classifier"""
+    fasttext = types.ModuleType('fasttext')
+    fasttext.load_model = lambda path: None
+    monkeypatch.setitem(sys.modules, 'fasttext', fasttext)
+    monkeypatch.setitem(sys.modules, 'jieba', types.ModuleType('jieba'))
+    monkeypatch.delitem(sys.modules, 'data.activity_classifier', raising=False)
+    return importlib.import_module('data.activity_classifier')
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    yield db
+    db.close()
+
+
+def _with_model(monkeypatch, module, labels):
+    model = _FakeModel(labels)
+    monkeypatch.setattr(module, '_load_fasttext_model', lambda model_path=None: model)
+    return model
+
+
+def test_classify_pairs_predicts_distinct_misses_once(monkeypatch, classifier_module, db):
+    model = _with_model(monkeypatch, classifier_module, {'xyz.exe': 'learning', 'vvv.exe': 'entertainment'})
+    _record_day(db)
+    classifier = classifier_module.ActivityClassifier(connections=db.connections, cache_size=0)
+
+    pairs = [('xyz.exe', 'zzz'), ('code.exe', 'main.py'), ('vvv.exe', 'bbb'),
+             ('xyz.exe', 'zzz'), ('vvv.exe', 'bbb'), ('code.exe', 'main.py'), ('xyz.exe', 'line1\nline2')]
+    assert classifier.classify_pairs(pairs) == ['learning', 'coding', 'entertainment',
+                                                'learning', 'entertainment', 'coding', 'learning']
+    # 关键词未命中的不同组合在一次 predict 中完成，按首次出现的顺序，文本中不含换行
+    assert model.calls == [['xyz.exe | zzz', 'vvv.exe | bbb', 'xyz.exe | line1 line2']]
+
+    # 已缓存的组合不再调用模型
+    assert classifier.classify_pairs(pairs[::-1]) == ['learning', 'coding', 'entertainment', 'learning',
+                                                      'entertainment', 'coding', 'learning']
+    assert classifier.classify_activity('vvv.exe', 'bbb') == 'entertainment'
+    assert len(model.calls) == 1
+
+    # 结果保存在数据库中，新的分类器实例同样不需要调用模型
+    db.flush()
+    fresh = classifier_module.ActivityClassifier(connections=db.connections, cache_size=0)
+    assert fresh.classify_pairs([('xyz.exe', 'zzz'), ('vvv.exe', 'bbb')]) == ['learning', 'entertainment']
+    assert len(model.calls) == 1
+
+
+def test_classify_pairs_without_model_falls_back_to_other(monkeypatch, classifier_module, db):
+    monkeypatch.setattr(classifier_module, '_load_fasttext_model', lambda model_path=None: None)
+    _record_day(db)
+    classifier = classifier_module.ActivityClassifier(connections=db.connections, cache_size=0)
+
+    assert classifier.classify_pairs([('xyz.exe', 'zzz'), ('wechat.exe', '微信')]) == ['other', 'social']
+    db.flush()
+    # 兜底的 'other' 带标记保存
+    rows = db.connections.reader().execute('''
+        SELECT p.name, cc.category, cc.fallback
+        FROM classification_cache cc
+                 JOIN processes p ON cc.process_id = p.id
+    ''').fetchall()
+    assert sorted(rows) == [('wechat.exe', 'social', 0), ('xyz.exe', 'other', 1)]
+
+    # 统计前补齐分类时跳过已有兜底结果的组合；补齐之后再次统计不再分类，也不再写数据库
+    worker = classifier.category_worker
+    assert worker.categorize_range('2026-03-02', '2026-03-03') == 5
+    seq = db.connections.write_seq
+    assert worker.categorize_range('2026-03-02', '2026-03-03') == 0
+    assert db.connections.write_seq == seq
+
+
+def _record_day(db):
+    """2026-03-02 的会话：(应用, 标题, 秒数)"""
+    plan = [('code.exe', 'a.py', 3000), ('code.exe', 'c.py', 1200), ('code.exe', 'b.py', 1200),
+            ('pycharm.exe', 'x', 600), ('wechat.exe', '微信', 300), ('xyz.exe', 'zzz', 900), ('vvv.exe', 'bbb', 100)]
+    t = datetime(2026, 3, 2, 9, 0, 0)
+    for app, title, seconds in plan:
+        db.switch_session(app, title, switch_time=t)
+        t += timedelta(seconds=seconds)
+    db.stop_current_session(t)
+    db.flush()
+
+
+def _apps(rows):
+    return [(row['app'], row['window'], row['minutes'], row['session_count']) for row in rows]
+
+
+def test_top_apps_all_categories_ranks_within_each_category(monkeypatch, classifier_module, db):
+    model = _with_model(monkeypatch, classifier_module, {'xyz.exe': 'learning', 'vvv.exe': 'entertainment'})
+    _record_day(db)
+    classifier = classifier_module.ActivityClassifier(connections=db.connections)
+
+    top = classifier.get_top_apps_all_categories('2026-03-02', '2026-03-02', limit=2)
+    # 排名前先给范围内还没有分类的组合分类，模型只调用一次
+    assert model.calls == [['xyz.exe | zzz', 'vvv.exe | bbb']]
+    assert set(top) == set(classifier.categories) | {'other'}
+    # 时长相同时按标题升序；应用数少于 limit 的分类返回全部
+    assert _apps(top['coding']) == [('code.exe', 'a.py', 50, 1), ('code.exe', 'b.py', 20, 1)]
+    assert _apps(top['social']) == [('wechat.exe', '微信', 5, 1)]
+    assert _apps(top['learning']) == [('xyz.exe', 'zzz', 15, 1)]
+    assert _apps(top['entertainment']) == [('vvv.exe', 'bbb', 1, 1)]
+    assert top['other'] == [] and top['system'] == []
+
+    top = classifier.get_top_apps_all_categories('2026-03-02', '2026-03-02', limit=3)
+    assert [row['window'] for row in top['coding']] == ['a.py', 'b.py', 'c.py']
+    assert len(top['social']) == 1
+    top = classifier.get_top_apps_all_categories('2026-03-02', '2026-03-02', limit=0)
+    assert all(rows == [] for rows in top.values())
+    assert len(model.calls) == 1
+
+
+def test_top_apps_by_category_shares_cached_result(monkeypatch, classifier_module, db):
+    model = _with_model(monkeypatch, classifier_module, {'xyz.exe': 'learning', 'vvv.exe': 'entertainment',
+                                                         'new.exe': 'learning'})
+    _record_day(db)
+    classifier = classifier_module.ActivityClassifier(connections=db.connections)
+    # 第一次查询时补齐分类会写入数据库，之后的结果才会被缓存
+    classifier.get_top_apps_all_categories('2026-03-02', '2026-03-02', 2)
+    everything = classifier.get_top_apps_all_categories('2026-03-02', '2026-03-02', 2)
+
+    # 依次查询各个分类共用同一条缓存（键包含 limit）
+    stats = classifier.cache.stats()
+    assert classifier.get_top_apps_by_category('2026-03-02', '2026-03-02', 'coding', 2) == everything['coding']
+    assert classifier.get_top_apps_by_category('2026-03-02', '2026-03-02', 'social', limit=2) == everything['social']
+    assert classifier.cache.stats()['hits'] == stats['hits'] + 2
+    assert classifier.cache.stats()['misses'] == stats['misses']
+    assert _apps(classifier.get_top_apps_by_category('2026-03-02', '2026-03-02', 'coding', 1)) == [
+        ('code.exe', 'a.py', 50, 1)]
+    assert classifier.cache.stats()['misses'] == stats['misses'] + 1
+    assert classifier.get_top_apps_by_category('2026-03-02', '2026-03-02', 'unknown', 2) == []
+
+    # 新会话使缓存失效，新的组合在排名前分类
+    db.switch_session('new.exe', 'yyy', switch_time=datetime(2026, 3, 2, 20, 0, 0))
+    db.stop_current_session(datetime(2026, 3, 2, 21, 0, 0))
+    learning = classifier.get_top_apps_by_category('2026-03-02', '2026-03-02', 'learning', 2)
+    assert _apps(learning) == [('new.exe', 'yyy', 60, 1), ('xyz.exe', 'zzz', 15, 1)]
+    assert model.calls[1:] == [['new.exe | yyy']]
@@ -0,0 +1,134 @@
+"""历史月份归档的测试：归档前后的查询结果一致"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from data import archive
+from data.database import ActivityDatabase
+from data.data_analysis import DataAnalyzer
+
+
+def _snapshot(da):
+    return (da.get_summary('2026-01-01', '2026-02-28'),
+            da.get_summary('2026-02-01', '2026-02-01'),
+            da.get_hourly_usage('2026-01-31'),
+            da.get_timeline('2026-01-31', '2026-02-01', 3600),
+            [(r.process, r.window_title, r.start_time, r.duration_seconds)
+             for r in da.iter_sessions('2026-01-30', '2026-02-02')])
+
+
+def test_archived_months_stay_queryable(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        rng = random.Random(5)
+        t = datetime(2026, 1, 30, 8, 0, 0)
+        for _ in range(120):
+            db.switch_session(f'app_{rng.randrange(3)}.exe', f'title {rng.randrange(4)}', switch_time=t)
+            t += timedelta(seconds=rng.randrange(60, 900))
+        # 跨过月末的会话归入开始的月份
+        db.switch_session('code.exe', 'month end', switch_time=datetime(2026, 1, 31, 23, 50, 0))
+        db.switch_session('chrome.exe', 'february', switch_time=datetime(2026, 2, 1, 0, 20, 0))
+        db.switch_session('code.exe', 'march', switch_time=datetime(2026, 3, 1, 0, 0, 0))
+        db.stop_current_session(datetime(2026, 3, 1, 1, 0, 0))
+
+        sql = DataAnalyzer(db.db_path, cache_size=0)
+        columnar = DataAnalyzer(db.db_path, cache_size=0, engine='columnar')
+        before = _snapshot(sql)
+        assert _snapshot(columnar) == before
+        recent = sql.get_recent_activities(limit=5)
+
+        archived = db.archive_months('2026-03')
+        assert sorted(archived) == ['2026-01', '2026-02'] and sum(archived.values()) == 122
+        conn = db.connections.reader()
+        assert conn.execute("SELECT COUNT(*) FROM window_sessions").fetchone()[0] == 1
+        assert os.path.exists(tmp_path / "archive")
+
+        assert _snapshot(sql) == before
+        assert _snapshot(columnar) == before
+        assert sql.get_recent_activities(limit=5) == recent
+
+        # 重建汇总时读取归档，结果不变
+        rollup = conn.execute("SELECT * FROM daily_usage ORDER BY 1, 2, 3").fetchall()
+        db.rebuild_usage_rollups()
+        assert conn.execute("SELECT * FROM daily_usage ORDER BY 1, 2, 3").fetchall() == rollup
+
+        # 已归档的月份再次归档时与原有内容合并
+        db.switch_session('late.exe', 'added later', switch_time=datetime(2026, 1, 15, 9, 0, 0))
+        db.stop_current_session(datetime(2026, 1, 15, 9, 30, 0))
+        assert db.archive_months('2026-03') == {'2026-01': 1}
+        titles = [r.window_title for r in sql.iter_sessions('2026-01-15', '2026-01-15')]
+        assert titles == ['added later']
+        assert sql.get_summary('2026-01-01', '2026-02-28')['session_count'] == before[0]['session_count'] + 1
+    finally:
+        db.close()
+
+
+def test_delete_range_removes_archived_sessions(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        t = datetime(2026, 1, 30, 9, 0, 0)
+        for i in range(6):
+            db.switch_session(f'app_{i % 2}.exe', f'title {i}', switch_time=t)
+            t += timedelta(hours=12)
+        db.switch_session('code.exe', 'feb ten', switch_time=datetime(2026, 2, 10, 9, 0, 0))
+        db.switch_session('code.exe', 'march', switch_time=datetime(2026, 3, 1, 0, 0, 0))
+        db.stop_current_session(datetime(2026, 3, 1, 1, 0, 0))
+        assert db.archive_months('2026-03') == {'2026-01': 4, '2026-02': 3}
+        archive_dir = tmp_path / "archive"
+        assert len(os.listdir(archive_dir)) == 2
+        # 没有 pyarrow 时写成压缩的 .npz 文件
+        suffix = '.parquet' if archive.HAS_PYARROW else '.npz'
+        assert all(name.endswith(suffix) for name in os.listdir(archive_dir))
+
+        sql = DataAnalyzer(db.db_path, cache_size=0)
+        # 删除 1 月：1 月的归档删空，跨过月末的会话按开始日期一起删除
+        assert db.delete_range('2026-01-01', '2026-01-31') == 4
+        assert sql.get_summary('2026-01-01', '2026-01-31')['total_seconds'] == 0
+        assert list(sql.iter_sessions('2026-01-01', '2026-01-31')) == []
+        # 跨过午夜的会话在 2 月 1 日的部分也一起扣除
+        assert sql.get_summary('2026-02-01', '2026-02-01')['total_seconds'] == 15 * 3600
+        assert [r.window_title for r in sql.iter_sessions('2026-02-01', '2026-02-28')] == ['title 4', 'title 5',
+                                                                                   'feb ten']
+
+        # 删除 2 月的一天：重写为新文件，旧文件在提交后删除
+        assert db.delete_range('2026-02-01', '2026-02-01') == 2
+        assert [r.window_title for r in sql.iter_sessions('2026-02-01', '2026-02-28')] == ['feb ten']
+        conn = db.connections.reader()
+        assert conn.execute("SELECT month, session_count FROM archived_months").fetchall() == [('2026-02', 1)]
+        assert os.listdir(archive_dir) == [os.path.basename(conn.execute("SELECT path FROM archived_months").fetchone()[0])]
+
+        # 剩余的汇总与明细一致
+        rollup = conn.execute("SELECT * FROM daily_usage ORDER BY 1, 2, 3").fetchall()
+        db.rebuild_usage_rollups()
+        assert conn.execute("SELECT * FROM daily_usage ORDER BY 1, 2, 3").fetchall() == rollup
+    finally:
+        db.close()
+
+
+def test_orphan_archive_files_are_removed(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        db.switch_session('code.exe', 'january', switch_time=datetime(2026, 1, 5, 9, 0, 0))
+        db.stop_current_session(datetime(2026, 1, 5, 10, 0, 0))
+        db.archive_months('2026-02')
+    finally:
+        db.close()
+    # 提交失败或崩溃留下的文件不被 archived_months 引用，下次打开时删除
+    archive_dir = tmp_path / "archive"
+    kept = os.listdir(archive_dir)
+    (archive_dir / "sessions-2026-01-deadbeef.parquet").write_bytes(b'')
+    (archive_dir / "sessions-2026-01-cafe.tmp").mkdir()
+    (archive_dir / "notes.txt").write_text('x')
+
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        db.flush()
+        assert sorted(os.listdir(archive_dir)) == sorted(kept + ['notes.txt'])
+        assert [r.window_title for r in DataAnalyzer(db.db_path, cache_size=0).iter_sessions(
+            '2026-01-01', '2026-01-31')] == ['january']
+    finally:
+        db.close()
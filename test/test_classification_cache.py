@@ -0,0 +1,104 @@
+"""分类结果两级缓存的测试"""
+import os
+from datetime import datetime, timedelta
+
+from data.classification_cache import ClassificationCache, classifier_version
+from data.database import ActivityDatabase
+
+GROUPS = [('coding', ['code', 'github']), ('social', ['wechat'])]
+
+
+def _record(db, pairs):
+    """记录会话，使 (应用名, 窗口标题) 出现在 processes / titles 中"""
+    t = datetime(2026, 3, 2, 9, 0, 0)
+    for app, title in pairs:
+        db.switch_session(app, title, switch_time=t)
+        t += timedelta(minutes=10)
+    db.stop_current_session(t)
+    db.flush()
+
+
+def test_labels_persist_across_instances(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        _record(db, [('code.exe', 'main.py'), ('chrome.exe', 'docs'), ('wechat.exe', '微信')])
+        cache = ClassificationCache(db.connections, 'v1', maxsize=2)
+        assert cache.get('code.exe', 'main.py') is None
+        cache.put('code.exe', 'main.py', 'coding')
+        cache.put('chrome.exe', 'docs', 'learning')
+        cache.put('wechat.exe', '微信', 'social')  # 超出 LRU 容量，淘汰 code.exe
+        # 还没有出现在会话中的组合没有 ID，只保存在 LRU 中
+        cache.put('new.exe', 'draft', 'learning')
+        db.flush()
+        assert cache.stats()['size'] == 2
+        # LRU 未命中时从数据库读取
+        assert cache.get('code.exe', 'main.py') == 'coding'
+
+        # 新实例启动时预热
+        warm = ClassificationCache(db.connections, 'v1', maxsize=10)
+        assert warm.stats()['size'] == 0
+        assert warm.warm() == 3
+        assert warm.stats()['size'] == 3
+        assert warm.get('wechat.exe', '微信') == 'social'
+
+        # 版本变化后旧结果失效，并在后台删除
+        warm.set_version('v2')
+        assert warm.get('wechat.exe', '微信') is None
+        db.flush()
+        conn = db.connections.reader()
+        assert conn.execute("SELECT COUNT(*) FROM classification_cache").fetchone()[0] == 0
+    finally:
+        db.close()
+
+
+def test_version_tracks_keywords_and_model(tmp_path):
+    model = tmp_path / "model.ftz"
+    base = classifier_version(GROUPS, str(model))
+    assert classifier_version(GROUPS, str(model)) == base
+    assert classifier_version([('coding', ['code', 'github', 'gitlab'])] + GROUPS[1:], str(model)) != base
+    assert classifier_version(GROUPS[::-1], str(model)) != base
+
+    model.write_bytes(b'model v1')
+    with_model = classifier_version(GROUPS, str(model))
+    assert with_model != base
+    model.write_bytes(b'model v2 (retrained)')
+    os.utime(model, ns=(1, 1))
+    assert classifier_version(GROUPS, str(model)) != with_model
+
+
+def test_version_depends_on_model_content_not_path(tmp_path):
+    # PyInstaller 单文件版每次启动把模型解压到新的临时目录，版本不应变化
+    first, second = tmp_path / "_MEI1" / "model.ftz", tmp_path / "_MEI2" / "model.ftz"
+    for path in (first, second):
+        path.parent.mkdir()
+        path.write_bytes(b'same model')
+    os.utime(second, ns=(2, 2))
+    assert classifier_version(GROUPS, str(first)) == classifier_version(GROUPS, str(second))
+
+    # 大小相同、内容不同的模型版本不同
+    second.write_bytes(b'next model')
+    assert classifier_version(GROUPS, str(first)) != classifier_version(GROUPS, str(second))
+
+
+def test_fallback_labels_are_persisted_with_flag(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        _record(db, [('code.exe', 'main.py'), ('wechat.exe', '微信'), ('unknown.exe', 'untitled')])
+        cache = ClassificationCache(db.connections, 'v1')
+        cache.put_many([('code.exe', 'main.py', 'coding'), ('wechat.exe', '微信', 'social')])
+        cache.put('unknown.exe', 'untitled', 'other', fallback=True)
+        db.flush()
+        assert cache.get('unknown.exe', 'untitled') == 'other'
+
+        conn = db.connections.reader()
+        assert sorted(conn.execute(
+            "SELECT p.name, cc.fallback FROM classification_cache cc JOIN processes p ON cc.process_id = p.id")) == [
+            ('code.exe', 0), ('unknown.exe', 1), ('wechat.exe', 0)]
+        assert ClassificationCache(db.connections, 'v1').get('unknown.exe', 'untitled') == 'other'
+
+        # 再次保存（例如组合出现在新的进程 ID 下）时保留兜底标记，不在 LRU 中的组合跳过
+        cache.store([('unknown.exe', 'untitled'), ('never.exe', 'seen')])
+        db.flush()
+        assert conn.execute("SELECT COUNT(*) FROM classification_cache WHERE fallback = 1").fetchone()[0] == 1
+    finally:
+        db.close()
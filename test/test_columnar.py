@@ -0,0 +1,154 @@
+"""列式引擎的测试：与 SQL 引擎（汇总表）的结果逐项对比"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from data.columnar import bucket_seconds
+from data.database import ActivityDatabase
+from data.data_analysis import DataAnalyzer
+
+
+def test_bucket_seconds_matches_interval_overlap():
+    rng = random.Random(7)
+    starts = [rng.randrange(0, 1000) for _ in range(200)]
+    ends = [s + rng.randrange(0, 300) for s in starts]
+    boundaries = np.array([0, 100, 250, 251, 600, 1000, 1300], dtype=np.int64)
+
+    expected = [sum(max(0, min(e, hi) - max(s, lo)) for s, e in zip(starts, ends))
+                for lo, hi in zip(boundaries[:-1], boundaries[1:])]
+    result = bucket_seconds(np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), boundaries)
+    assert result.tolist() == expected
+
+
+def test_columnar_engine_matches_sql(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        rng = random.Random(42)
+        t = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0) - timedelta(days=4)
+        for i in range(300):
+            # 时长各不相同，避免排序时出现并列
+            db.switch_session(f'app_{rng.randrange(6)}.exe', f'title {rng.randrange(20)}', switch_time=t)
+            t += timedelta(seconds=rng.randrange(30, 1200) + i)
+        db.stop_current_session(t)
+
+        sql = DataAnalyzer(db.db_path, cache_size=0)
+        columnar = DataAnalyzer(db.db_path, cache_size=0, engine='columnar')
+        assert columnar.engine == 'columnar'
+
+        first = (datetime.now() - timedelta(days=4)).strftime("%Y-%m-%d")
+        last = datetime.now().strftime("%Y-%m-%d")
+        assert columnar.get_summary(first, last) == sql.get_summary(first, last)
+        assert columnar.get_summary(last, last) == sql.get_summary(last, last)
+        assert columnar.get_top_apps(days=4, limit=3) == sql.get_top_apps(days=4, limit=3)
+        assert columnar.get_daily_usage(days=6) == sql.get_daily_usage(days=6)
+        for days_ago in range(5):
+            day = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+            assert columnar.get_hourly_usage(day) == sql.get_hourly_usage(day)
+    finally:
+        db.close()
+
+
+def test_usage_heatmap_matches_sql(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        rng = random.Random(3)
+        t = datetime.now().replace(hour=21, minute=17, second=0, microsecond=0) - timedelta(days=9)
+        for _ in range(200):
+            db.switch_session(f'app_{rng.randrange(4)}.exe', f'title {rng.randrange(5)}', switch_time=t)
+            t += timedelta(seconds=rng.randrange(60, 3600))
+        db.stop_current_session(t)
+
+        def categorize(app, title):
+            return 'work' if app in ('app_0.exe', 'app_1.exe') or title == 'title 0' else 'other'
+
+        sql = DataAnalyzer(db.db_path, cache_size=0, categorize=categorize)
+        columnar = DataAnalyzer(db.db_path, cache_size=0, engine='columnar', categorize=categorize)
+        first = (datetime.now() - timedelta(days=9)).strftime("%Y-%m-%d")
+        last = datetime.now().strftime("%Y-%m-%d")
+
+        for by in ('process', 'category'):
+            heatmap = sql.get_usage_heatmap(first, last, by=by)
+            assert columnar.get_usage_heatmap(first, last, by=by) == heatmap
+            assert len(heatmap['total']) == 7 and all(len(row) == 24 for row in heatmap['total'])
+            # 所有分组相加等于总矩阵，总矩阵相加等于区间总时长
+            assert [[sum(m[d][h] for m in heatmap['groups'].values()) for h in range(24)]
+                    for d in range(7)] == heatmap['total']
+        total_seconds = sum(map(sum, heatmap['total']))
+        assert total_seconds // 60 == sql.get_summary(first, last)['total_minutes']
+
+        with pytest.raises(ValueError):
+            DataAnalyzer(db.db_path, cache_size=0).get_usage_heatmap(first, last, by='category')
+    finally:
+        db.close()
+
+
+def test_timeline_matches_sql_and_downsamples(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        rng = random.Random(11)
+        t = datetime.now().replace(hour=22, minute=3, second=0, microsecond=0) - timedelta(days=3)
+        for _ in range(150):
+            db.switch_session(f'app_{rng.randrange(4)}.exe', f'title {rng.randrange(5)}', switch_time=t)
+            t += timedelta(seconds=rng.randrange(20, 2400))
+        db.stop_current_session(t)
+
+        def categorize(app, title):
+            return 'work' if app == 'app_0.exe' or title == 'title 1' else 'other'
+
+        sql = DataAnalyzer(db.db_path, cache_size=0, categorize=categorize)
+        columnar = DataAnalyzer(db.db_path, cache_size=0, engine='columnar', categorize=categorize)
+        first = (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d")
+        last = datetime.now().strftime("%Y-%m-%d")
+
+        for by in ('process', 'category'):
+            for resolution in (60, 900, 3600):
+                timeline = sql.get_timeline(first, last, resolution, by=by)
+                assert columnar.get_timeline(first, last, resolution, by=by) == timeline
+        # 每个桶的使用秒数之和等于区间总时长
+        active = sum(bucket['active_seconds'] for bucket in timeline['buckets'])
+        assert active // 60 == sql.get_summary(first, last)['total_minutes']
+        assert all(bucket['dominant'] is None or bucket['fractions'][bucket['dominant']] ==
+                   max(bucket['fractions'].values()) for bucket in timeline['buckets'])
+
+        # 4 天按 1 分钟会有 5760 个桶，降采样为 5 分钟（1152 个桶）
+        coarse = sql.get_timeline(first, last, 60)
+        assert coarse['resolution'] == 300 and len(coarse['buckets']) <= 1500
+    finally:
+        db.close()
+
+
+def test_columnar_categories_are_batched_and_follow_classifier_version(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        # 200 个组合各属一个分类，超过 int8 能表示的分类数
+        t = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+        for i in range(200):
+            db.switch_session('app.exe', f'title {i}', switch_time=t + timedelta(minutes=i))
+        db.stop_current_session(t + timedelta(minutes=200))
+
+        calls, version = [], ['v1']
+
+        def categorize_pairs(pairs):
+            calls.append(list(pairs))
+            return [f'{version[0]} {title}' for _, title in pairs]
+
+        da = DataAnalyzer(db.db_path, cache_size=0, engine='columnar', categorize=lambda app, title: 'unused',
+                          categorize_pairs=categorize_pairs, categorize_version=lambda: version[0])
+        day = t.strftime("%Y-%m-%d")
+        usage = da.columnar.category_usage(day, day)
+        assert len(usage) == 200 and set(usage.values()) == {60}
+        assert usage['v1 title 150'] == 60
+        # 所有组合在一次调用中分类，之后不再调用
+        assert len(calls) == 1 and len(calls[0]) == 200
+        da.columnar.category_usage(day, day)
+        assert len(calls) == 1
+
+        # 分类器版本变化后重新分类
+        version[0] = 'v2'
+        usage = da.columnar.category_usage(day, day)
+        assert len(calls) == 2 and 'v2 title 0' in usage and 'v1 title 0' not in usage
+    finally:
+        db.close()
@@ -50,9 +50,10 @@ def test_datastore():
     # 示例2：查询最近的窗口会话
     print("\n=== Recent Window Sessions ===")
     cursor.execute('''
-                    SELECT ws.id, p.name, ws.window_title, ws.start_time, ws.duration_seconds
+                    SELECT ws.id, p.name, t.title, ws.start_time, ws.duration_seconds
                     FROM window_sessions ws
                             JOIN processes p ON ws.process_id = p.id
+                            JOIN titles t ON ws.title_id = t.id
                     ORDER BY ws.start_time DESC LIMIT 5
                    ''')
     for row in cursor.fetchall():
@@ -62,58 +63,43 @@ def test_datastore():
     conn.close()
 
 
-def test_data_analysis():
-    db = ActivityDatabase()
-    da = DataAnalyzer()
-
-    print("=== 直接插入测试数据 ===")
-
-    with sqlite3.connect(db.db_path) as conn:
-        cursor = conn.cursor()
-
-        # 1. 先插入进程数据
-        processes_data = [
-            ("chrome.exe", "C:\\chrome.exe"),
-            ("code.exe", "C:\\code.exe"),
-            ("notepad.exe", "C:\\notepad.exe"),
-            ("wechat.exe", "C:\\wechat.exe")
-        ]
-
-        process_ids = {}
-        for name, path in processes_data:
-            cursor.execute('INSERT OR IGNORE INTO processes (name, executable_path) VALUES (?, ?)', (name, path))
-            cursor.execute('SELECT id FROM processes WHERE name = ? AND executable_path = ?', (name, path))
-            process_id = cursor.fetchone()[0]
-            process_ids[name] = process_id
-            print(f"插入进程: {name} (ID: {process_id})")
-
-        # 2. 插入窗口会话数据（模拟今天的使用记录）
-        import datetime
-        now = datetime.datetime.now()
-
-        sessions_data = [
-            (process_ids["chrome.exe"], "GitHub主页", now - datetime.timedelta(hours=3), 3600),  # 1小时前，用了1小时
-            (process_ids["code.exe"], "main.py", now - datetime.timedelta(hours=2), 1800),  # 2小时前，用了30分钟
-            (process_ids["chrome.exe"], "Stack Overflow", now - datetime.timedelta(hours=1), 1200),  # 1小时前，用了20分钟
-            (process_ids["notepad.exe"], "notes.txt", now - datetime.timedelta(minutes=30), 600),  # 30分钟前，用了10分钟
-            (process_ids["wechat.exe"], "微信聊天", now - datetime.timedelta(minutes=15), 300),  # 15分钟前，用了5分钟
-        ]
-
-        for process_id, title, start_time, duration in sessions_data:
-            cursor.execute('''
-                            INSERT INTO window_sessions (process_id, window_title, start_time, end_time, duration_seconds)
-                            VALUES (?, ?, ?, ?, ?)
-                            ''',
-                            (process_id, title, start_time, start_time + datetime.timedelta(seconds=duration), duration))
-            print(f"插入会话: {title} ({duration}秒)")
-
-        conn.commit()
-
-    print("✅ 测试数据插入完成\n")
+def test_data_analysis(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    da = DataAnalyzer(db.db_path, cache_size=0)
+
+    print("=== 通过 ActivityDatabase 写入测试数据 ===")
+
+    # 经由 switch_session / stop_current_session 写入，日/小时汇总随会话一起更新
+    import datetime
+    base = datetime.datetime.combine(datetime.date.today(), datetime.time(9, 0))
+
+    sessions_data = [
+        ("chrome.exe", "C:\\chrome.exe", "GitHub主页", base, 3600),  # 9:00 开始，用了1小时
+        ("code.exe", "C:\\code.exe", "main.py", base + datetime.timedelta(hours=1), 1800),  # 用了30分钟
+        ("chrome.exe", "C:\\chrome.exe", "Stack Overflow", base + datetime.timedelta(hours=2), 1200),  # 用了20分钟
+        ("notepad.exe", "C:\\notepad.exe", "notes.txt", base + datetime.timedelta(hours=3), 600),  # 用了10分钟
+        ("wechat.exe", "C:\\wechat.exe", "微信聊天", base + datetime.timedelta(hours=4), 300),  # 用了5分钟
+    ]
+
+    for name, path, title, start_time, duration in sessions_data:
+        db.switch_session(name, title, path, switch_time=start_time)
+        db.stop_current_session(start_time + datetime.timedelta(seconds=duration))
+        print(f"写入会话: {title} ({duration}秒)")
+    db.flush()
+
+    print("✅ 测试数据写入完成\n")
 
     # 分析数据
     print("=== 数据分析结果 ===")
     result = da.get_today_summary()
-
-    v = Visualize()
-    v.visualize_daily(result)
+    try:
+        assert (result['total_seconds'], result['session_count']) == (7500, 5)
+        assert [(app['name'], app['seconds'], app['session_count']) for app in result['app_usage']] == [
+            ('chrome.exe', 4800, 2), ('code.exe', 1800, 1), ('notepad.exe', 600, 1), ('wechat.exe', 300, 1)]
+        assert (result['first_activity'], result['last_activity']) == (
+            base.strftime("%Y-%m-%d %H:%M:%S"), (base + datetime.timedelta(hours=4, minutes=5)).strftime("%Y-%m-%d %H:%M:%S"))
+
+        v = Visualize()
+        v.visualize_daily(result)
+    finally:
+        db.close()
@@ -0,0 +1,42 @@
+"""关键词自动机的测试：结果必须与按分类顺序逐个查找一致"""
+import random
+
+from data.keyword_matcher import KeywordMatcher, naive_match
+
+GROUPS = [
+    ('documentation', ['excel', 'word', '飞书', 'notion', 'confluence']),
+    ('coding', ['code', 'visual studio', 'github', 'gitlab']),
+    ('learning', ['python', 'github pages', 'tutorial', '学习', '文档']),
+    ('social', ['wechat', 'qq', 'QQ', 'teams', 'meeting', '微信']),
+    ('entertainment', ['game', 'steam', 'lol', 'cod', 'mod', 'ori', 'dota', 'dota2', '原神']),
+    ('system', ['explorer', 'windows', 'settings', 'cmd', '资源管理器']),
+]
+
+
+def test_priority_follows_category_order():
+    matcher = KeywordMatcher(GROUPS)
+    # 'github pages' 同时包含 coding 的 'github'，coding 在前
+    assert matcher.match('chrome.exe GitHub Pages - tutorial') == 'coding'
+    # 'Decoder' 包含 'cod'（entertainment）和 'code'（coding）
+    assert matcher.match('Decoder settings') == 'coding'
+    assert matcher.match('explorer.exe 资源管理器') == 'system'
+    assert matcher.match('WeChat.exe 微信') == 'social'
+    assert matcher.match('notepad.exe untitled') is None
+    assert KeywordMatcher([('a', ['']), ('b', ['x'])]).match('') == 'a'
+
+
+def test_matches_naive_search_on_random_titles():
+    rng = random.Random(0)
+    keywords = [k for _, ks in GROUPS for k in ks]
+    alphabet = 'abcdeghilmnoqrstuwxy 微信学习原神文档-.'
+    matcher = KeywordMatcher(GROUPS)
+    for _ in range(3000):
+        parts = [''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 8)))]
+        for _ in range(rng.randrange(0, 3)):
+            keyword = rng.choice(keywords)
+            # 随机大小写、截断，制造部分匹配和重叠
+            keyword = ''.join(c.upper() if rng.random() < 0.3 else c for c in keyword)
+            parts.append(keyword[:rng.randrange(1, len(keyword) + 1)])
+            parts.append(''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 4))))
+        text = ''.join(parts)
+        assert matcher.match(text) == naive_match(GROUPS, text), text
@@ -0,0 +1,97 @@
+"""DataAnalyzer 查询结果缓存的测试"""
+from datetime import datetime, timedelta
+
+from data.database import ActivityDatabase
+from data.data_analysis import DataAnalyzer
+
+
+def test_repeated_queries_hit_cache_until_data_changes(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        t0 = datetime(2026, 1, 5, 9, 0, 0)
+        db.switch_session('code.exe', 'main.py', switch_time=t0)
+        db.switch_session('chrome.exe', 'docs', switch_time=t0 + timedelta(minutes=30))
+        db.flush()
+
+        da = DataAnalyzer(db.db_path)
+        first = da.get_usage_between('2026-01-05', '2026-01-05')
+        # 位置参数与关键字参数规范化为同一个键；返回副本，修改结果不影响缓存
+        first.append({'name': 'bogus'})
+        assert da.get_usage_between(start_date='2026-01-05', end_date='2026-01-05') == first[:-1]
+        assert da.cache.stats()['hits'] == 1 and da.cache.stats()['misses'] == 1
+
+        # 有写入提交后重新查询
+        db.switch_session('code.exe', 'main.py', switch_time=t0 + timedelta(minutes=45))
+        db.flush()
+        usage = {item['name']: item['minutes'] for item in da.get_usage_between('2026-01-05', '2026-01-05')}
+        assert usage == {'code.exe': 30, 'chrome.exe': 15}
+        assert da.cache.misses == 2
+    finally:
+        db.close()
+
+
+def test_cache_sees_writes_from_other_connections(tmp_path):
+    import sqlite3
+
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        db.switch_session('code.exe', 'main.py', switch_time=datetime(2026, 1, 5, 9, 0, 0))
+        db.stop_current_session(datetime(2026, 1, 5, 10, 0, 0))
+
+        da = DataAnalyzer(db.db_path)
+        assert da.get_daily_usage(days=3650)[0]['total_minutes'] == 60
+
+        # 其他进程直接修改数据库：write_seq 不变，但 data_version 会变化
+        other = sqlite3.connect(db.db_path)
+        other.execute("UPDATE daily_usage SET seconds = 7200")
+        other.commit()
+        other.close()
+        assert da.get_daily_usage(days=3650)[0]['total_minutes'] == 120
+        assert da.cache.hits == 0
+    finally:
+        db.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        da = DataAnalyzer(db.db_path, cache_size=2)
+        da.get_hourly_usage('2026-01-01')
+        da.get_hourly_usage('2026-01-02')
+        da.get_hourly_usage('2026-01-01')
+        da.get_hourly_usage('2026-01-03')  # 淘汰 01-02
+        da.get_hourly_usage('2026-01-01')
+        da.get_hourly_usage('2026-01-02')
+        assert da.cache.stats() == {'hits': 2, 'misses': 4, 'size': 2, 'maxsize': 2}
+
+        assert DataAnalyzer(db.db_path, cache_size=0).cache is None
+    finally:
+        db.close()
+
+
+def test_heartbeats_do_not_invalidate_cache(tmp_path, monkeypatch):
+    import data.database as database
+
+    monkeypatch.setattr(database, 'HEARTBEAT_INTERVAL', 0)
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        t0 = datetime(2026, 1, 5, 9, 0, 0)
+        db.switch_session('code.exe', 'main.py', switch_time=t0)
+        db.switch_session('chrome.exe', 'docs', switch_time=t0 + timedelta(minutes=30))
+        db.flush()
+
+        da = DataAnalyzer(db.db_path)
+        first = da.get_usage_between('2026-01-05', '2026-01-05')
+        for minutes in (31, 32, 33):
+            assert db.heartbeat(t0 + timedelta(minutes=minutes))
+            db.flush()
+            assert da.get_usage_between('2026-01-05', '2026-01-05') == first
+        assert da.cache.misses == 1 and da.cache.hits == 3
+
+        # 窗口切换仍然使缓存失效
+        db.switch_session('code.exe', 'main.py', switch_time=t0 + timedelta(minutes=45))
+        db.flush()
+        da.get_usage_between('2026-01-05', '2026-01-05')
+        assert da.cache.misses == 2
+    finally:
+        db.close()
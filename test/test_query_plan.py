@@ -0,0 +1,95 @@
+"""
+查询计划回归测试：DataAnalyzer 的查询必须走索引，不能退化为全表扫描；聚合查询只读日用量汇总，
+按分类汇总时与 classification_cache 按整数主键关联
+通过 trace 回调记录分析器实际执行的 SQL，再对每条语句执行 EXPLAIN QUERY PLAN
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from data.database import ActivityDatabase
+from data.data_analysis import DataAnalyzer
+from data.session_categories import category_usage, top_apps_by_category
+
+
+@pytest.fixture
+def analyzer(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    t0 = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    for i in range(20):
+        db.switch_session(f'app_{i % 4}.exe', f'title {i}', switch_time=t0 + timedelta(minutes=i))
+    db.stop_current_session(t0 + timedelta(minutes=30))
+
+    da = DataAnalyzer(db.db_path)
+    yield da
+    db.close()
+
+
+def _query_plans(da, call):
+    """执行 call(da)，返回其中每条 SELECT 语句的 (sql, 查询计划明细列表)"""
+    conn = da.connections.reader()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call(da)
+    finally:
+        conn.set_trace_callback(None)
+
+    plans = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+        plans.append((sql, [row[-1] for row in rows]))
+    return plans
+
+
+@pytest.mark.parametrize('call', [
+    lambda da: da.get_today_summary(),
+    lambda da: da.get_usage_between('2026-01-01', '2026-01-31'),
+    lambda da: da.get_top_apps(days=7),
+    lambda da: da.get_daily_usage(days=7),
+    lambda da: da.get_today_activities(),
+    lambda da: da.get_hourly_usage('2026-01-05'),
+], ids=['today_summary', 'usage_between', 'top_apps', 'daily_usage', 'today_activities', 'hourly_usage'])
+def test_analyzer_queries_do_not_scan_sessions(analyzer, call):
+    plans = _query_plans(analyzer, call)
+    assert plans
+    for sql, details in plans:
+        for detail in details:
+            assert not detail.startswith('SCAN window_sessions'), (sql, details)
+            if 'window_sessions' in detail:
+                assert 'INDEX' in detail, (sql, details)
+
+
+@pytest.mark.parametrize('call', [
+    lambda da: da.get_today_summary(),
+    lambda da: da.get_usage_between('2026-01-01', '2026-01-31'),
+    lambda da: da.get_top_apps(days=7),
+    lambda da: da.get_daily_usage(days=7),
+], ids=['today_summary', 'usage_between', 'top_apps', 'daily_usage'])
+def test_aggregations_read_daily_rollup(analyzer, call):
+    for sql, details in _query_plans(analyzer, call):
+        if 'daily_usage' not in sql:
+            continue  # 只查询归档登记表（每月一行）的语句
+        details = [d for d in details if 'archived_months' not in d]
+        # 会话表只允许用于在时间戳索引上定位首/末会话
+        session_steps = [d for d in details if 'window_sessions' in d]
+        assert all('COVERING INDEX' in d for d in session_steps), (sql, details)
+        rollup_steps = [d for d in details if 'daily_usage' in d]
+        assert rollup_steps and all('PRIMARY KEY' in d for d in rollup_steps), (sql, details)
+
+
+@pytest.mark.parametrize('call', [
+    lambda da: category_usage(da.connections.reader(), 'v1', '2026-01-01', '2026-12-31'),
+    lambda da: top_apps_by_category(da.connections.reader(), 'v1', '2026-01-01', '2026-12-31', 10),
+], ids=['category_usage', 'top_apps_by_category'])
+def test_category_queries_join_on_integer_keys(analyzer, call):
+    # 日用量汇总沿 day 主键范围扫描，classification_cache 和进程名/标题都按整数主键逐行查找
+    [(sql, details)] = _query_plans(analyzer, call)
+    assert 'SEARCH u USING PRIMARY KEY (day>? AND day<?)' in details, (sql, details)
+    assert 'SEARCH cc USING PRIMARY KEY (version=? AND process_id=? AND title_id=?) LEFT-JOIN' in details, (sql, details)
+    for detail in details:
+        assert not detail.startswith('SCAN'), (sql, details)
+        if detail.startswith(('SEARCH p ', 'SEARCH t ')):
+            assert 'INTEGER PRIMARY KEY' in detail, (sql, details)
@@ -0,0 +1,186 @@
+"""会话分类（后台分类线程 + 按分类汇总）的测试"""
+import threading
+from datetime import datetime, timedelta
+
+from data.classification_cache import ClassificationCache
+from data.database import ActivityDatabase
+from data.session_categories import CategoryWorker, category_usage, missing_pairs, top_apps_by_category
+
+RULES = {'code.exe': 'coding', 'wechat.exe': 'social'}
+
+
+class _Classifier:
+    """按进程名分类，所有组合的结果经 ClassificationCache 保存；记录真正分类（缓存未命中）的组合和所在线程"""
+
+    def __init__(self, connections, rules, version='v1'):
+        self.rules = rules
+        self.cache = ClassificationCache(connections, version)
+        self.calls = []
+        self.threads = set()
+
+    def version(self):
+        return self.cache.version
+
+    def __call__(self, pairs):
+        self.threads.add(threading.current_thread().name)
+        labels = {pair: self.cache.get(*pair) for pair in dict.fromkeys(pairs)}
+        misses = [pair for pair, label in labels.items() if label is None]
+        self.calls.extend(misses)
+        labels.update({(app, title): self.rules.get(app, 'other') for app, title in misses})
+        self.cache.put_many([(app, title, label) for (app, title), label in labels.items()])
+        return [labels[pair] for pair in pairs]
+
+
+def _record(db):
+    db.switch_session('code.exe', 'main.py', switch_time=datetime(2026, 3, 2, 9, 0, 0))
+    db.switch_session('wechat.exe', '微信', switch_time=datetime(2026, 3, 2, 9, 30, 0))
+    db.switch_session('code.exe', 'main.py', switch_time=datetime(2026, 3, 2, 9, 40, 0))
+    # 跨过午夜的会话
+    db.switch_session('chrome.exe', 'news', switch_time=datetime(2026, 3, 2, 23, 30, 0))
+    db.stop_current_session(datetime(2026, 3, 3, 0, 30, 0))
+
+
+def _labels(db, version='v1'):
+    return sorted(db.connections.reader().execute('''
+        SELECT p.name, t.title, cc.category
+        FROM classification_cache cc
+                 JOIN processes p ON cc.process_id = p.id
+                 JOIN titles t ON cc.title_id = t.id
+        WHERE cc.version = ?
+    ''', (version,)))
+
+
+def test_worker_backfills_and_follows_new_sessions(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        _record(db)
+        db.flush()
+        classify = _Classifier(db.connections, RULES)
+        worker = CategoryWorker(db.connections, classify, classify.version, batch_size=2)
+
+        # 每个 (进程, 标题) 组合只分类一次，结果只保存在 classification_cache 中
+        assert worker.backfill() == 3
+        assert sorted(classify.calls) == [('chrome.exe', 'news'), ('code.exe', 'main.py'), ('wechat.exe', '微信')]
+        assert _labels(db) == [('chrome.exe', 'news', 'other'), ('code.exe', 'main.py', 'coding'),
+                               ('wechat.exe', '微信', 'social')]
+        assert worker.backfill() == 0
+
+        # 新会话：已经保存分类的组合跳过，新组合在开始时就分类
+        db.switch_session('code.exe', 'main.py', switch_time=datetime(2026, 3, 3, 8, 0, 0))
+        db.switch_session('code.exe', 'test.py', switch_time=datetime(2026, 3, 3, 8, 30, 0))
+        db.flush()
+        assert worker.step() is True
+        assert worker.step() is False
+        assert classify.calls[3:] == [('code.exe', 'test.py')]
+
+        # 分类器版本变化后旧结果不再被关联，backfill 按新版本重新分类
+        classify.cache.set_version('v2')
+        classify.rules = {'chrome.exe': 'learning'}
+        # 还没有结束的会话不在日用量汇总中，由 step 跟进
+        assert worker.backfill() == 3
+        assert ('chrome.exe', 'news', 'learning') in _labels(db, 'v2')
+        assert sorted(category_usage(db.connections.reader(), 'v2', '2026-03-02', '2026-03-03'))[0][0] == 'learning'
+    finally:
+        db.close()
+
+
+def test_worker_thread_classifies_in_background(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    classify = _Classifier(db.connections, RULES)
+    worker = CategoryWorker(db.connections, classify, classify.version, interval=0.05)
+    try:
+        worker.start()
+        db.switch_session('wechat.exe', '微信', switch_time=datetime(2026, 3, 2, 9, 0, 0))
+        db.flush()
+        for _ in range(100):
+            if _labels(db):
+                break
+            worker._stopped.wait(0.05)
+        assert _labels(db) == [('wechat.exe', '微信', 'social')]
+
+        # 统计前补齐范围内的分类也在后台线程中执行，返回时结果已经提交
+        db.switch_session('code.exe', 'main.py', switch_time=datetime(2026, 3, 2, 9, 30, 0))
+        db.stop_current_session(datetime(2026, 3, 2, 10, 0, 0))
+        worker.categorize_range('2026-03-02', '2026-03-03')
+        assert missing_pairs(db.connections.reader(), 'v1', '2026-03-02', '2026-03-03') == []
+        assert classify.threads == {'category-worker'}
+    finally:
+        worker.stop(timeout=2)
+        db.close()
+
+
+def test_category_usage_groups_rollups(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        _record(db)
+        db.flush()
+        conn = db.connections.reader()
+        classify = _Classifier(db.connections, RULES)
+        # 还没有分类的组合计入 'other'
+        assert category_usage(conn, 'v1', '2026-03-02', '2026-03-03') == [('other', 1800 + 600 + 49800 + 1800, 4)]
+        worker = CategoryWorker(db.connections, classify, classify.version)
+        assert worker.categorize_range('2026-03-02', '2026-03-03') == 3
+        assert missing_pairs(conn, 'v1', '2026-03-02', '2026-03-04') == []
+
+        # 跨过午夜的会话只计算范围内的部分，会话数计入开始日期
+        assert sorted(category_usage(conn, 'v1', '2026-03-02', '2026-03-03')) == [
+            ('coding', 1800 + 13 * 3600 + 50 * 60, 2), ('other', 1800, 1), ('social', 600, 1)]
+        assert sorted(category_usage(conn, 'v1', '2026-03-03', '2026-03-04')) == [('other', 1800, 0)]
+        assert top_apps_by_category(conn, 'v1', '2026-03-02', '2026-03-04', 10)['other'] == [
+            ('chrome.exe', 'news', 3600, 1)]
+    finally:
+        db.close()
+
+
+def test_top_apps_by_category_is_exact_per_category(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        # 'other' 中的应用时长都排在全局前 N 之后，按分类取前 N 时仍然完整
+        t = datetime(2026, 3, 2, 8, 0, 0)
+        plan = [('code.exe', f'file {i}', 3600 + i * 60) for i in range(5)]
+        plan += [('notepad.exe', f'note {i}', 60 * (i + 1)) for i in range(4)]
+        plan += [('notepad.exe', 'tie b', 120), ('notepad.exe', 'tie a', 120)]
+        for app, title, seconds in plan:
+            db.switch_session(app, title, switch_time=t)
+            t += timedelta(seconds=seconds)
+        db.stop_current_session(t)
+        db.flush()
+
+        classify = _Classifier(db.connections, RULES)
+        CategoryWorker(db.connections, classify, classify.version).backfill()
+        conn = db.connections.reader()
+        top = top_apps_by_category(conn, 'v1', '2026-03-02', '2026-03-03', 3)
+        assert sorted(top) == ['coding', 'other']
+        assert [title for _, title, _, _ in top['coding']] == ['file 4', 'file 3', 'file 2']
+        # 时长相同时按标题升序
+        assert top['other'] == [('notepad.exe', 'note 3', 240, 1), ('notepad.exe', 'note 2', 180, 1),
+                                ('notepad.exe', 'note 1', 120, 1)]
+        top = top_apps_by_category(conn, 'v1', '2026-03-02', '2026-03-03', 5)
+        assert [title for _, title, _, _ in top['other']] == ['note 3', 'note 2', 'note 1', 'tie a', 'tie b']
+        top = top_apps_by_category(conn, 'v1', '2026-03-02', '2026-03-03', 0)
+        assert top == {'coding': [], 'other': []}
+    finally:
+        db.close()
+
+
+def test_labels_cover_every_process_id_with_the_same_name(tmp_path):
+    db = ActivityDatabase(str(tmp_path / "activity.db"))
+    try:
+        db.switch_session('code.exe', 'main.py', r'C:\a\code.exe', datetime(2026, 3, 2, 9, 0, 0))
+        db.stop_current_session(datetime(2026, 3, 2, 10, 0, 0))
+        db.flush()
+        classify = _Classifier(db.connections, RULES)
+        worker = CategoryWorker(db.connections, classify, classify.version)
+        assert worker.backfill() == 1
+
+        # 同名进程的另一个可执行文件：分类由缓存给出，但仍按新的 process_id 保存
+        db.switch_session('code.exe', 'main.py', r'D:\b\code.exe', datetime(2026, 3, 2, 11, 0, 0))
+        db.stop_current_session(datetime(2026, 3, 2, 11, 30, 0))
+        db.flush()
+        assert missing_pairs(db.connections.reader(), 'v1') == [('code.exe', 'main.py')]
+        assert worker.backfill() == 1
+        assert classify.calls == [('code.exe', 'main.py')]
+        assert missing_pairs(db.connections.reader(), 'v1') == []
+        assert category_usage(db.connections.reader(), 'v1', '2026-03-02', '2026-03-03') == [('coding', 5400, 2)]
+    finally:
+        db.close()
@@ -5,6 +5,12 @@ train_classifier.get_txt_from_db
 """
 import sqlite3
 import os
+import sys
+
+# 从仓库根目录运行（python train_classifier/get_txt_from_db.py）时也能导入 data 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.data_analysis import DataAnalyzer
 
 
 def check_database_tables(db_path):
@@ -52,32 +58,22 @@ def export_to_txt(db_path, output_file="output.txt"):
             print("❌ 数据库为空，请先运行主程序收集数据")
             return False
         
-        # 连接数据库
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # SQL查询：获取进程名和窗口标题
-        cursor.execute('''
-            SELECT p.name, ws.window_title
-            FROM window_sessions ws
-            JOIN processes p ON ws.process_id = p.id
-            ORDER BY ws.start_time
-        ''')
+        # 逐条读取会话（包括已归档月份中的会话），导出大数据库时内存占用保持不变
+        analyzer = DataAnalyzer(db_path, cache_size=0)
+        count = 0
+        try:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                for record in analyzer.iter_sessions(columns=('process', 'window_title')):
+                    f.write(f"{record.process} | {record.window_title}\n")
+                    count += 1
+        finally:
+            analyzer.connections.close()
         
-        # 获取所有数据
-        rows = cursor.fetchall()
-        conn.close()
-        
-        if not rows:
+        if not count:
             print("⚠️ 数据库中没有数据")
             return False
         
-        # 写入txt文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for process_name, window_title in rows:
-                f.write(f"{process_name} | {window_title}\n")
-        
-        print(f"✅ 导出成功！共{len(rows)}条记录")
+        print(f"✅ 导出成功！共{count}条记录")
         print(f"保存到: {output_file}")
         return True
         